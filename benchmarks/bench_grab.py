@@ -0,0 +1,219 @@
+"""
+Benchmark of the grab pipeline against the `simulated` backend, runnable on any platform.
+
+A mouse-event trace (generated, or loaded with `--trace`) is replayed through the low-level hook procedure and the
+message loop of real `wingrab.grab()` calls, and the following figures are reported:
+
+- `grab`: the click-to-result latency (from the release of the button to the return of `grab()`), the CPU seconds per
+  grab (of the whole process, the replaying thread included) and the wake-ups of the message loop per grab.  With
+  `--idle`, the replayer waits before clicking, so a busy loop shows up in the CPU time.
+- `hook`: the duration of the hook procedure and the memory blocks it leaves allocated per event, measured by calling
+  `_LLMouseProc` directly.
+- `import`: the time taken by `import wingrab`, see `bench_import.py`.
+
+A trace file is either a binary trace recorded with `wingrab.grab(record=PATH)` (see `wingrab.recorder`) or a JSON list
+of `[wParam, x, y, mouseData]` events; the grab ends at the first `WM_LBUTTONUP`, a click is appended if the trace has
+none.
+
+Usage: python benchmarks/bench_grab.py [--grabs N] [--moves N] [--trace PATH] [--idle SECONDS] [--import-runs N] [--json]
+"""
+import argparse
+import ctypes
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import bench_import  # noqa: E402
+
+from wingrab import recorder, wingrab  # noqa: E402
+from wingrab.backends import set_backend  # noqa: E402
+from wingrab.backends.simulated import SimulatedBackend  # noqa: E402
+from wingrab.winuser import (HC_ACTION, MSLLHOOKSTRUCT, WM_MOUSEMOVE, WM_LBUTTONDOWN, WM_LBUTTONUP,  # noqa: E402
+                             WM_MOUSEWHEEL)
+
+SCREEN = (1920, 1080)
+
+
+def generate_trace(moves, seed=0):
+    """ A random walk of `moves` mouse moves over the screen, ended by a left click. """
+    rng = random.Random(seed)
+    x, y = SCREEN[0] // 2, SCREEN[1] // 2
+    trace = []
+    for _ in range(moves):
+        x = min(SCREEN[0] - 1, max(0, x + rng.randint(-20, 20)))
+        y = min(SCREEN[1] - 1, max(0, y + rng.randint(-20, 20)))
+        trace.append((WM_MOUSEMOVE, x, y, 0))
+    trace.append((WM_LBUTTONDOWN, x, y, 0))
+    trace.append((WM_LBUTTONUP, x, y, 0))
+    return trace
+
+
+def load_trace(path):
+    with open(path, 'rb') as f:
+        is_binary = f.read(len(recorder.MAGIC)) == recorder.MAGIC
+    if is_binary:
+        trace = [(r.wParam, r.info.pt.x, r.info.pt.y, r.info.mouseData) for r in recorder.read_trace(path)]
+    else:
+        with open(path) as f:
+            trace = [tuple(event) for event in json.load(f)]
+    if not any(event[0] == WM_LBUTTONUP for event in trace):
+        x, y = trace[-1][1:3] if trace else (0, 0)
+        trace += [(WM_LBUTTONDOWN, x, y, 0), (WM_LBUTTONUP, x, y, 0)]
+    return trace
+
+
+def create_desktop(columns=8, rows=6):
+    """ A simulated desktop tiled with `columns` x `rows` windows, each one with a child window. """
+    desktop = SimulatedBackend()
+    width, height = SCREEN[0] // columns, SCREEN[1] // rows
+    pid = 1000
+    for row in range(rows):
+        for column in range(columns):
+            left, top = column * width, row * height
+            window = desktop.create_window((left, top, left + width, top + height), pid, title=f'Window {pid}')
+            desktop.create_window((left + 10, top + 30, left + width - 10, top + height - 10), pid, parent=window)
+            pid += 4
+    return desktop
+
+
+def _replay(desktop, trace, idle, clicks):
+    """ Send `trace` to the hook once installed, append the perf_counter() of the click to `clicks`. """
+    desktop.wait_for_hook()
+    if idle:
+        time.sleep(idle)
+    for wParam, x, y, mouse_data in trace:
+        if wParam == WM_LBUTTONUP:
+            clicks.append(time.perf_counter())
+            desktop.release()
+            return
+        if wParam == WM_MOUSEMOVE:
+            desktop.move_to(x, y)
+        elif wParam == WM_LBUTTONDOWN:
+            desktop.move_to(x, y)
+            desktop.press()
+        elif wParam == WM_MOUSEWHEEL:
+            desktop.scroll(ctypes.c_short(mouse_data >> 16).value)
+
+
+def bench_grabs(trace, grabs, idle=0.0):
+    desktop = create_desktop()
+    set_backend(desktop)
+    latencies = []
+    wakeups = []
+    clicks = []
+    wingrab.hook_latency.reset()
+
+    cpu_started = time.process_time()
+    for _ in range(grabs):
+        thread = threading.Thread(target=_replay, args=(desktop, trace, idle, clicks))
+        thread.start()
+        pid = wingrab.grab()
+        done = time.perf_counter()
+        thread.join()
+        if pid <= 0:
+            raise RuntimeError(f'Unexpected grab result: {pid}')
+        latencies.append(done - clicks[-1])
+
+        queue = desktop.create_message_queue()
+        wakeups.append(queue.wait_count)
+        queue.wait_count = 0
+    cpu = time.process_time() - cpu_started
+    set_backend(None)
+
+    hook = wingrab.hook_latency.percentiles()
+    return {
+        'grabs': grabs,
+        'events_per_grab': len(trace),
+        'idle_s': idle,
+        'latency_ms': {
+            'median': statistics.median(latencies) * 1000,
+            'max': max(latencies) * 1000,
+        },
+        'cpu_s_per_grab': cpu / grabs,
+        'loop_wakeups_per_grab': statistics.mean(wakeups),
+        'hook_us': {key: value * 1e6 for key, value in hook.items() if key != 'count'},
+    }
+
+
+def bench_hook(events):
+    """ Call the hook procedure directly, with a session which does not swallow the events. """
+    desktop = create_desktop()
+    info = MSLLHOOKSTRUCT()
+    info.pt.x, info.pt.y = 100, 100
+    address = ctypes.addressof(info)
+    proc = wingrab._LLMouseProc
+
+    wingrab._active_session = wingrab._HookSession(backend=desktop)
+    try:
+        # Warm up the code paths and the caches first.
+        for _ in range(1000):
+            proc(HC_ACTION, WM_MOUSEMOVE, address)
+
+        blocks = sys.getallocatedblocks()
+        started = time.perf_counter()
+        for _ in range(events):
+            proc(HC_ACTION, WM_MOUSEMOVE, address)
+        elapsed = time.perf_counter() - started
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        wingrab._active_session = None
+
+    return {
+        'events': events,
+        'call_us': elapsed / events * 1e6,
+        'allocated_blocks_per_event': blocks / events,
+    }
+
+
+def run(grabs=50, moves=200, trace_path=None, idle=0.0, import_runs=10):
+    """ Run the benchmark, return a dict scenario -> result (or error message). """
+    trace = load_trace(trace_path) if trace_path else generate_trace(moves)
+    results = {
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'grab': bench_grabs(trace, grabs, idle),
+        'hook': bench_hook(max(1000, grabs * len(trace))),
+    }
+    if import_runs:
+        results['import'] = bench_import.run(import_runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grabs', type=int, default=50)
+    parser.add_argument('--moves', type=int, default=200, help='mouse moves of the generated trace')
+    parser.add_argument('--trace', metavar='PATH', help='replay a trace file instead of a generated trace')
+    parser.add_argument('--idle', type=float, default=0.0, help='seconds to wait before replaying each trace')
+    parser.add_argument('--import-runs', type=int, default=10, help='0 to skip the import benchmark')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.grabs, args.moves, args.trace, args.idle, args.import_runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    grab, hook = results['grab'], results['hook']
+    print(f'grab   : latency median {grab["latency_ms"]["median"]:.3f} ms (max {grab["latency_ms"]["max"]:.3f} ms), '
+          f'{grab["cpu_s_per_grab"] * 1000:.2f} ms CPU and {grab["loop_wakeups_per_grab"]:.1f} loop wake-ups per grab '
+          f'({grab["grabs"]} grabs of {grab["events_per_grab"]} events)')
+    print(f'hook   : {hook["call_us"]:.2f} us per call in isolation, p50 {grab["hook_us"]["p50"]:.2f} us / '
+          f'p99 {grab["hook_us"]["p99"]:.2f} us in the grabs, '
+          f'{hook["allocated_blocks_per_event"]:.4f} blocks left allocated per event')
+    for name, summary in results.get('import', {}).items():
+        if 'error' in summary:
+            print(f'{name:7s}: {summary["error"]}')
+        else:
+            print(f'{name:7s}: median {summary["median_ms"]:.2f} ms ({summary["runs"]} runs)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Allocation benchmark of the low-level mouse hook procedure, runnable on any platform.
+
+The hook procedure runs on the thread of the hook for every mouse event of the whole desktop, so each object it
+allocates is paid for on every mouse move.  This benchmark calls `wingrab._LLMouseProc` directly with a grab session
+against the `simulated` backend, next to a reference procedure doing what the hook of wingrab 0.x did per event
+(casting `lParam` to read the `MSLLHOOKSTRUCT`, allocating a `POINT` and calling `GetCursorPos` on the click, looking up
+the current thread for its id, reading the PID into a `c_int`), and reports for the mouse moves and for the clicks:
+
+- `call_us`: the duration of one call.
+- `peak_bytes`: the largest memory allocated during one call, freed or not, traced by `tracemalloc`.
+- `blocks_per_event`: the memory blocks left allocated per call, from `sys.getallocatedblocks()`, with the garbage
+  collector disabled.
+
+The hook of wingrab is not free of allocations, only of the ctypes objects created per event.  `sources` reports the
+peak memory allocated by each of the operations still allocating, called alone:
+
+- `perf_counter`: the floats of the two `perf_counter()` calls timing the procedure, and of their difference.
+- `latency_record`: `hook_latency.record()`, whose sample counter allocates an int once past the small int cache.
+- `ring_push`: `EventRing.push()` on the observed events (the clicks), for the arguments of its `memmove()` call
+  converted by ctypes, the address it returns and the int of its position counter.
+
+All of them are freed before the procedure returns, which is why `blocks_per_event` stays at 0.
+
+Usage: python benchmarks/bench_hook.py [--events N] [--json]
+"""
+import argparse
+import ctypes
+import gc
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from ctypes import POINTER, c_int, cast
+from ctypes.wintypes import POINT
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from wingrab import wingrab  # noqa: E402
+from wingrab.backends.simulated import SimulatedBackend  # noqa: E402
+from wingrab.winuser import HC_ACTION, MSLLHOOKSTRUCT, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_MOUSEMOVE  # noqa: E402
+
+
+def make_reference_hook(backend):
+    """ A hook procedure allocating per event like the hook of wingrab 0.x did, the results being thrown away. """
+
+    def reference_hook(nCode, wParam, lParam):
+        if nCode == HC_ACTION:
+            msg = cast(lParam, POINTER(MSLLHOOKSTRUCT))[0]
+            if wParam == WM_LBUTTONDOWN:
+                return 1
+            elif wParam == WM_LBUTTONUP:
+                point = POINT(*backend.get_cursor_pos())
+                hwnd = backend.window_from_point(point.x, point.y)
+                pid = c_int(backend.get_window_thread_process_id(hwnd)[1] if hwnd else 0)
+                threading.current_thread().ident, msg.time, pid.value
+                return 1
+        return backend.call_next_hook(nCode, wParam, lParam)
+
+    return reference_hook
+
+
+def _peak(call, calls):
+    """ :return: The largest memory (in bytes) allocated during one of `calls` calls of `call()`, `None` if it cannot be
+        measured (Python < 3.9).
+    """
+    if not hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+        return None
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure(proc, messages, events):
+    """ Call `proc` `events` times, cycling through `messages`. """
+    info = MSLLHOOKSTRUCT()
+    info.pt.x, info.pt.y = 100, 100
+    address = ctypes.addressof(info)
+    count = len(messages)
+
+    # Warm up the code paths and the caches first.
+    for i in range(1000):
+        proc(HC_ACTION, messages[i % count], address)
+
+    started = time.perf_counter()
+    for i in range(events):
+        proc(HC_ACTION, messages[i % count], address)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        for i in range(events):
+            proc(HC_ACTION, messages[i % count], address)
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        gc.enable()
+
+    # Cycled without computing an index, which would allocate ints during the measure.
+    cycle = itertools.cycle(messages)
+    peak = _peak(lambda: proc(HC_ACTION, next(cycle), address), min(events, 1000))
+
+    return {
+        'call_us': elapsed / events * 1e6,
+        'peak_bytes': peak,
+        'blocks_per_event': blocks / events,
+    }
+
+
+def measure_sources(session):
+    """ :return: The peak memory (in bytes) allocated by each operation of the hook procedure still allocating, see the
+        module documentation.
+    """
+    info = MSLLHOOKSTRUCT()
+    address = ctypes.addressof(info)
+    started = time.perf_counter()
+    sources = {
+        'perf_counter': lambda: time.perf_counter() - started,
+        'latency_record': lambda: wingrab.hook_latency.record(1e-6),
+        'ring_push': lambda: session.ring.push(WM_LBUTTONUP, address),
+    }
+    return {name: _peak(call, 1000) for name, call in sources.items()}
+
+
+def run(events=100000):
+    """ Run the benchmark, return a dict procedure -> scenario -> result. """
+    backend = SimulatedBackend()
+    backend.create_window((0, 0, 800, 600), 1234)
+    scenarios = {'move': (WM_MOUSEMOVE,), 'click': (WM_LBUTTONDOWN, WM_LBUTTONUP)}
+
+    results = {'python': sys.version.split()[0], 'platform': sys.platform, 'events': events}
+    reference = make_reference_hook(backend)
+    results['reference'] = {name: measure(reference, messages, events) for name, messages in scenarios.items()}
+
+    # The session is not run: its ring buffer is never drained, and simply wraps around.
+    wingrab._active_session = session = wingrab._GrabSession(backend=backend)
+    try:
+        results['wingrab'] = {name: measure(wingrab._LLMouseProc, messages, events)
+                              for name, messages in scenarios.items()}
+        # Measured once the counters have gone past the small int cache, as in a running session.
+        results['sources'] = measure_sources(session)
+    finally:
+        wingrab._active_session = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.events)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name in ('reference', 'wingrab'):
+        for scenario, result in results[name].items():
+            peak = 'n/a' if result['peak_bytes'] is None else f'{result["peak_bytes"]} B'
+            print(f'{name:9s} {scenario:5s}: {result["call_us"]:.2f} us per call, peak {peak}, '
+                  f'{result["blocks_per_event"]:.4f} blocks left allocated per event')
+    print('allocations left in the wingrab hook, peak per call:')
+    for source, peak in results['sources'].items():
+        print(f'  {source:15s}: {"n/a" if peak is None else f"{peak} B"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Latency benchmark of the mouse input of the desktop, with the hook in the application or in a hook host process.
+
+A low-level mouse hook holds every mouse event of the desktop until its procedure returns.  This benchmark sends mouse
+moves to a simulated desktop at a fixed rate, and measures, for the `hook` input (the hook runs in the application)
+and for the `host` input (the hook runs in a child process, see `wingrab.hookhost`), with the application idle and
+with threads of the application running pure-Python code (`--load-threads`):
+
+- `input`: from the move to the return of the hook procedure, the time the move is held back from the whole desktop.
+- `delivery`: from the move to the session of the application handling it.
+
+Each move carries its `perf_counter_ns()` in `dwExtraInfo`, a clock shared by the processes.  The simulated desktop
+lives in the process of the hook: the application for `hook`, the child process (this script, run with `--host`) for
+`host`.
+
+Usage: python benchmarks/bench_host.py [--events N] [--interval SECONDS] [--load-threads N] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from wingrab import wingrab  # noqa: E402
+from wingrab.backends.simulated import SimulatedBackend  # noqa: E402
+from wingrab.hookbuffer import LatencyRecorder  # noqa: E402
+from wingrab.hookhost import HookHost, serve  # noqa: E402
+from wingrab.inputs import HostedInput  # noqa: E402
+from wingrab.masks import EventMask  # noqa: E402
+from wingrab.winuser import MSLLHOOKSTRUCT, WM_MOUSEMOVE  # noqa: E402
+
+
+class TimedDesktop(SimulatedBackend):
+    """ A simulated desktop recording how long each move is held back by the hooks. """
+
+    def __init__(self):
+        super().__init__()
+        self.latency = LatencyRecorder()
+
+    def set_mouse_hook(self, proc):
+        def timed_proc(nCode, wParam, lParam):
+            ret = proc(nCode, wParam, lParam)
+            sent = MSLLHOOKSTRUCT.from_address(lParam).dwExtraInfo
+            if sent:
+                self.latency.record((time.perf_counter_ns() - sent) / 1e9)
+            return ret
+
+        return super().set_mouse_hook(timed_proc)
+
+
+def drive(desktop, events, interval):
+    """ Send `events` mouse moves to `desktop`, one every `interval` seconds, once a hook is installed. """
+    desktop.wait_for_hook()
+    info = MSLLHOOKSTRUCT()
+    next_move = time.perf_counter()
+    for i in range(events):
+        info.pt.x, info.pt.y = i % 800, 100
+        info.dwExtraInfo = time.perf_counter_ns()
+        desktop.inject(WM_MOUSEMOVE, info)
+        next_move += interval
+        delay = next_move - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _TimedSession(wingrab._HookSession):
+    """ A session observing the mouse moves, recording when they are handled. """
+
+    def __init__(self, events, **kwargs):
+        super().__init__(mask=EventMask(None, moves=True), patch_cursors=False, **kwargs)
+        self.events = events
+        self.latency = LatencyRecorder()
+
+    def on_event(self, wParam, info):
+        self.latency.record((time.perf_counter_ns() - info.dwExtraInfo) / 1e9)
+        if self.latency.count == self.events:
+            self.stop()
+
+
+def _load(stop):
+    """ Keep the GIL busy with pure-Python code. """
+    while not stop.is_set():
+        total = 0
+        for i in range(10000):
+            total += i * i
+
+
+def _summary(latency):
+    return {key: value * 1e6 if key != 'count' else value for key, value in latency.percentiles((50, 99)).items()}
+
+
+def run_scenario(input_name, events, interval, load_threads):
+    """ Run one scenario, return its `input` and `delivery` latencies (in microseconds). """
+    stop = threading.Event()
+    loads = [threading.Thread(target=_load, args=(stop,), daemon=True) for _ in range(load_threads)]
+    for thread in loads:
+        thread.start()
+
+    timeout = events * interval + 10
+    host = None
+    results_path = None
+    try:
+        if input_name == 'hook':
+            desktop = TimedDesktop()
+            threading.Thread(target=drive, args=(desktop, events, interval), daemon=True).start()
+            session = _TimedSession(events, backend=desktop, input_backend='hook', timeout=timeout)
+        else:
+            fd, results_path = tempfile.mkstemp(prefix='wingrab-bench-', suffix='.json')
+            os.close(fd)
+            command = [sys.executable, os.path.abspath(__file__), '--host', '--events', str(events),
+                       '--interval', str(interval), '--results', results_path]
+            host = HookHost(SimulatedBackend(), command=command)
+            hosted = HostedInput(wingrab._HostedInputProc, host=host)
+            session = _TimedSession(events, backend=host.backend, input_backend=hosted, timeout=timeout)
+        try:
+            session.run()
+        except TimeoutError:
+            pass
+    finally:
+        stop.set()
+        for thread in loads:
+            thread.join()
+
+    if host is None:
+        input_latency = _summary(desktop.latency)
+    else:
+        host.close()
+        with open(results_path, encoding='utf-8') as f:
+            input_latency = json.load(f)
+        os.remove(results_path)
+    return {'input': input_latency, 'delivery': _summary(session.latency)}
+
+
+def run(events=2000, interval=0.001, load_threads=1):
+    """ Run the benchmark, return a dict input -> load -> result. """
+    results = {'python': sys.version.split()[0], 'platform': sys.platform, 'events': events, 'interval': interval,
+               'load_threads': load_threads}
+    for input_name in ('hook', 'host'):
+        results[input_name] = {
+            'idle': run_scenario(input_name, events, interval, 0),
+            'loaded': run_scenario(input_name, events, interval, load_threads),
+        }
+    return results
+
+
+def run_host(ring, events, interval, results_path):
+    """ The hook host of the `host` scenarios, with its own simulated desktop. """
+    desktop = TimedDesktop()
+    driver = threading.Thread(target=drive, args=(desktop, events, interval), daemon=True)
+    driver.start()
+    events_file = os.fdopen(os.dup(sys.stdout.fileno()), 'wb', buffering=0)
+    sys.stdout = sys.stderr
+    # Served until the application closes the host, once its session has handled the moves.
+    serve(ring, sys.stdin.buffer, events_file, desktop)
+    driver.join()
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(_summary(desktop.latency), f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.001, help='the delay between two moves, in seconds')
+    parser.add_argument('--load-threads', type=int, default=1, help='the threads keeping the GIL busy when loaded')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--host', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--results', help=argparse.SUPPRESS)
+    parser.add_argument('ring', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.host:
+        run_host(args.ring, args.events, args.interval, args.results)
+        return
+
+    results = run(args.events, args.interval, args.load_threads)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for input_name in ('hook', 'host'):
+        for load, result in results[input_name].items():
+            for measure in ('input', 'delivery'):
+                latency = result[measure]
+                print(f'{input_name:4s} {load:6s} {measure:8s}: p50 {latency["p50"]:9.1f} us, '
+                      f'p99 {latency["p99"]:9.1f} us, max {latency["max"]:9.1f} us ({latency["count"]} events)')
+
+
+if __name__ == '__main__':
+    main()
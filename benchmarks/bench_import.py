@@ -0,0 +1,104 @@
+"""
+Benchmark of the time taken by `import wingrab`.
+
+Every sample is measured in a fresh interpreter.  Three scenarios are compared:
+
+- `import`: a plain `import wingrab`, what a CLI which never grabs pays.
+- `import+bind`: `import wingrab` followed by the resolution of all the `user32`/`kernel32` prototypes and the
+  registration of the exit handlers, i.e. the work importing wingrab used to do eagerly (Windows only).
+- `--against PATH`: a plain `import wingrab` from another source tree, e.g. a checkout of an older version::
+
+    git worktree add ../wingrab-base <revision>
+    python benchmarks/bench_import.py --against ../wingrab-base
+
+Usage: python benchmarks/bench_import.py [--runs N] [--against PATH] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT = '''
+import time
+t = time.perf_counter()
+import wingrab
+print(time.perf_counter() - t)
+'''
+
+_IMPORT_AND_BIND = '''
+import time
+t = time.perf_counter()
+import wingrab
+from wingrab.backends import win32
+win32.bind_all()
+wingrab.install_exit_handlers()
+print(time.perf_counter() - t)
+'''
+
+
+def measure(code, tree, runs):
+    """ Run `code` in `runs` fresh interpreters with `tree` on the path, return the printed durations (in seconds). """
+    env = dict(os.environ, PYTHONPATH=tree)
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-c', code], env=env, cwd=tree, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        samples.append(float(proc.stdout))
+    return samples
+
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+def run(runs=20, against=None):
+    """ Run the benchmark, return a dict scenario -> summary (or error message). """
+    scenarios = [('import', _IMPORT, REPO_ROOT)]
+    if sys.platform == 'win32':
+        scenarios.append(('import+bind', _IMPORT_AND_BIND, REPO_ROOT))
+    if against is not None:
+        scenarios.append(('import (against)', _IMPORT, os.path.abspath(against)))
+
+    results = {}
+    for name, code, tree in scenarios:
+        try:
+            # The first run warms up the bytecode cache.
+            measure(code, tree, 1)
+            results[name] = summarize(measure(code, tree, runs))
+        except RuntimeError as e:
+            results[name] = {'error': str(e)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--against', metavar='PATH', help='another source tree to compare with')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.runs, args.against)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, summary in results.items():
+        if 'error' in summary:
+            print(f'{name:20s}: {summary["error"]}')
+        else:
+            print(f'{name:20s}: median {summary["median_ms"]:.2f} ms '
+                  f'(min {summary["min_ms"]:.2f} ms, max {summary["max_ms"]:.2f} ms, {summary["runs"]} runs)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark of the lock taken by every grab, for each kind of lock (see `wingrab.locks`).
+
+Three scenarios are measured:
+
+- `uncontended`: acquire/release cycles of a single caller, the cost paid by every grab.
+- `threads`: several threads of one process trying to acquire the lock in a loop, the in-process fast path rejects all
+  but one of them without a system call.
+- `processes`: several processes trying to acquire the lock in a loop, i.e. the cross-process lock under contention.
+
+The `simulated` backend is used on the platforms other than Windows.
+
+Usage: python benchmarks/bench_lock.py [--cycles N] [--workers N] [--duration SECONDS] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from wingrab import locks  # noqa: E402
+from wingrab.backends import get_backend, set_backend  # noqa: E402
+
+_LOCK_FILE = os.path.join(tempfile.gettempdir(), 'WINGRAB-BENCH.LOCKFILE')
+
+_CHILD = '''
+import sys, time
+sys.path.insert(0, {root!r})
+from wingrab import locks
+from wingrab.backends import get_backend, set_backend
+if sys.platform != 'win32':
+    set_backend('simulated')
+locks.set_lock_kind({kind!r})
+manager = locks.LockManager({path!r})
+backend = get_backend()
+start = {start!r}
+while time.time() < start:
+    pass
+end = start + {duration!r}
+while time.time() < end:
+    if manager.acquire(backend):
+        manager.release()
+print(manager.acquired, manager.contended)
+'''
+
+
+def _backend():
+    if sys.platform != 'win32':
+        set_backend('simulated')
+    return get_backend()
+
+
+def bench_uncontended(kind, cycles):
+    """ :return: The mean duration (in microseconds) of an acquire/release cycle. """
+    backend = _backend()
+    locks.set_lock_kind(kind)
+    manager = locks.LockManager(_LOCK_FILE)
+
+    # The first cycle creates the process lock.
+    manager.acquire(backend)
+    manager.release()
+
+    started = time.perf_counter()
+    for _ in range(cycles):
+        if not manager.acquire(backend):
+            raise RuntimeError('The lock is held by another process')
+        manager.release()
+    elapsed = time.perf_counter() - started
+    return {'kind': manager.kind, 'cycle_us': elapsed / cycles * 1e6}
+
+
+def bench_threads(kind, workers, duration):
+    """ :return: The acquisitions and the rejected attempts of `workers` threads sharing one `LockManager`. """
+    backend = _backend()
+    locks.set_lock_kind(kind)
+    manager = locks.LockManager(_LOCK_FILE)
+    end = time.perf_counter() + duration
+
+    def work():
+        while time.perf_counter() < end:
+            if manager.acquire(backend):
+                manager.release()
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'kind': manager.kind,
+        'acquired_per_s': manager.acquired / duration,
+        'contended_per_s': manager.contended / duration,
+    }
+
+
+def bench_processes(kind, workers, duration):
+    """ :return: The acquisitions and the rejected attempts of `workers` processes. """
+    code = _CHILD.format(root=REPO_ROOT, kind=kind, path=_LOCK_FILE, start=time.time() + 1.0, duration=duration)
+    procs = [subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+
+    acquired = contended = 0
+    for proc in procs:
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(err.strip().splitlines()[-1])
+        a, c = map(int, out.split())
+        acquired += a
+        contended += c
+    return {'acquired_per_s': acquired / duration, 'contended_per_s': contended / duration}
+
+
+def run(cycles=2000, workers=4, duration=1.0):
+    """ Run the benchmark, return a dict kind -> scenario -> result (or error message). """
+    results = {}
+    for kind in locks.LOCK_KINDS:
+        results[kind] = {}
+        for name, bench, args in (
+            ('uncontended', bench_uncontended, (kind, cycles)),
+            ('threads', bench_threads, (kind, workers, duration)),
+            ('processes', bench_processes, (kind, workers, duration)),
+        ):
+            try:
+                results[kind][name] = bench(*args)
+            except (RuntimeError, OSError) as e:
+                results[kind][name] = {'error': str(e)}
+    locks.set_lock_kind(None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=1.0, help='duration (in seconds) of the contended runs')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.cycles, args.workers, args.duration)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for kind, scenarios in results.items():
+        for name, result in scenarios.items():
+            label = f'{kind}/{name}'
+            if 'error' in result:
+                print(f'{label:22s}: {result["error"]}')
+            elif name == 'uncontended':
+                print(f'{label:22s}: {result["cycle_us"]:.2f} us per acquire/release ({result["kind"]} lock)')
+            else:
+                print(f'{label:22s}: {result["acquired_per_s"]:.0f} acquired/s, '
+                      f'{result["contended_per_s"]:.0f} rejected/s')
+
+
+if __name__ == '__main__':
+    main()
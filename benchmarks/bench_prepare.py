@@ -0,0 +1,148 @@
+"""
+Click-to-ready benchmark of `wingrab.grab()` against a prepared grab (`wingrab.prepare()`), on the `simulated` backend.
+
+The time to ready is measured from the call (`grab()`, or `activate()` of the prepared grab) to the moment the grab
+cursors are set and the trigger is armed: the last `SetSystemCursor` call for `grab()`, which installs its hook first,
+and the return of `activate()` for the prepared grab, which sets the cursors first.  The window is then clicked, and
+the next grab starts once the result is returned.
+
+The simulated backend answers at once, where each call of the `win32` backend crosses into the system: `--call-delay`
+adds a delay to the calls making and setting the cursors and installing the hook, to see how each path scales with the
+cost of the system calls.  The grabs are `--pause` seconds apart, the time a user takes between two picks, during
+which the prepared grab makes its cursors again.
+
+Usage: python benchmarks/bench_prepare.py [--grabs N] [--call-delay SECONDS] [--pause SECONDS] [--input NAME] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import wingrab  # noqa: E402
+from wingrab.backends import set_backend  # noqa: E402
+from wingrab.backends.simulated import SimulatedBackend  # noqa: E402
+from wingrab.hookbuffer import LatencyRecorder  # noqa: E402
+from wingrab.winuser import IDC_APPSTARTING  # noqa: E402
+
+
+def _delay(seconds):
+    """ Wait `seconds` without sleeping, like a system call keeping the thread busy. """
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TimedDesktop(SimulatedBackend):
+    """ A simulated desktop whose system calls take `call_delay` seconds, recording when the last cursor is set. """
+
+    def __init__(self, call_delay=0.0):
+        super().__init__()
+        self.call_delay = call_delay
+        self.cursors_set = None
+
+    def set_mouse_hook(self, proc):
+        _delay(self.call_delay)
+        return super().set_mouse_hook(proc)
+
+    def snapshot_system_cursor(self, cursor_id):
+        _delay(self.call_delay)
+        return super().snapshot_system_cursor(cursor_id)
+
+    def copy_cursor(self, cursor):
+        _delay(self.call_delay)
+        return super().copy_cursor(cursor)
+
+    def set_system_cursor(self, cursor, cursor_id):
+        _delay(self.call_delay)
+        is_set = super().set_system_cursor(cursor, cursor_id)
+        if cursor_id == IDC_APPSTARTING:
+            # The last of the standard cursors
+            self.cursors_set = time.perf_counter()
+        return is_set
+
+
+def _summary(latency):
+    return {key: value * 1e6 if key != 'count' else value for key, value in latency.percentiles((50, 99)).items()}
+
+
+def bench_grab(desktop, grabs, input_backend, pause):
+    latency = LatencyRecorder()
+    for _ in range(grabs):
+        time.sleep(pause)
+        desktop.cursors_set = None
+        clicker = threading.Timer(0.005, desktop.click, (100, 100))
+        clicker.start()
+        started = time.perf_counter()
+        pid = wingrab.grab(input_backend=input_backend, timeout=5)
+        clicker.join()
+        if pid != 1234:
+            raise RuntimeError(f'Unexpected grab result: {pid}')
+        latency.record(desktop.cursors_set - started)
+    return _summary(latency)
+
+
+def bench_prepared(desktop, grabs, input_backend, pause):
+    started = time.perf_counter()
+    with wingrab.prepare(input_backend=input_backend) as picker:
+        prepare_seconds = time.perf_counter() - started
+        for _ in range(grabs):
+            time.sleep(pause)
+            picker.activate()
+            desktop.click(100, 100)
+            pid = picker.wait(timeout=5)
+            if pid != 1234:
+                raise RuntimeError(f'Unexpected grab result: {pid}')
+        result = _summary(picker.activation_latency)
+    result['prepare'] = prepare_seconds * 1e6
+    return result
+
+
+def run(grabs=200, call_delay=0.0, pause=0.02, input_backend='hook'):
+    """ Run the benchmark, return the times to ready (in microseconds) of both paths. """
+    desktop = set_backend(TimedDesktop(call_delay))
+    desktop.create_window((0, 0, 800, 600), pid=1234)
+    try:
+        # Warm up the cursor cache and the threads first.
+        bench_grab(desktop, 5, input_backend, pause)
+        return {
+            'python': sys.version.split()[0],
+            'platform': sys.platform,
+            'grabs': grabs,
+            'call_delay': call_delay,
+            'pause': pause,
+            'input': input_backend,
+            'grab': bench_grab(desktop, grabs, input_backend, pause),
+            'prepared': bench_prepared(desktop, grabs, input_backend, pause),
+        }
+    finally:
+        set_backend(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grabs', type=int, default=200)
+    parser.add_argument('--call-delay', type=float, default=0.0, help='the duration of a system call, in seconds')
+    parser.add_argument('--pause', type=float, default=0.02, help='the time between two grabs, in seconds')
+    parser.add_argument('--input', default='hook', help='the source of the mouse events, see wingrab.inputs')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.grabs, args.call_delay, args.pause, args.input)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name in ('grab', 'prepared'):
+        ready = results[name]
+        print(f'{name:8s}: ready p50 {ready["p50"]:9.1f} us, p99 {ready["p99"]:9.1f} us, max {ready["max"]:9.1f} us '
+              f'({ready["count"]} grabs)')
+    print(f'prepare : {results["prepared"]["prepare"]:9.1f} us, once')
+
+
+if __name__ == '__main__':
+    main()
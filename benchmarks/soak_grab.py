@@ -0,0 +1,218 @@
+"""
+Soak test of the grabs against the `simulated` backend, runnable on any platform.
+
+A process hosting wingrab around the clock runs thousands of grabs a day, so a handle or a few bytes left behind by each
+grab add up.  This script runs `--grabs` grabs cycling through the kinds of sessions and their outcomes (see
+`SCENARIOS`), and checks that the following do not grow between the end of the warm-up and the end of the run:
+
+- the live resources of `wingrab.resources.tracker` (hooks, cursors, window event hooks, locks...), by kind,
+- the cursor handles alive in the simulated desktop,
+- the threads of the process,
+- the Python memory traced by `tracemalloc`, which must not grow by more than `--max-growth` bytes.
+
+The exit status is 1 if any of them has grown.
+
+Usage: python benchmarks/soak_grab.py [--grabs N] [--warmup N] [--max-growth BYTES] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from wingrab import wingrab  # noqa: E402
+from wingrab.backends import set_backend  # noqa: E402
+from wingrab.backends.simulated import SimulatedBackend  # noqa: E402
+from wingrab.prepared import prepare  # noqa: E402
+from wingrab.resources import tracker  # noqa: E402
+from wingrab.stream import stream  # noqa: E402
+
+
+class SoakDesktop(SimulatedBackend):
+    """ A simulated desktop which can refuse to replace the system cursors, like a failing `SetSystemCursor`. """
+
+    def __init__(self):
+        super().__init__()
+        self.refuse_cursors = False
+
+    def set_system_cursor(self, cursor, cursor_id):
+        if self.refuse_cursors:
+            return False
+        return super().set_system_cursor(cursor, cursor_id)
+
+
+def _grab(desktop):
+    desktop.click(100, 100)
+    return wingrab.grab(timeout=5)
+
+
+def _grab_detail(desktop):
+    desktop.click(100, 100)
+    return wingrab.grab(detail=True, timeout=5)
+
+
+def _grab_right(desktop):
+    desktop.click(100, 100, 'right')
+    return wingrab.grab(mask='right', timeout=5)
+
+
+def _grab_raw(desktop):
+    desktop.click(100, 100)
+    return wingrab.grab(input_backend='raw', timeout=5)
+
+
+def _grab_host(desktop):
+    desktop.click(100, 100)
+    return wingrab.grab(input_backend='host', timeout=5)
+
+
+def _grab_many(desktop):
+    desktop.click(100, 100)
+    desktop.click(900, 100)
+    return wingrab.grab_many(2, timeout=5)
+
+
+def _stream(desktop):
+    desktop.move_to(100, 100)
+    with stream(hit_test_cache=True) as windows:
+        return next(iter(windows))
+
+
+def _prepared(desktop):
+    with prepare() as picker:
+        picker.activate()
+        desktop.click(100, 100)
+        return picker.wait(timeout=5)
+
+
+def _timeout(desktop):
+    try:
+        wingrab.grab(timeout=0.001)
+    except TimeoutError:
+        return None
+    raise AssertionError('The grab has not timed out')
+
+
+def _cancelled(desktop):
+    token = wingrab.CancellationToken()
+    token.cancel()
+    try:
+        wingrab.grab(token=token, timeout=5)
+    except wingrab.GrabCancelled:
+        return None
+    raise AssertionError('The grab has not been cancelled')
+
+
+def _cursor_refused(desktop):
+    desktop.refuse_cursors = True
+    try:
+        return _grab(desktop)
+    finally:
+        desktop.refuse_cursors = False
+
+
+# The sessions run in turn, name -> function(desktop)
+SCENARIOS = {
+    'grab': _grab,
+    'grab_detail': _grab_detail,
+    'grab_right': _grab_right,
+    'grab_raw': _grab_raw,
+    'grab_host': _grab_host,
+    'grab_many': _grab_many,
+    'stream': _stream,
+    'prepared': _prepared,
+    'timeout': _timeout,
+    'cancelled': _cancelled,
+    'cursor_refused': _cursor_refused,
+}
+
+
+def snapshot(desktop):
+    """ The figures which must not grow. """
+    gc.collect()
+    return {
+        'resources': tracker.counts(),
+        'cursor_handles': len(desktop.cursor_handles),
+        'threads': threading.active_count(),
+        'memory': tracemalloc.get_traced_memory()[0],
+    }
+
+
+def run(grabs=10000, warmup=500, max_growth=256 * 1024):
+    """ Run the soak test, return its report. """
+    desktop = set_backend(SoakDesktop())
+    desktop.create_window((0, 0, 800, 600), pid=1234)
+    desktop.create_window((800, 0, 1600, 600), pid=5678)
+    scenarios = list(SCENARIOS.items())
+
+    def run_grabs(count):
+        for i in range(count):
+            scenarios[i % len(scenarios)][1](desktop)
+
+    tracemalloc.start()
+    try:
+        run_grabs(warmup)
+        before = snapshot(desktop)
+        started = time.perf_counter()
+        run_grabs(grabs)
+        elapsed = time.perf_counter() - started
+        after = snapshot(desktop)
+    finally:
+        tracemalloc.stop()
+
+    growth = {
+        'resources': {kind: after['resources'].get(kind, 0) - before['resources'].get(kind, 0)
+                      for kind in set(before['resources']) | set(after['resources'])},
+        'cursor_handles': after['cursor_handles'] - before['cursor_handles'],
+        'threads': after['threads'] - before['threads'],
+        'memory': after['memory'] - before['memory'],
+    }
+    failures = [f'{kind} resources: {count:+d}' for kind, count in sorted(growth['resources'].items()) if count > 0]
+    if growth['cursor_handles'] > 0:
+        failures.append(f'cursor handles: {growth["cursor_handles"]:+d}')
+    if growth['threads'] > 0:
+        failures.append(f'threads: {growth["threads"]:+d}')
+    if growth['memory'] > max_growth:
+        failures.append(f'memory: {growth["memory"]:+d} bytes (limit {max_growth})')
+
+    return {
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'grabs': grabs,
+        'scenarios': list(SCENARIOS),
+        'seconds': elapsed,
+        'before': before,
+        'after': after,
+        'growth': growth,
+        'created': tracker.stats['created'],
+        'failures': failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grabs', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=500, help='the grabs run before the first measure')
+    parser.add_argument('--max-growth', type=int, default=256 * 1024, help='the memory growth allowed, in bytes')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    report = run(args.grabs, args.warmup, args.max_growth)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f'{report["grabs"]} grabs in {report["seconds"]:.1f} s ({", ".join(report["scenarios"])})')
+        for name in ('before', 'after', 'growth'):
+            print(f'{name:7s}: {report[name]}')
+        print('FAILED: ' + '; '.join(report['failures']) if report['failures'] else 'OK: no growth')
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,10 +16,12 @@ from PyQt5 import QtWidgets, QtCore
 # You can change this to PySide2 if you want to use PySide2.
 # from PySide2 import QtWidgets, QtCore
 
-# If you import wingrab in another thread, you will get an error!
-# You can import wingrab in the main thread and use it in another thread.
+# The handlers restoring the cursor on exit can only be installed in the main thread,
+# so install them here as `grab` is only called in another thread.
 import wingrab
 
+wingrab.install_exit_handlers()
+
 
 class ExampleWindow(QtWidgets.QMainWindow):
     # The signal is used to notify the main thread that the grab is finished.
@@ -5,11 +5,12 @@ import wingrab
 
 
 def run_in_another_thread():
-    # import wingrab  # if you import wingrab in another thread, you will get an error
     wingrab.grab(_debug=True)
 
 
 if __name__ == '__main__':
+    # Signal handlers can only be installed in the main thread.
+    wingrab.install_exit_handlers()
     thread = threading.Thread(target=run_in_another_thread)
     thread.start()
     for i in range(100):
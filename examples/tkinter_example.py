@@ -15,10 +15,12 @@ import threading
 import tkinter as tk
 import time
 
-# If you import wingrab in another thread, you will get an error!
-# You can import wingrab in the main thread and use it in another thread.
+# The handlers restoring the cursor on exit can only be installed in the main thread,
+# so install them here as `grab` is only called in another thread.
 import wingrab
 
+wingrab.install_exit_handlers()
+
 
 class ExampleWindow(tk.Tk):
     def __init__(self):
@@ -0,0 +1,23 @@
+import pytest
+
+from wingrab import wingrab
+from wingrab.backends import set_backend
+from wingrab.backends.simulated import SimulatedBackend
+from wingrab.cursors import CursorJournal
+from wingrab.hookhost import close_hosts
+
+
+@pytest.fixture
+def desktop(tmp_path, monkeypatch):
+    """ A simulated desktop with two windows, side by side: pid 1234 on the left, pid 5678 on the right. """
+    # The grabs of the tests must not touch the journal of a real grab.
+    monkeypatch.setattr(wingrab, 'cursor_journal', CursorJournal(str(tmp_path / 'wingrab-cursors.json')))
+    backend = set_backend(SimulatedBackend())
+    backend.create_window((0, 0, 800, 600), pid=1234)
+    backend.create_window((800, 0, 1600, 600), pid=5678)
+    try:
+        yield backend
+    finally:
+        close_hosts()
+        wingrab.cursor_cache.clear()
+        set_backend(None)
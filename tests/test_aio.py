@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.aio import grab_async
+
+
+def _are_cursors_restored(desktop):
+    return all(desktop.system_cursor_image(cursor_id) == f'default:{cursor_id}'
+               for cursor_id in wingrab._standard_cursor_ids)
+
+
+async def _wait_for_hook(desktop):
+    """ Wait for the hook of the session without blocking the loop. """
+    loop = asyncio.get_running_loop()
+    assert await loop.run_in_executor(None, desktop.wait_for_hook, 5)
+
+
+def test_grab_async(desktop):
+    desktop.click(900, 100)
+    assert asyncio.run(grab_async(timeout=5)) == 5678
+
+
+def test_concurrent_calls_share_the_click(desktop):
+    async def main():
+        tasks = [asyncio.ensure_future(grab_async(timeout=5)), asyncio.ensure_future(grab_async(detail=True))]
+        await _wait_for_hook(desktop)
+        desktop.click(100, 100)
+        return await asyncio.gather(*tasks)
+
+    pid, info = asyncio.run(main())
+    assert pid == 1234
+    assert info.pid == 1234
+
+
+def test_timeout_restores_before_raising(desktop):
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await grab_async(timeout=0.05)
+        # Checked right away, on the loop: the session is already over.
+        assert not desktop._hooks
+        assert _are_cursors_restored(desktop)
+
+    asyncio.run(main())
+
+
+def test_cancel_restores_before_raising(desktop):
+    async def main():
+        task = asyncio.ensure_future(grab_async())
+        await _wait_for_hook(desktop)
+        # The cursors are set once the hook is installed.
+        while _are_cursors_restored(desktop):
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not desktop._hooks
+        assert _are_cursors_restored(desktop)
+
+    asyncio.run(main())
+
+
+def test_cancelled_call_leaves_the_others_waiting(desktop):
+    async def main():
+        cancelled = asyncio.ensure_future(grab_async())
+        waiting = asyncio.ensure_future(grab_async(timeout=5))
+        await _wait_for_hook(desktop)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert desktop._hooks
+        desktop.click(900, 100)
+        return await waiting
+
+    assert asyncio.run(main()) == 5678
+
+
+def test_loop_is_not_blocked(desktop):
+    async def main():
+        ticks = 0
+        task = asyncio.ensure_future(grab_async(timeout=0.3))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            task.result()
+        return ticks
+
+    assert asyncio.run(main()) > 10
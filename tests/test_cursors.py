@@ -0,0 +1,220 @@
+import os
+
+import pytest
+
+from wingrab import cursors
+from wingrab.backends.simulated import SimulatedBackend
+from wingrab.cursors import CursorCache, CursorJournal, CursorPatch, recover_cursors
+
+CURSOR_IDS = (32512, 32513, 32514)
+
+
+class RefusingDesktop(SimulatedBackend):
+    """ A simulated desktop whose `SetSystemCursor` fails for the cursor ids `refused`. """
+
+    def __init__(self, refused=()):
+        super().__init__()
+        self.refused = set(refused)
+
+    def set_system_cursor(self, cursor, cursor_id):
+        if cursor_id in self.refused:
+            return False
+        return super().set_system_cursor(cursor, cursor_id)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return CursorJournal(str(tmp_path / 'cursors.json'))
+
+
+def _images(backend):
+    return {cursor_id: backend.system_cursor_image(cursor_id) for cursor_id in CURSOR_IDS}
+
+
+def _make_grab_cursor(backend):
+    return lambda: backend.create_cursor_from_resource(b'grab cursor')
+
+
+def test_prepare_commit_restore(journal):
+    backend = SimulatedBackend()
+    backend.set_system_cursor(backend.load_cursor_from_file(__file__), 32513)
+    before = _images(backend)
+
+    patch = CursorPatch(backend, CURSOR_IDS, journal=journal)
+    patch.prepare(_make_grab_cursor(backend))
+    # Nothing replaced yet, but the journal is written ahead.
+    assert _images(backend) == before
+    assert journal.read()['cursors'] == list(CURSOR_IDS)
+
+    patch.commit()
+    assert set(_images(backend).values()) == {'resource'}
+
+    assert patch.restore()
+    # The custom cursor set by another application is put back too, without reloading the scheme.
+    assert _images(backend) == before
+    assert backend.scheme_reloads == 0
+    assert journal.read() is None
+    # Only the system cursors are left.
+    assert backend.cursor_handles == set(backend.system_cursors.values())
+
+
+def test_restore_without_commit_destroys_the_prepared_cursors():
+    backend = SimulatedBackend()
+    patch = CursorPatch(backend, CURSOR_IDS)
+    patch.prepare(_make_grab_cursor(backend))
+    assert len(backend.cursor_handles) == 2 * len(CURSOR_IDS)
+
+    assert patch.restore()
+    assert not backend.cursor_handles
+    assert not backend.system_cursors
+
+
+def test_refused_cursor_is_destroyed():
+    backend = RefusingDesktop(refused={32514})
+    patch = CursorPatch(backend, CURSOR_IDS)
+    patch.apply(_make_grab_cursor(backend))
+    assert _images(backend)[32514] == 'default:32514'
+    assert _images(backend)[32512] == 'resource'
+    assert len(backend.cursor_handles) == 2 * len(CURSOR_IDS) - 1
+
+    assert patch.restore()
+    assert _images(backend) == {cursor_id: f'default:{cursor_id}' for cursor_id in CURSOR_IDS}
+
+
+def test_restore_reloads_the_scheme_when_a_copy_cannot_be_set():
+    backend = RefusingDesktop()
+    patch = CursorPatch(backend, CURSOR_IDS)
+    patch.apply(_make_grab_cursor(backend))
+    backend.refused.add(32513)
+
+    assert not patch.restore()
+    assert backend.scheme_reloads == 1
+    assert _images(backend) == {cursor_id: f'default:{cursor_id}' for cursor_id in CURSOR_IDS}
+    assert not backend.cursor_handles
+
+
+def test_prepare_failure_restores():
+    backend = SimulatedBackend()
+    patch = CursorPatch(backend, CURSOR_IDS)
+
+    def make_cursor():
+        if len(backend.cursor_handles) > len(CURSOR_IDS):
+            raise OSError('make_cursor')
+        return backend.create_cursor_from_resource(b'grab cursor')
+
+    with pytest.raises(OSError):
+        patch.prepare(make_cursor)
+    assert not backend.cursor_handles
+
+
+def _write_crashed_journal(backend, journal, scheme):
+    """ The journal of a grab of the process 4242, which has exited without restoring the cursors. """
+    backend.create_process(4242, 'C:\\app.exe')
+    journal.write({
+        'pid': 4242,
+        'start_time': backend.get_process_start_time(4242),
+        'cursors': list(CURSOR_IDS),
+        'scheme': {str(cursor_id): path for cursor_id, path in scheme.items()},
+    })
+    for cursor_id in CURSOR_IDS:
+        backend.set_system_cursor(backend.create_cursor_from_resource(b'grab cursor'), cursor_id)
+    backend.terminate_process(4242)
+
+
+def test_recover_cursors_from_the_scheme_files(tmp_path, journal):
+    backend = SimulatedBackend()
+    scheme = {}
+    for cursor_id in CURSOR_IDS:
+        path = scheme[cursor_id] = str(tmp_path / f'{cursor_id}.cur')
+        with open(path, 'wb') as f:
+            f.write(b'cursor')
+    _write_crashed_journal(backend, journal, scheme)
+
+    assert recover_cursors(backend, journal)
+    assert _images(backend) == scheme
+    assert backend.scheme_reloads == 0
+    assert journal.read() is None
+    assert not recover_cursors(backend, journal)
+
+
+def test_recover_cursors_reloads_the_scheme(tmp_path, journal):
+    backend = SimulatedBackend()
+    # A built-in cursor, and a file which has been deleted since
+    scheme = {32512: str(tmp_path / 'arrow.cur'), 32513: '', 32514: str(tmp_path / 'missing.cur')}
+    with open(scheme[32512], 'wb') as f:
+        f.write(b'cursor')
+    _write_crashed_journal(backend, journal, scheme)
+
+    assert recover_cursors(backend, journal)
+    assert backend.scheme_reloads == 1
+    assert _images(backend) == {cursor_id: f'default:{cursor_id}' for cursor_id in CURSOR_IDS}
+    assert journal.read() is None
+
+
+def test_recover_cursors_of_running_grab(journal):
+    backend = SimulatedBackend()
+    patch = CursorPatch(backend, CURSOR_IDS, journal=journal)
+    patch.apply(_make_grab_cursor(backend))
+
+    # The grab of this process is still running.
+    assert not recover_cursors(backend, journal)
+    assert set(_images(backend).values()) == {'resource'}
+    assert journal.read()['pid'] == os.getpid()
+    patch.restore()
+
+
+def test_recover_cursors_of_reused_pid(journal):
+    backend = SimulatedBackend()
+    _write_crashed_journal(backend, journal, {})
+    # Another process has been started with the same PID.
+    backend.create_process(4242, 'C:\\other.exe')
+    assert recover_cursors(backend, journal)
+    assert backend.scheme_reloads == 1
+
+
+def test_recover_cursors_without_journal(journal):
+    assert not recover_cursors(SimulatedBackend(), journal)
+
+
+@pytest.fixture
+def cursor_file(tmp_path):
+    path = tmp_path / 'cursor.cur'
+    with open(os.path.join(os.path.dirname(cursors.__file__), 'cursor.cur'), 'rb') as f:
+        path.write_bytes(f.read())
+    return str(path)
+
+
+def test_cache_warm(cursor_file):
+    backend = SimulatedBackend()
+    cache = CursorCache(cursor_file)
+    cache.warm(backend)
+    assert cache.stats['loads'] == 1
+    assert len(backend.cursor_handles) == 1
+
+    copies = [cache.copy(backend, check=False) for _ in CURSOR_IDS]
+    assert cache.stats == dict(cache.stats, loads=1, copies=len(CURSOR_IDS))
+    assert len(set(copies)) == len(CURSOR_IDS)
+
+    cache.clear()
+    assert backend.cursor_handles == set(copies)
+    for copy in copies:
+        backend.destroy_cursor(copy)
+
+
+def test_cache_checks_the_file_only_when_asked(cursor_file):
+    backend = SimulatedBackend()
+    cache = CursorCache(cursor_file)
+    copies = [cache.copy(backend)]
+    with open(cursor_file, 'ab') as f:
+        f.write(b'\0')
+
+    copies.append(cache.copy(backend, check=False))
+    assert cache.stats['loads'] == 1
+    copies.append(cache.copy(backend))
+    assert cache.stats['loads'] == 2
+    # The cursor made from the stale content has been destroyed.
+    assert len(backend.cursor_handles) == 3 + 1
+
+    cache.clear()
+    for copy in copies:
+        backend.destroy_cursor(copy)
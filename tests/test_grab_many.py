@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import wingrab
+from wingrab.scheduler import CancellationToken, GrabCancelled
+
+
+def test_n_clicks(desktop):
+    for x in (100, 900, 200):
+        desktop.click(x, 100)
+    batch = wingrab_package.grab_many(3, timeout=5)
+    assert batch == [1234, 5678, 1234]
+    assert len(batch.timings) == 3
+    assert all(timing.elapsed >= 0 and timing.resolve >= 0 for timing in batch.timings)
+    assert [timing.timestamp for timing in batch.timings] == sorted(timing.timestamp for timing in batch.timings)
+    assert not desktop._hooks
+
+
+def test_extra_clicks_are_left_alone(desktop):
+    for x in (100, 900, 200):
+        desktop.click(x, 100)
+    assert wingrab_package.grab_many(2, timeout=5) == [1234, 5678]
+
+
+def test_until(desktop):
+    for x in (100, 200, 900, 300):
+        desktop.click(x, 100)
+    # The result ending the batch is included.
+    assert wingrab_package.grab_many(until=lambda pid: pid == 5678, timeout=5) == [1234, 1234, 5678]
+
+
+def test_clicks_outside_the_windows_are_ignored(desktop):
+    desktop.click(100, 5000)
+    desktop.click(900, 100)
+    assert wingrab_package.grab_many(1, timeout=5) == [5678]
+
+
+def test_timeout_returns_the_windows_so_far(desktop):
+    desktop.click(100, 100)
+    batch = wingrab_package.grab_many(timeout=0.2)
+    assert batch == [1234]
+    assert not desktop._hooks
+
+
+def test_detail_and_mask(desktop):
+    desktop.click(100, 100)
+    desktop.click(900, 100, 'right')
+    batch = wingrab_package.grab_many(1, detail=True, mask='right', timeout=5)
+    assert [(info.pid, info.point) for info in batch] == [(5678, (900, 100))]
+
+
+def test_cancel_loses_the_windows(desktop):
+    token = CancellationToken()
+    desktop.click(100, 100)
+    threading.Timer(0.1, token.cancel).start()
+    with pytest.raises(GrabCancelled):
+        wingrab_package.grab_many(token=token)
+    assert not desktop._hooks
+    assert all(desktop.system_cursor_image(cursor_id) == f'default:{cursor_id}'
+               for cursor_id in wingrab._standard_cursor_ids)
+
+
+def test_invalid_count(desktop):
+    with pytest.raises(ValueError):
+        wingrab_package.grab_many(0)
+
+
+def test_waits_for_the_running_grab(desktop):
+    with wingrab_package.prepare():
+        with pytest.raises(TimeoutError):
+            wingrab_package.grab_many(1, timeout=0.05)
+    desktop.click(900, 100)
+    assert wingrab_package.grab_many(1, timeout=5) == [5678]
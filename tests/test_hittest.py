@@ -0,0 +1,155 @@
+from ctypes.wintypes import POINT
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.hittest import WindowIndex
+from wingrab.stream import stream
+
+
+@pytest.fixture
+def index(desktop):
+    # Small cells, so that the windows span several of them.
+    index = WindowIndex(cell_size=64)
+    index.attach(desktop)
+    try:
+        yield index
+    finally:
+        index.detach()
+
+
+def _pump(desktop):
+    """ Deliver the window events posted to the thread of the index. """
+    desktop.create_message_queue().pump()
+
+
+def _assert_agrees(desktop, index):
+    """ Check the index against `WindowFromPoint` over a grid of points covering the desktop and beyond. """
+    for x in range(-30, 1700, 37):
+        for y in range(-30, 700, 37):
+            found = index.lookup(x, y)
+            hwnd = desktop.window_from_point(x, y)
+            if hwnd is None:
+                assert found is None, (x, y)
+                continue
+            expected = wingrab._get_window_from_point(desktop, POINT(x, y))
+            if found is None:
+                # Only the windows hosting other processes are left to `WindowFromPoint`.
+                assert desktop.get_root_window(hwnd) in index._hosts, (x, y)
+                continue
+            assert found == (desktop.get_root_window(hwnd), expected[1]), (x, y)
+
+
+@pytest.fixture
+def layout(desktop):
+    """ Overlapping windows: a dialog on top of both windows of the desktop, and a window under all of them. """
+    windows = desktop.windows
+    bottom = desktop.create_window((-100, -100, 2000, 1000), pid=1)
+    for window in reversed(windows):
+        desktop.bring_to_top(window)
+    dialog = desktop.create_window((700, 100, 900, 300), pid=42)
+    return bottom, dialog
+
+
+def test_overlapping_windows(desktop, index, layout):
+    bottom, dialog = layout
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+    assert index.lookup(750, 150) == (dialog.hwnd, 42)
+    assert index.lookup(1700, 650) == (bottom.hwnd, 1)
+    assert index.stats['hits'] > 0
+
+
+def test_zorder(desktop, index, layout):
+    bottom, dialog = layout
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+
+    desktop.bring_to_top(bottom)
+    _pump(desktop)
+    assert index.lookup(750, 150) == (bottom.hwnd, 1)
+    _assert_agrees(desktop, index)
+
+
+def test_move_and_resize(desktop, index, layout):
+    bottom, dialog = layout
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+    rebuilds = index.rebuilds
+
+    desktop.move_window(dialog, (50, 400, 1000, 650))
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+    assert index.lookup(750, 150)[1] == 1234
+    # Moved in place, without a new snapshot.
+    assert index.rebuilds == rebuilds
+    assert index.updates == 1
+
+
+def test_hide_and_destroy(desktop, index, layout):
+    bottom, dialog = layout
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+
+    desktop.destroy_window(dialog)
+    desktop.show_window(desktop.windows[1], False)
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+
+    desktop.destroy_window(bottom)
+    _pump(desktop)
+    _assert_agrees(desktop, index)
+    assert index.lookup(1700, 650) is None
+
+
+def test_child_of_the_same_process(desktop, index):
+    parent = desktop.windows[0]
+    child = desktop.create_window((820, 20, 900, 100), pid=parent.pid, parent=parent)
+    assert desktop.window_from_point(850, 50) == child.hwnd
+    # The index answers with the top-level window, of the same process.
+    assert index.lookup(850, 50) == (parent.hwnd, parent.pid)
+    _assert_agrees(desktop, index)
+
+
+def test_child_of_another_process(desktop, index):
+    # A UWP frame (ApplicationFrameHost.exe) around the window of the application
+    frame = desktop.create_window((200, 200, 600, 500), pid=300, class_name='ApplicationFrameWindow')
+    desktop.create_window((200, 230, 600, 500), pid=400, parent=frame, class_name='Windows.UI.Core.CoreWindow')
+    _pump(desktop)
+
+    assert index.lookup(400, 400) is None
+    assert index.stats['hosted'] == 1
+    assert wingrab._get_window_from_point(desktop, POINT(400, 400))[1] == 400
+    _assert_agrees(desktop, index)
+
+    # The flag follows the window when it moves, and leaves with it.
+    desktop.move_window(frame, (250, 200, 650, 500))
+    _pump(desktop)
+    assert index.lookup(400, 400) is None
+    desktop.destroy_window(frame)
+    _pump(desktop)
+    assert index.lookup(400, 400)[1] == 1234
+    assert not index._hosts
+
+
+def test_stream_with_hit_test_cache(desktop):
+    frame = desktop.create_window((200, 200, 600, 500), pid=300)
+    desktop.create_window((200, 230, 600, 500), pid=400, parent=frame)
+
+    desktop.move_to(100, 100)
+    with stream(hit_test_cache=True) as windows:
+        events = iter(windows)
+        assert next(events).pid == 1234
+        desktop.move_to(400, 400)
+        assert next(events).pid == 400
+        desktop.move_to(900, 100)
+        assert next(events).pid == 5678
+        stats = windows.stats['hit_test']
+    assert stats['hits'] >= 2
+    assert stats['hosted'] >= 1
+
+
+def test_detached_index_misses(desktop, index):
+    assert index.lookup(100, 100)[1] == 1234
+    index.detach()
+    assert index.lookup(100, 100) is None
@@ -0,0 +1,100 @@
+from ctypes import addressof
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.hookhost import _RingReader, _RingWriter
+from wingrab.winuser import MSLLHOOKSTRUCT, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_MOUSEMOVE
+
+
+@pytest.fixture
+def ring(tmp_path):
+    """ The reader and the writer of a ring of 4 slots. """
+    path = str(tmp_path / 'ring')
+    reader = _RingReader(path, 4)
+    bells = []
+    writer = _RingWriter(path, lambda: bells.append(1))
+    writer.bells = bells
+    try:
+        yield reader, writer
+    finally:
+        writer.close()
+        reader.close()
+
+
+def _push(writer, wParam, x, trigger=False):
+    info = MSLLHOOKSTRUCT()
+    info.pt.x = x
+    writer.push(wParam, addressof(info), trigger)
+
+
+def _drain(reader):
+    events = []
+    count = reader.drain(lambda wParam, lParam, trigger: events.append(
+        (wParam, MSLLHOOKSTRUCT.from_address(lParam).pt.x, trigger)))
+    assert count == len(events)
+    return events
+
+
+def test_records_are_read_in_order(ring):
+    reader, writer = ring
+    _push(writer, WM_LBUTTONDOWN, 1)
+    _push(writer, WM_LBUTTONUP, 2, True)
+    assert reader.pending
+    assert _drain(reader) == [(WM_LBUTTONDOWN, 1, False), (WM_LBUTTONUP, 2, True)]
+    assert not reader.pending
+    assert _drain(reader) == []
+    assert reader.dropped == 0
+
+
+def test_overrun_drops_the_oldest_records(ring):
+    reader, writer = ring
+    for x in range(7):
+        _push(writer, WM_MOUSEMOVE, x)
+    assert [x for _, x, _ in _drain(reader)] == [3, 4, 5, 6]
+    assert reader.dropped == 3
+
+    # The ring goes on after the overrun.
+    _push(writer, WM_MOUSEMOVE, 7)
+    assert [x for _, x, _ in _drain(reader)] == [7]
+    assert reader.dropped == 3
+
+
+def test_torn_slot_is_dropped(ring):
+    reader, writer = ring
+    for x in range(3):
+        _push(writer, WM_MOUSEMOVE, x)
+    # The host is rewriting the second slot: its sequence is reset while the record is copied.
+    reader._words[1 * reader._stride] = 0
+    assert [x for _, x, _ in _drain(reader)] == [0, 2]
+    assert reader.dropped == 1
+
+
+def test_slot_of_a_later_lap_is_dropped(ring):
+    reader, writer = ring
+    _push(writer, WM_MOUSEMOVE, 0)
+    # The slot already holds the record written one lap later.
+    reader._words[0] = 1 + reader.capacity
+    assert _drain(reader) == []
+    assert reader.dropped == 1
+
+
+def test_bell_rings_only_for_a_waiting_reader(ring):
+    reader, writer = ring
+    _push(writer, WM_MOUSEMOVE, 0)
+    assert writer.bells == []
+
+    reader.header.waiting = 1
+    _push(writer, WM_MOUSEMOVE, 1)
+    assert writer.bells == [1]
+    assert reader.header.waiting == 0
+
+    # Missed by the reader: rung again while records are pending.
+    reader.header.waiting = 1
+    writer.check_bell()
+    assert writer.bells == [1, 1]
+
+
+def test_grab_through_host(desktop):
+    desktop.click(900, 100)
+    assert wingrab.grab(input_backend='host', timeout=5) == 5678
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import inputs
+from wingrab.inputs import RawInput, get_input
+from wingrab.recorder import read_trace
+from wingrab.stream import stream
+
+
+def test_sources():
+    assert get_input('hook').can_swallow and get_input('host').can_swallow
+    assert not get_input('raw').can_swallow
+    # Only the hook of the application may be removed by the system.
+    assert [name for name, source in inputs.INPUTS.items() if source.may_be_removed] == ['hook']
+
+    source = RawInput(lambda wParam, lParam: None)
+    assert get_input(source) is source
+    with pytest.raises(ValueError, match='Unknown input backend'):
+        get_input('tablet')
+
+
+def test_source_from_the_environment(monkeypatch):
+    assert get_input().name == 'hook'
+    monkeypatch.setenv('WINGRAB_INPUT', 'raw')
+    assert get_input().name == 'raw'
+
+
+def test_raw_grab(desktop):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(wingrab_package.grab(input_backend='raw', timeout=5)))
+    thread.start()
+    assert desktop.wait_for_hook(5)
+    # The raw input is registered instead of a hook.
+    assert desktop._raw_inputs and not desktop._hooks
+    desktop.click(900, 100)
+    thread.join(5)
+
+    assert result == [5678]
+    assert not desktop._raw_inputs
+
+
+def test_raw_grab_from_the_environment(desktop, monkeypatch):
+    monkeypatch.setenv('WINGRAB_INPUT', 'raw')
+    desktop.click(100, 100)
+    assert wingrab_package.grab_many(1, timeout=5) == [1234]
+    assert desktop.hooks_lost == 0 and not desktop._hooks
+
+
+def test_raw_events_are_read_in_batches(desktop):
+    # The clicks queued before the registration are read by a single WM_INPUT message.
+    for x in (100, 900, 200):
+        desktop.click(x, 100)
+    assert wingrab_package.grab_many(3, input_backend='raw', timeout=5) == [1234, 5678, 1234]
+
+
+def test_raw_mask(desktop):
+    desktop.click(100, 100)
+    desktop.click(900, 100, 'right')
+    info = wingrab_package.grab(input_backend='raw', mask='right', detail=True, timeout=5)
+    assert (info.pid, info.point) == (5678, (900, 100))
+
+
+def test_raw_stream(desktop):
+    with stream(input_backend='raw') as windows:
+        events = iter(windows)
+        desktop.move_to(100, 100)
+        assert next(events).pid == 1234
+        desktop.move_to(900, 100)
+        assert next(events).pid == 5678
+    assert not desktop._raw_inputs
+
+
+def test_raw_recording(desktop, tmp_path):
+    path = str(tmp_path / 'raw.trace')
+    desktop.click(900, 100)
+    assert wingrab_package.grab(input_backend='raw', record=path, timeout=5) == 5678
+    assert [record.info.pt.x for record in read_trace(path)] == [900, 900, 900]
+
+
+def test_raw_input_survives_lost_hooks(desktop):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(wingrab_package.grab_many(1, input_backend='raw',
+                                                                                     timeout=5)))
+    thread.start()
+    assert desktop.wait_for_hook(5)
+    desktop.lose_hooks()
+    desktop.click(100, 100)
+    thread.join(5)
+    assert result == [[1234]]
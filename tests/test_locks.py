@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from wingrab import locks
+from wingrab.locks import AbstractSocketLock, FileLock, LockManager, get_lock_kind, set_lock_kind
+
+
+@pytest.fixture(autouse=True)
+def lock_kind(monkeypatch):
+    """ The default kind of lock, under a name which no real grab holds. """
+    monkeypatch.delenv('WINGRAB_LOCK', raising=False)
+    monkeypatch.setattr(locks, '_lock_kind', None)
+    monkeypatch.setattr(locks, 'LOCK_NAME', f'WinGrab-test-{os.getpid()}')
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return LockManager(str(tmp_path / 'WINGRAB.LOCKFILE'))
+
+
+def test_lock_kind(monkeypatch):
+    assert get_lock_kind() == 'named'
+    monkeypatch.setenv('WINGRAB_LOCK', 'file')
+    assert get_lock_kind() == 'file'
+    # The kind set by the application wins over the environment.
+    set_lock_kind('named')
+    assert get_lock_kind() == 'named'
+    set_lock_kind(None)
+    assert get_lock_kind() == 'file'
+
+    with pytest.raises(ValueError, match='Unknown lock kind'):
+        set_lock_kind('spin')
+    monkeypatch.setenv('WINGRAB_LOCK', 'spin')
+    with pytest.raises(ValueError, match='Unknown lock kind'):
+        get_lock_kind()
+
+
+def test_named_lock(desktop, manager):
+    assert manager.kind is None
+    assert manager.acquire(desktop)
+    assert manager.kind == 'named'
+    # Another grab of this process is turned away before any system call.
+    assert not manager.acquire(desktop)
+    manager.release()
+    assert manager.acquire(desktop)
+    manager.release()
+    assert (manager.acquired, manager.contended) == (2, 1)
+
+
+def test_held_by_another_process(desktop, manager):
+    other = AbstractSocketLock(locks.LOCK_NAME)
+    assert other.acquire()
+    try:
+        assert not manager.acquire(desktop)
+        # The in-process lock is left free.
+        assert manager._thread_lock.acquire(blocking=False)
+        manager._thread_lock.release()
+    finally:
+        other.release()
+    assert manager.acquire(desktop)
+    manager.release()
+
+
+def test_file_lock(desktop, manager):
+    set_lock_kind('file')
+    assert manager.acquire(desktop)
+    assert manager.kind == 'file'
+    assert os.path.exists(manager.file_path)
+
+    other = FileLock(manager.file_path, desktop.lock_file)
+    assert not other.acquire()
+
+    manager.release()
+    # The file is removed on release.
+    assert not os.path.exists(manager.file_path)
+    assert other.acquire()
+    other.release()
+
+
+def test_lock_file_error(desktop, tmp_path):
+    set_lock_kind('file')
+    manager = LockManager(str(tmp_path / 'missing' / 'WINGRAB.LOCKFILE'))
+    with pytest.raises(OSError):
+        manager.acquire(desktop)
+    # The in-process lock is not left held by the error.
+    assert manager._thread_lock.acquire(blocking=False)
+
+
+def test_fallback_to_the_file_lock(desktop, manager, monkeypatch):
+    monkeypatch.setattr(desktop, 'create_named_lock', lambda name: None)
+    assert manager.acquire(desktop)
+    assert manager.kind == 'file'
+    manager.release()
+
+
+def test_kind_change_applies_to_the_next_grab(desktop, manager):
+    assert manager.acquire(desktop)
+    named = manager._process_lock
+    manager.release()
+
+    set_lock_kind('file')
+    assert manager.acquire(desktop)
+    assert manager.kind == 'file'
+    manager.release()
+    # The previous lock has been closed, its name is free.
+    assert named.acquire()
+    named.release()
@@ -0,0 +1,125 @@
+import threading
+from ctypes import addressof
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.hookbuffer import EventRing
+from wingrab.masks import EventMask, as_mask
+from wingrab.winuser import (MSLLHOOKSTRUCT, VK_CONTROL, VK_LWIN, VK_RWIN, VK_SHIFT, WM_LBUTTONDOWN, WM_LBUTTONUP,
+                             WM_MOUSEMOVE, WM_RBUTTONDOWN, WM_RBUTTONUP)
+
+
+class Keyboard:
+    """ The backend reading the state of the modifier keys, see `EventMask.compile()`. """
+
+    def __init__(self, *keys):
+        self.keys = set(keys)
+
+    def is_key_down(self, vk):
+        return vk in self.keys
+
+
+def _compile(mask, keyboard, **kwargs):
+    ring = EventRing(16)
+    return ring, as_mask(mask).compile(ring, keyboard, **kwargs)
+
+
+def _send(table, wParam, x=10, y=20):
+    """ Hand an event to the dispatch table like the hook procedure, return whether it is swallowed. """
+    info = MSLLHOOKSTRUCT()
+    info.pt.x, info.pt.y = x, y
+    handler = table.get(wParam)
+    return handler is not None and handler(wParam, addressof(info))
+
+
+def _drain(ring):
+    events = []
+    ring.drain(lambda wParam, info, trigger: events.append((wParam, (info.pt.x, info.pt.y), trigger)))
+    return events
+
+
+def test_parse():
+    assert EventMask.parse('ctrl+right') == EventMask('right', modifiers=('ctrl',))
+    assert as_mask(None) == EventMask('left')
+    with pytest.raises(ValueError):
+        EventMask.parse('hyper+left')
+    with pytest.raises(TypeError):
+        as_mask(1)
+
+
+def test_click_is_swallowed_and_triggers():
+    ring, table = _compile('left', Keyboard())
+    assert WM_MOUSEMOVE not in table
+    assert _send(table, WM_LBUTTONDOWN)
+    assert _send(table, WM_LBUTTONUP, 30, 40)
+    assert _drain(ring) == [(WM_LBUTTONDOWN, (10, 20), False), (WM_LBUTTONUP, (30, 40), True)]
+
+
+def test_other_button_is_not_observed():
+    ring, table = _compile('left', Keyboard())
+    assert not _send(table, WM_RBUTTONDOWN)
+    assert not _send(table, WM_RBUTTONUP)
+    assert _drain(ring) == []
+
+
+def test_click_without_modifiers_goes_through():
+    keyboard = Keyboard()
+    ring, table = _compile('ctrl+shift+right', keyboard)
+    assert not _send(table, WM_RBUTTONDOWN)
+    assert not _send(table, WM_RBUTTONUP)
+
+    # One of the modifiers is not enough.
+    keyboard.keys.add(VK_CONTROL)
+    assert not _send(table, WM_RBUTTONDOWN)
+    assert not _send(table, WM_RBUTTONUP)
+    assert _drain(ring) == []
+
+    keyboard.keys.add(VK_SHIFT)
+    assert _send(table, WM_RBUTTONDOWN)
+    assert _send(table, WM_RBUTTONUP)
+    assert [trigger for _, _, trigger in _drain(ring)] == [False, True]
+
+
+def test_release_of_swallowed_press_is_swallowed():
+    keyboard = Keyboard(VK_CONTROL)
+    ring, table = _compile('ctrl+left', keyboard)
+    assert _send(table, WM_LBUTTONDOWN)
+    # The window never sees the press, so it must not see the release either.
+    keyboard.keys.clear()
+    assert _send(table, WM_LBUTTONUP)
+    assert _drain(ring)[-1][2]
+
+
+def test_release_without_press_goes_through():
+    ring, table = _compile('left', Keyboard())
+    assert not _send(table, WM_LBUTTONUP)
+    assert _drain(ring) == []
+
+
+@pytest.mark.parametrize('vk', [VK_LWIN, VK_RWIN])
+def test_either_win_key(vk):
+    ring, table = _compile('win+left', Keyboard(vk))
+    assert _send(table, WM_LBUTTONDOWN)
+
+
+def test_observe_all_passes_other_events():
+    ring, table = _compile('ctrl+left', Keyboard(), observe_all=True)
+    assert not _send(table, WM_MOUSEMOVE)
+    assert not _send(table, WM_LBUTTONDOWN)
+    assert [(wParam, trigger) for wParam, _, trigger in _drain(ring)] == [(WM_MOUSEMOVE, False),
+                                                                         (WM_LBUTTONDOWN, False)]
+
+
+def test_grab_with_modifiers(desktop):
+    result = []
+    grabber = threading.Thread(target=lambda: result.append(wingrab.grab(mask='ctrl+right', timeout=5)))
+    grabber.start()
+    assert desktop.wait_for_hook(5)
+    # Without ctrl, the click goes to the window.
+    desktop.click(100, 100, 'right')
+    desktop.press_key(VK_CONTROL)
+    desktop.click(900, 100, 'right')
+    desktop.release_key(VK_CONTROL)
+    grabber.join(5)
+    assert result == [5678]
@@ -0,0 +1,137 @@
+import json
+import time
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import metrics
+from wingrab.metrics import COUNTERS, PHASES, JSONLSink, OpenMetricsSink, SessionMetrics
+from wingrab.stream import stream
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def sessions():
+    """ The metrics of the sessions, in the order they end. """
+    sessions = []
+    metrics.add_sink(sessions.append)
+    try:
+        yield sessions
+    finally:
+        metrics.remove_sink(sessions.append)
+
+
+def test_nothing_is_measured_without_sink():
+    assert metrics.start('grab') is None
+    sink = metrics.add_sink(lambda session: None)
+    try:
+        assert isinstance(metrics.start('grab'), SessionMetrics)
+    finally:
+        metrics.remove_sink(sink)
+    assert metrics.start('grab') is None
+
+
+def test_grab(desktop, sessions):
+    desktop.click(900, 100)
+    assert wingrab_package.grab(timeout=5) == 5678
+    _wait_until(lambda: sessions)
+
+    session, = sessions
+    assert (session.kind, session.outcome) == ('grab', 'grabbed')
+    assert set(session.phases) == set(PHASES) and set(session.counters) == set(COUNTERS)
+    # The moves are left out by the mask of the grab.
+    assert (session.counters['events'], session.counters['moves'], session.counters['clicks']) == (2, 0, 1)
+    assert all(seconds >= 0 for seconds in session.phases.values())
+    assert session.phases['total'] >= session.phases['wait'] > 0
+    assert session.phases['queue'] > 0
+
+
+def test_outcomes(desktop, sessions, tmp_path):
+    desktop.click(100, 100)
+    wingrab_package.grab_many(1, timeout=5)
+    # The timeout ends a batch like the caller would, with the windows grabbed so far.
+    wingrab_package.grab_many(timeout=0.05)
+    with pytest.raises(TimeoutError):
+        # A recording grab runs its own session.
+        wingrab_package.grab(record=str(tmp_path / 'grab.trace'), timeout=0.05)
+    token = wingrab_package.CancellationToken()
+    token.cancel()
+    with pytest.raises(wingrab_package.GrabCancelled):
+        # Cancelled before it starts, no session
+        wingrab_package.grab_many(token=token)
+    _wait_until(lambda: len(sessions) == 3)
+    assert [(session.kind, session.outcome) for session in sessions] == [
+        ('grab_many', 'grabbed'), ('grab_many', 'stopped'), ('grab', 'timeout'),
+    ]
+
+
+def test_stream_counts_the_coalesced_moves(desktop, sessions):
+    with stream() as windows:
+        for x in range(10, 110, 10):
+            desktop.move_to(x, 100)
+        _wait_until(lambda: windows.stats['moves_seen'] == 10)
+        next(iter(windows))
+    _wait_until(lambda: sessions)
+    session, = sessions
+    assert session.kind == 'stream'
+    assert (session.counters['moves'], session.counters['coalesced']) == (10, 9)
+
+
+def test_failing_sink_does_not_fail_the_grab(desktop, sessions):
+    def sink(session):
+        raise RuntimeError('full disk')
+
+    metrics.add_sink(sink)
+    try:
+        desktop.click(100, 100)
+        with pytest.warns(RuntimeWarning, match='full disk'):
+            assert wingrab_package.grab_many(1, timeout=5) == [1234]
+    finally:
+        metrics.remove_sink(sink)
+    # The other sinks still get the metrics.
+    assert len(sessions) == 1
+
+
+def test_jsonl_sink(tmp_path):
+    path = str(tmp_path / 'grabs.jsonl')
+    sink = JSONLSink(path)
+    for outcome in ('grabbed', 'timeout'):
+        session = SessionMetrics('grab')
+        session.outcome = outcome
+        session.add_time('wait', 0.5)
+        sink(session)
+
+    with open(path, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['outcome'] for line in lines] == ['grabbed', 'timeout']
+    assert lines[0]['phases']['wait'] == 0.5
+    assert lines[0]['counters'] == dict.fromkeys(COUNTERS, 0)
+
+
+def test_openmetrics_sink(tmp_path):
+    sink = OpenMetricsSink()
+    for outcome in ('grabbed', 'grabbed', 'timeout'):
+        session = SessionMetrics('grab')
+        session.outcome = outcome
+        session.add_time('wait', 0.25)
+        session.counters['clicks'] = 1
+        sink(session)
+
+    text = sink.render()
+    assert text.endswith('# EOF\n')
+    lines = text.splitlines()
+    assert 'wingrab_sessions_total{kind="grab",outcome="grabbed"} 2' in lines
+    assert 'wingrab_sessions_total{kind="grab",outcome="timeout"} 1' in lines
+    assert 'wingrab_phase_seconds_sum{kind="grab",phase="wait"} 0.75' in lines
+    assert 'wingrab_phase_seconds_count{kind="grab",phase="wait"} 3' in lines
+    assert 'wingrab_mouse_events_total{kind="grab",type="clicks"} 3' in lines
+
+    path = tmp_path / 'wingrab.prom'
+    sink.dump(str(path))
+    assert path.read_text(encoding='utf-8') == text
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from wingrab.msgloop import FakeMessageQueue, run_message_loop
+
+
+def _run_in_thread(queue, is_finished, **kwargs):
+    """ Run the loop on its own thread, like the thread of a hook. :return: The thread, and the list of its result. """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(run_message_loop(queue, is_finished, **kwargs)))
+    thread.start()
+    return thread, result
+
+
+def test_loop_blocks_without_spinning():
+    queue = FakeMessageQueue()
+    stop = threading.Event()
+    thread, result = _run_in_thread(queue, stop.is_set, poll_interval=0.05)
+    time.sleep(0.3)
+    stop.set()
+    queue.wake()
+    thread.join(5)
+
+    assert result == [True]
+    # About one wait per poll interval, a busy loop would wait thousands of times.
+    assert queue.wait_count <= 0.3 / 0.05 + 3
+    assert queue.dispatch_count == 0
+
+
+def test_message_ends_the_wait():
+    queue = FakeMessageQueue()
+    dispatched = []
+    thread, result = _run_in_thread(queue, lambda: bool(dispatched), poll_interval=None)
+    # Without a poll interval, only the message can wake the loop up.
+    started = time.monotonic()
+    queue.post(dispatched.append, 'message')
+    thread.join(5)
+
+    assert result == [True]
+    assert dispatched == ['message']
+    assert time.monotonic() - started < 1
+    assert queue.dispatch_count == 1
+
+
+def test_wake_ends_the_wait():
+    queue = FakeMessageQueue()
+    stop = threading.Event()
+    thread, result = _run_in_thread(queue, stop.is_set, poll_interval=None)
+    time.sleep(0.05)
+    stop.set()
+    queue.wake()
+    thread.join(5)
+
+    assert result == [True]
+    assert not thread.is_alive()
+    assert queue.dispatch_count == 0
+
+
+def test_messages_are_dispatched_on_the_loop_thread():
+    queue = FakeMessageQueue()
+    threads = []
+    queue.post(lambda: threads.append(threading.current_thread()))
+    queue.post(lambda: threads.append(threading.current_thread()))
+    thread, result = _run_in_thread(queue, lambda: len(threads) == 2, poll_interval=None)
+    thread.join(5)
+    assert threads == [thread, thread]
+
+
+def test_deadline():
+    queue = FakeMessageQueue()
+    started = time.monotonic()
+    assert run_message_loop(queue, lambda: False, poll_interval=10, deadline=started + 0.1)
+    elapsed = time.monotonic() - started
+    # The wait is shortened to the deadline instead of the poll interval.
+    assert 0.1 <= elapsed < 1
+    assert queue.wait_count <= 2
+
+
+def test_deadline_already_passed():
+    queue = FakeMessageQueue()
+    assert run_message_loop(queue, lambda: False, deadline=time.monotonic() - 1)
+    assert queue.wait_count == 0
+
+
+def test_quit_ends_the_loop():
+    queue = FakeMessageQueue()
+    dispatched = []
+    queue.post(dispatched.append, 1)
+    queue.post_quit()
+    queue.post(dispatched.append, 2)
+
+    assert run_message_loop(queue, lambda: False, poll_interval=None) is False
+    assert dispatched == [1]
+
+
+def test_finished_loop_does_not_wait():
+    queue = FakeMessageQueue()
+    assert run_message_loop(queue, lambda: True)
+    assert queue.wait_count == 0
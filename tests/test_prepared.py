@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import wingrab
+from wingrab.scheduler import CancellationToken, GrabCancelled
+
+
+def _images(desktop):
+    return {desktop.system_cursor_image(cursor_id) for cursor_id in wingrab._standard_cursor_ids}
+
+
+def _are_cursors_restored(desktop):
+    return all(desktop.system_cursor_image(cursor_id) == f'default:{cursor_id}'
+               for cursor_id in wingrab._standard_cursor_ids)
+
+
+@pytest.mark.parametrize('input_backend', ['hook', 'raw', 'host'])
+def test_activate_wait_cycle(desktop, input_backend):
+    with wingrab_package.prepare(input_backend=input_backend) as picker:
+        # Prepared, but nothing shows yet.
+        assert not picker.active
+        assert _are_cursors_restored(desktop)
+
+        for x, pid in ((100, 1234), (900, 5678)):
+            picker.activate()
+            assert picker.active
+            assert _images(desktop) == {'resource'}
+            desktop.click(x, 100)
+            assert picker.wait(timeout=5) == pid
+            assert not picker.active
+            assert _are_cursors_restored(desktop)
+
+        assert picker.stats['grabbed'] == 2
+        assert picker.activation_latency.percentiles()['count'] == 2
+    assert picker.closed
+
+
+def test_wait_timeout(desktop):
+    with wingrab_package.prepare() as picker:
+        picker.activate()
+        with pytest.raises(TimeoutError):
+            picker.wait(timeout=0.05)
+        assert not picker.active
+        assert _are_cursors_restored(desktop)
+
+        # Ready for the next activation.
+        picker.activate()
+        desktop.click(100, 100)
+        assert picker.wait(timeout=5) == 1234
+
+
+def test_cancel(desktop):
+    with wingrab_package.prepare() as picker:
+        picker.activate()
+        threading.Timer(0.05, picker.cancel).start()
+        with pytest.raises(GrabCancelled):
+            picker.wait(timeout=5)
+        assert _are_cursors_restored(desktop)
+
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        with pytest.raises(GrabCancelled):
+            picker.grab(timeout=5, token=token)
+        assert not picker.active
+
+        # The cancelled token is forgotten by the next activation.
+        picker.activate()
+        desktop.click(900, 100)
+        assert picker.wait(timeout=5) == 5678
+
+
+def test_misuse(desktop):
+    with wingrab_package.prepare() as picker:
+        with pytest.raises(RuntimeError):
+            picker.wait(timeout=5)
+        picker.activate()
+        with pytest.raises(RuntimeError):
+            picker.activate()
+        picker.cancel()
+        with pytest.raises(GrabCancelled):
+            picker.wait(timeout=5)
+    with pytest.raises(RuntimeError):
+        picker.activate()
+
+
+def test_close_while_active(desktop):
+    picker = wingrab_package.prepare()
+    picker.activate()
+    threading.Timer(0.05, picker.close).start()
+    assert picker.wait(timeout=5) == -1
+    assert picker.closed
+    assert _are_cursors_restored(desktop)
+    assert not desktop._hooks
+
+
+def test_other_grabs_wait_for_the_prepared_grab(desktop):
+    with wingrab_package.prepare() as picker:
+        with pytest.raises(TimeoutError):
+            wingrab.grab(timeout=0.05)
+        with pytest.raises(TimeoutError):
+            wingrab_package.prepare(timeout=0.05)
+        assert picker.active is False
+
+    desktop.click(100, 100)
+    assert wingrab.grab(timeout=5) == 1234
+
+
+def test_detail(desktop):
+    with wingrab_package.prepare(detail=True, mask='right') as picker:
+        picker.activate()
+        desktop.click(900, 100, 'right')
+        info = picker.wait(timeout=5)
+    assert info.pid == 5678
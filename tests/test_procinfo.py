@@ -0,0 +1,98 @@
+import pytest
+
+import wingrab as wingrab_package
+from wingrab.procinfo import ProcessCache, describe_window, process_cache
+
+
+@pytest.fixture
+def cache():
+    return ProcessCache(maxsize=2)
+
+
+def test_describe_window(desktop, cache):
+    desktop.create_process(1234, 'C:\\Program Files\\App\\app.exe')
+    owner = desktop.windows[0]
+    dialog = desktop.create_window((100, 100, 500, 400), pid=1234, tid=7, owner=owner, title='Save',
+                                   class_name='#32770')
+    button = desktop.create_window((300, 300, 400, 350), pid=1234, tid=7, parent=dialog, class_name='Button')
+
+    info = describe_window(desktop, (350, 320), cache=cache)
+    assert (info.pid, info.hwnd, info.root_hwnd, info.owner_hwnd) == (1234, button.hwnd, dialog.hwnd, owner.hwnd)
+    assert (info.thread_id, info.class_name, info.title) == (7, 'Button', '')
+    assert (info.rect, info.point) == ((300, 300, 400, 350), (350, 320))
+    assert (info.process.exe_path, info.process.name) == ('C:\\Program Files\\App\\app.exe', 'app.exe')
+
+
+def test_describe_nothing(desktop, cache):
+    info = describe_window(desktop, (5000, 5000), cache=cache)
+    assert (info.pid, info.hwnd, info.root_hwnd, info.rect, info.process) == (0, None, None, None, None)
+    assert info.point == (5000, 5000)
+
+
+def test_inaccessible_process(desktop, cache):
+    # No process behind the window, like a process of another user.
+    info = describe_window(desktop, (100, 100), cache=cache)
+    assert info.process == (1234, None, None, None)
+    # Without a start time the entry is not cached.
+    describe_window(desktop, (100, 100), cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_cache_hits(desktop, cache):
+    desktop.create_process(1234, 'C:\\app.exe')
+    for _ in range(3):
+        assert cache.get(desktop, 1234).name == 'app.exe'
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert desktop.process_queries == 1
+
+
+def test_reused_pid(desktop, cache):
+    desktop.create_process(1234, 'C:\\old.exe')
+    assert cache.get(desktop, 1234).name == 'old.exe'
+    desktop.terminate_process(1234)
+    desktop.create_process(1234, 'C:\\new.exe')
+    # Another start time, the cached entry is stale.
+    assert cache.get(desktop, 1234).name == 'new.exe'
+    assert cache.misses == 2
+
+
+def test_cache_is_bounded(desktop, cache):
+    for pid in (1, 2, 3):
+        desktop.create_process(pid, f'C:\\{pid}.exe')
+    cache.get(desktop, 1)
+    cache.get(desktop, 2)
+    # 1 is the most recently used one now, 2 is evicted.
+    cache.get(desktop, 1)
+    cache.get(desktop, 3)
+    assert list(cache._entries) == [1, 3]
+    cache.get(desktop, 2)
+    assert cache.misses == 4
+
+
+def test_cache_of_another_backend(desktop, cache):
+    desktop.create_process(1234, 'C:\\app.exe')
+    cache.get(desktop, 1234)
+
+    other = type(desktop)()
+    other.create_process(1234, 'C:\\other.exe')
+    assert cache.get(other, 1234).name == 'other.exe'
+    assert list(cache._entries) == [1234]
+
+
+def test_cache_clear(desktop, cache):
+    desktop.create_process(1234, 'C:\\app.exe')
+    cache.get(desktop, 1234)
+    cache.get(desktop, 1234)
+    cache.clear()
+    assert (cache.hits, cache.misses) == (0, 0)
+    cache.get(desktop, 1234)
+    assert desktop.process_queries == 2
+
+
+def test_grab_detail(desktop):
+    process_cache.clear()
+    desktop.create_process(5678, 'C:\\Windows\\notepad.exe')
+    desktop.click(900, 100)
+    info = wingrab_package.grab(detail=True, timeout=5)
+    assert (info.pid, info.point, info.process.name) == (5678, (900, 100), 'notepad.exe')
+    assert info.hwnd == info.root_hwnd == desktop.window_from_point(900, 100)
@@ -0,0 +1,115 @@
+import os
+import time
+from ctypes import addressof
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab.backends import set_backend
+from wingrab.backends.simulated import SimulatedBackend
+from wingrab.recorder import EventRecorder, TraceRecord, read_trace, replay
+from wingrab.winuser import HC_ACTION, MSLLHOOKSTRUCT, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_MOUSEMOVE
+
+
+def _record(wParam, x, y, time_ms=0):
+    record = TraceRecord()
+    record.wParam = wParam
+    record.info.pt.x, record.info.pt.y = x, y
+    record.info.time = time_ms
+    return record
+
+
+def _push(recorder, wParam, x, y):
+    info = MSLLHOOKSTRUCT()
+    info.pt.x, info.pt.y = x, y
+    recorder.push(wParam, addressof(info))
+
+
+def test_grab_records_the_events(desktop, tmp_path):
+    path = str(tmp_path / 'grab.trace')
+    desktop.click(900, 100)
+    assert wingrab_package.grab(record=path, timeout=5) == 5678
+
+    records = read_trace(path)
+    assert [(record.wParam, record.info.pt.x, record.info.pt.y) for record in records] == [
+        (WM_MOUSEMOVE, 900, 100), (WM_LBUTTONDOWN, 900, 100), (WM_LBUTTONUP, 900, 100),
+    ]
+
+
+def test_replay_into_another_desktop(desktop, tmp_path):
+    path = str(tmp_path / 'grab.trace')
+    desktop.click(100, 100)
+    assert wingrab_package.grab(record=path, timeout=5) == 1234
+
+    # The same scenario on a desktop whose windows are swapped
+    other = set_backend(SimulatedBackend())
+    other.create_window((0, 0, 800, 600), pid=8765)
+    assert replay(path, other, speed=None) == 3
+    assert wingrab_package.grab(timeout=5) == 8765
+
+
+def test_open_recorder_is_left_open(desktop, tmp_path):
+    with EventRecorder(str(tmp_path / 'grab.trace')) as recorder:
+        for x in (100, 900):
+            desktop.click(x, 100)
+            wingrab_package.grab(record=recorder, timeout=5)
+        assert not recorder.closed
+        assert recorder.count == 6
+    assert recorder.closed
+    assert len(read_trace(recorder.path)) == 6
+
+
+def test_ring_wraps_around(tmp_path):
+    path = str(tmp_path / 'ring.trace')
+    with EventRecorder(path, capacity=3) as recorder:
+        for x in range(5):
+            _push(recorder, WM_MOUSEMOVE, x, 0)
+    # The oldest records have been overwritten, the others are read in order.
+    assert [record.info.pt.x for record in read_trace(path)] == [2, 3, 4]
+
+
+def test_trace_is_readable_before_close(tmp_path):
+    path = str(tmp_path / 'live.trace')
+    recorder = EventRecorder(path, capacity=16)
+    try:
+        _push(recorder, WM_LBUTTONDOWN, 1, 2)
+        # The count in the header is up to date, so the trace of a stuck grab can be read.
+        assert [(record.wParam, record.info.pt.x) for record in read_trace(path)] == [(WM_LBUTTONDOWN, 1)]
+    finally:
+        recorder.close()
+    # The file is shrunk to the records written.
+    assert len(read_trace(path)) == 1
+    assert os.path.getsize(path) < 16 * len(bytes(TraceRecord()))
+
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 4)
+    with pytest.raises(ValueError, match='not a WinGrab trace'):
+        read_trace(str(path))
+    path.write_bytes(b'NOTTRACE' + b'\0' * 64)
+    with pytest.raises(ValueError, match='not a WinGrab trace'):
+        read_trace(str(path))
+
+
+def test_replay_into_a_hook_procedure():
+    calls = []
+
+    def proc(nCode, wParam, lParam):
+        info = MSLLHOOKSTRUCT.from_address(lParam)
+        calls.append((nCode, wParam, info.pt.x, info.pt.y))
+
+    trace = [_record(WM_MOUSEMOVE, 10, 20), _record(WM_LBUTTONDOWN, 10, 20), _record(WM_LBUTTONUP, 10, 20)]
+    assert replay(trace, proc, speed=None) == 3
+    assert calls == [(HC_ACTION, WM_MOUSEMOVE, 10, 20), (HC_ACTION, WM_LBUTTONDOWN, 10, 20),
+                     (HC_ACTION, WM_LBUTTONUP, 10, 20)]
+
+
+def test_replay_speed():
+    # 200 ms apart, replayed ten times faster
+    trace = [_record(WM_MOUSEMOVE, 0, 0, 0xFFFFFF9C), _record(WM_MOUSEMOVE, 1, 0, 100)]
+    started = time.perf_counter()
+    replay(trace, lambda *args: None, speed=10)
+    # The millisecond counter wrapped around between the events.
+    assert 0.02 <= time.perf_counter() - started < 1
+    assert replay([], lambda *args: None) == 0
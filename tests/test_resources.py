@@ -0,0 +1,113 @@
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import wingrab
+from wingrab.hittest import WindowIndex
+from wingrab.resources import ResourceTracker, tracker
+from wingrab.scheduler import CancellationToken, GrabCancelled
+from wingrab.stream import stream
+
+
+def test_add_and_discard():
+    resources = ResourceTracker()
+    assert resources.add('hook', 1, print) == 1
+    resources.add('hook', 2, print)
+    resources.add('cursor', 3, print)
+    # A null handle is a failed creation.
+    assert resources.add('cursor', 0, print) == 0
+    assert resources.counts() == {'hook': 2, 'cursor': 1}
+    assert resources.total() == 3
+
+    assert resources.discard('hook', 1)
+    assert not resources.discard('hook', 1)
+    assert not resources.discard('mutex', 1)
+    assert resources.counts() == {'hook': 1, 'cursor': 1}
+    assert resources.stats == {'live': {'hook': 1, 'cursor': 1}, 'created': {'hook': 2, 'cursor': 1},
+                               'released': {'hook': 1}}
+
+
+def test_add_again_replaces_the_release():
+    resources = ResourceTracker()
+    released = []
+    resources.add('cursor', 1, print)
+    resources.add('cursor', 1, released.append)
+    assert resources.created == {'cursor': 1}
+    assert resources.release_all() == 1
+    assert released == [1]
+
+
+def test_release_all():
+    resources = ResourceTracker()
+    released = []
+    resources.add('hook', 1, released.append)
+    resources.add('cursor', 2, released.append)
+    assert resources.release_all(kinds=('cursor',)) == 1
+    assert released == [2]
+    assert resources.counts() == {'hook': 1}
+    assert resources.release_all() == 1
+    assert resources.total() == 0
+
+
+def test_failing_release():
+    resources = ResourceTracker()
+
+    def release(handle):
+        raise OSError('invalid handle')
+
+    resources.add('cursor', 1, release)
+    with pytest.warns(RuntimeWarning, match='invalid handle'):
+        assert resources.release_all() == 0
+    # Forgotten anyway, it would fail again.
+    assert resources.total() == 0
+
+
+def _cursors():
+    return tracker.counts().get('cursor', 0)
+
+
+def test_grabs_do_not_leak(desktop):
+    cursors = _cursors()
+    desktop.click(100, 100)
+    wingrab_package.grab(timeout=5)
+    # The grab cursor is kept in the cache between the grabs.
+    live = tracker.counts()
+    assert live.get('cursor') == cursors + 1
+
+    for _ in range(3):
+        desktop.click(900, 100)
+        wingrab_package.grab(timeout=5)
+        desktop.click(900, 100)
+        wingrab_package.grab_many(1, input_backend='raw', timeout=5)
+        with pytest.raises(TimeoutError):
+            wingrab_package.grab(timeout=0.02)
+        token = CancellationToken()
+        token.cancel()
+        with pytest.raises(GrabCancelled):
+            wingrab_package.grab_many(token=token)
+        with stream(hit_test_cache=True) as windows:
+            desktop.move_to(100, 100)
+            next(windows)
+        with wingrab_package.prepare() as picker:
+            picker.activate()
+            desktop.click(100, 100)
+            picker.wait(timeout=5)
+        assert tracker.counts() == live
+
+
+def test_index_releases_its_hook(desktop):
+    hooks = tracker.counts().get('window_event_hook', 0)
+    index = WindowIndex()
+    index.attach(desktop)
+    assert tracker.counts().get('window_event_hook') == hooks + 1
+    index.detach()
+    assert tracker.counts().get('window_event_hook', 0) == hooks
+
+
+def test_cursor_cache_clear_releases_the_cursor(desktop):
+    cursors = _cursors()
+    desktop.click(100, 100)
+    wingrab_package.grab(timeout=5)
+    assert _cursors() == cursors + 1
+    wingrab.cursor_cache.clear()
+    assert _cursors() == cursors
+    assert not desktop.cursor_handles - set(desktop.system_cursors.values())
@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.scheduler import CancellationToken, GrabCancelled, GrabRequest, Scheduler
+
+
+class FakeRunner:
+    """ Serves every batch at once, recording the masks of the batches and the sizes. """
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, batch):
+        self.batches.append((batch.mask, len(batch.requests)))
+        return len(self.batches), None
+
+
+@pytest.fixture
+def runner():
+    return FakeRunner()
+
+
+@pytest.fixture
+def scheduler(runner):
+    return Scheduler(runner, acquire=lambda: True, release=lambda: None, poll_interval=0.01)
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.005)
+
+
+def _are_cursors_restored(desktop):
+    return all(desktop.system_cursor_image(cursor_id) == f'default:{cursor_id}'
+               for cursor_id in wingrab._standard_cursor_ids)
+
+
+def test_requests_for_the_same_click_share_a_batch(scheduler, runner):
+    with scheduler.turn():
+        requests = [scheduler.submit(GrabRequest()) for _ in range(3)]
+    for request in requests:
+        assert request.wait(5)
+    assert [request.result for request in requests] == [1, 1, 1]
+    assert runner.batches == [(None, 3)]
+    assert scheduler.stats['coalesced'] == 2
+    assert scheduler.stats['batches'] == 1
+
+
+def test_requests_for_another_click_wait_for_the_next_batch(scheduler, runner):
+    with scheduler.turn():
+        left = scheduler.submit(GrabRequest(mask='left'))
+        right = scheduler.submit(GrabRequest(mask='right'))
+    assert left.wait(5) and right.wait(5)
+    assert runner.batches == [('left', 1), ('right', 1)]
+
+
+def test_highest_priority_is_served_first(scheduler, runner):
+    with scheduler.turn():
+        low = scheduler.submit(GrabRequest(mask='left'))
+        high = scheduler.submit(GrabRequest(mask='right', priority=5))
+    assert low.wait(5) and high.wait(5)
+    assert runner.batches == [('right', 1), ('left', 1)]
+    assert (high.result, low.result) == (1, 2)
+
+
+def test_turns_are_given_by_priority(scheduler):
+    order = []
+    waiters = []
+
+    def wait_turn(name, priority):
+        with scheduler.turn(priority=priority):
+            order.append(name)
+
+    with scheduler.turn():
+        for name, priority in (('low', 0), ('high', 5), ('middle', 1)):
+            waiter = threading.Thread(target=wait_turn, args=(name, priority))
+            waiter.start()
+            waiters.append(waiter)
+            _wait_until(lambda: len(scheduler._turns) == len(waiters))
+    for waiter in waiters:
+        waiter.join(5)
+    assert order == ['high', 'middle', 'low']
+
+
+def test_turn_timeout(scheduler):
+    with scheduler.turn():
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            with scheduler.turn(timeout=0.05):
+                pass
+        assert time.monotonic() - started < 1
+    # The timed out turn has left the queue.
+    with scheduler.turn(timeout=1):
+        pass
+
+
+def test_turn_cancelled_by_token(scheduler):
+    token = CancellationToken()
+    with scheduler.turn():
+        threading.Timer(0.05, token.cancel).start()
+        with pytest.raises(GrabCancelled):
+            with scheduler.turn(token=token):
+                pass
+
+
+def test_cancel_queued_request(scheduler, runner):
+    with scheduler.turn():
+        request = scheduler.submit(GrabRequest())
+        assert request.cancel()
+    assert isinstance(request.error, GrabCancelled)
+    assert not request.cancel()
+
+    # Nothing has been run for the cancelled request, the next one is served.
+    assert scheduler.submit(GrabRequest()).wait(5)
+    assert runner.batches == [(None, 1)]
+
+
+def test_interrupt(scheduler):
+    with scheduler.turn():
+        request = scheduler.submit(GrabRequest())
+        scheduler.interrupt()
+    assert request.wait(5)
+    assert (request.result, request.error) == (-1, None)
+
+
+def test_failing_callback_does_not_stop_the_dispatcher(scheduler):
+    request = GrabRequest()
+
+    def fail(_request):
+        raise ValueError('callback')
+
+    request.add_done_callback(fail)
+    with pytest.warns(RuntimeWarning, match='callback'):
+        scheduler.submit(request)
+        assert request.wait(5)
+        # The warning is raised on the dispatcher thread once the request is done.
+        _wait_until(lambda: scheduler._batch is None and not scheduler._is_busy)
+    assert request.result == 1
+    assert scheduler.submit(GrabRequest()).wait(5)
+
+
+def test_failing_lock_only_fails_the_waiting_requests(runner):
+    failures = [OSError('lock')]
+
+    def acquire():
+        if failures:
+            raise failures.pop()
+        return True
+
+    scheduler = Scheduler(runner, acquire=acquire, release=lambda: None, poll_interval=0.01)
+    failed = scheduler.submit(GrabRequest())
+    assert failed.wait(5)
+    assert isinstance(failed.error, OSError)
+
+    served = scheduler.submit(GrabRequest())
+    assert served.wait(5)
+    assert (served.result, served.error) == (1, None)
+
+
+def test_concurrent_grabs_share_the_click(desktop):
+    stats = wingrab.scheduler.stats
+    results = []
+    grabbers = [threading.Thread(target=lambda: results.append(wingrab.grab(timeout=5))) for _ in range(2)]
+    for grabber in grabbers:
+        grabber.start()
+    _wait_until(lambda: wingrab.scheduler.stats['submitted'] == stats['submitted'] + 2)
+    assert desktop.wait_for_hook(5)
+    desktop.click(100, 100)
+    for grabber in grabbers:
+        grabber.join(5)
+
+    assert results == [1234, 1234]
+    assert wingrab.scheduler.stats['batches'] == stats['batches'] + 1
+    assert wingrab.scheduler.stats['coalesced'] == stats['coalesced'] + 1
+
+
+def test_grab_timeout(desktop):
+    with pytest.raises(TimeoutError):
+        wingrab.grab(timeout=0.05)
+    # The hook has been removed and the cursors restored.
+    assert not desktop._hooks
+    assert _are_cursors_restored(desktop)
+
+    desktop.click(900, 100)
+    assert wingrab.grab(timeout=5) == 5678
+
+
+def test_grab_cancelled(desktop):
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(GrabCancelled):
+        wingrab.grab(token=token, timeout=5)
+    assert not desktop._hooks
+    assert _are_cursors_restored(desktop)
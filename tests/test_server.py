@@ -0,0 +1,105 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from wingrab import wingrab
+from wingrab.server import GrabServer, ServerError, request
+
+
+@pytest.fixture
+def server(desktop):
+    server = GrabServer('127.0.0.1:0')
+    server.warm_up()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
+
+
+def _address(server):
+    host, port = server.server_address
+    return f'{host}:{port}'
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.005)
+
+
+def test_warm_up_loads_the_cursor(server):
+    assert wingrab.cursor_cache.stats['loads'] >= 1
+    loads = wingrab.cursor_cache.stats['loads']
+    server.warm_up()
+    assert wingrab.cursor_cache.stats['loads'] == loads
+
+
+def test_ping_and_stats(server):
+    address = _address(server)
+    assert request('ping', address=address, timeout=5) == 'pong'
+    stats = request('stats', address=address, timeout=5)
+    assert stats['served'] == 0
+    assert 'scheduler' in stats and 'hook' in stats
+
+
+def test_grab(server, desktop):
+    address = _address(server)
+    desktop.click(900, 100)
+    assert request('grab', {'timeout': 5}, address=address, timeout=10) == 5678
+
+    desktop.click(100, 100, 'right')
+    info = request('grab', {'timeout': 5, 'detail': True, 'mask': 'right'}, address=address, timeout=10)
+    assert info['pid'] == 1234
+    assert request('stats', address=address, timeout=5)['served'] == 2
+
+
+def test_timeout(server):
+    with pytest.raises(TimeoutError):
+        request('grab', {'timeout': 0.05}, address=_address(server), timeout=10)
+
+
+def test_cancelled(server, monkeypatch):
+    def grab(**kwargs):
+        raise wingrab.GrabCancelled('The grab has been cancelled.')
+
+    monkeypatch.setattr(wingrab, 'grab', grab)
+    with pytest.raises(wingrab.GrabCancelled):
+        request('grab', address=_address(server), timeout=10)
+
+
+def test_unknown_method(server):
+    with pytest.raises(ServerError, match='Unknown method'):
+        request('explode', address=_address(server), timeout=5)
+
+
+def test_no_server():
+    with socket.socket() as sock:
+        # A port nobody listens on
+        sock.bind(('127.0.0.1', 0))
+        host, port = sock.getsockname()
+    with pytest.raises(ConnectionError):
+        request('ping', address=f'{host}:{port}', timeout=5)
+
+
+def test_disconnect_cancels_the_grab(server, desktop):
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        sock.sendall(json.dumps({'id': 1, 'method': 'grab', 'params': {'timeout': 30}}).encode() + b'\n')
+        assert desktop.wait_for_hook(5)
+        assert server.waiting == 1
+
+    _wait_until(lambda: server.waiting == 0 and not desktop._hooks)
+    assert server.served == 0
+    assert all(desktop.system_cursor_image(cursor_id) == f'default:{cursor_id}'
+               for cursor_id in wingrab._standard_cursor_ids)
+
+    # The server goes on with the next client.
+    desktop.click(100, 100)
+    assert request('grab', {'timeout': 5}, address=_address(server), timeout=10) == 1234
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import wingrab
+from wingrab.scheduler import CancellationToken, GrabCancelled
+from wingrab.stream import stream
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.005)
+
+
+def test_hover_and_clicks(desktop):
+    with stream() as windows:
+        events = iter(windows)
+        desktop.move_to(100, 100)
+        event = next(events)
+        assert (event.pid, event.point, event.clicked) == (1234, (100, 100), False)
+        assert event.hwnd == desktop.window_from_point(100, 100)
+
+        desktop.click(900, 100)
+        # The move to the clicked point and the click, the click first if both are waiting
+        seen = [next(events), next(events)]
+        assert sorted((event.pid, event.clicked) for event in seen) == [(5678, False), (5678, True)]
+
+
+def test_moves_are_coalesced(desktop):
+    with stream() as windows:
+        for x in range(10, 110, 10):
+            desktop.move_to(x, 100)
+        _wait_until(lambda: windows.stats['moves_seen'] == 10)
+        # A slow consumer only gets the latest position.
+        assert next(iter(windows)).point == (100, 100)
+        assert windows.stats['moves_coalesced'] == 9
+
+
+def test_clicks_are_queued_before_the_moves(desktop):
+    with stream() as windows:
+        desktop.click(100, 100)
+        desktop.click(900, 100)
+        _wait_until(lambda: windows.stats['moves_seen'] == 2)
+        time.sleep(0.05)
+        events = [next(windows) for _ in range(3)]
+    assert [(event.pid, event.clicked) for event in events] == [(1234, True), (5678, True), (5678, False)]
+
+
+def test_clicks_only(desktop):
+    with stream(hover=False, mask='right') as windows:
+        desktop.move_to(100, 100)
+        desktop.click(100, 100)
+        desktop.click(900, 100, 'right')
+        event = next(windows)
+    assert (event.pid, event.clicked) == (5678, True)
+    assert windows.stats['moves_seen'] == 0
+
+
+def test_close_ends_the_iteration(desktop):
+    windows = stream(patch_cursors=True)
+    assert desktop.system_cursor_image(wingrab._standard_cursor_ids[0]) == 'resource'
+    threading.Timer(0.05, windows.close).start()
+    assert list(windows) == []
+    assert windows.closed
+    assert not desktop._hooks
+    assert desktop.system_cursor_image(wingrab._standard_cursor_ids[0]).startswith('default:')
+
+
+def test_token_cancels_the_iteration(desktop):
+    token = CancellationToken()
+    with stream(token=token) as windows:
+        threading.Timer(0.05, token.cancel).start()
+        with pytest.raises(GrabCancelled):
+            next(windows)
+    assert not desktop._hooks
+
+
+def test_waits_for_the_running_grab(desktop):
+    with wingrab_package.prepare():
+        with pytest.raises(TimeoutError):
+            stream(timeout=0.05)
+        token = CancellationToken()
+        token.cancel()
+        with pytest.raises(GrabCancelled):
+            stream(token=token)
+    with stream(timeout=5):
+        pass
+
+
+def test_async_iteration(desktop):
+    async def main():
+        with stream() as windows:
+            desktop.move_to(900, 100)
+            async for event in windows:
+                return event
+
+    assert asyncio.run(main()).pid == 5678
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+import wingrab as wingrab_package
+from wingrab import wingrab
+from wingrab.hookbuffer import LatencyRecorder
+from wingrab.watchdog import HookWatchdog
+
+
+class _Session:
+    """ The part of a grab session seen by the watchdog. """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.reinstalls = 0
+
+    def reinstall(self):
+        self.reinstalls += 1
+
+
+@pytest.fixture
+def latency():
+    return LatencyRecorder()
+
+
+@pytest.fixture
+def watchdog(latency):
+    # Checked at every call
+    return HookWatchdog(latency, interval=0, stall_checks=2)
+
+
+def test_hook_still_called(desktop, latency, watchdog):
+    session = _Session(desktop)
+    watchdog.start(session)
+    for x in range(5):
+        desktop.move_to(x, 0)
+        latency.record(0.0001)
+        assert not watchdog.check()
+    watchdog.stop()
+    assert session.reinstalls == 0
+    assert (watchdog.sessions, watchdog.checks) == (1, 5)
+    assert not watchdog.incidents
+
+
+def test_idle_cursor_is_not_a_stall(desktop, latency, watchdog):
+    session = _Session(desktop)
+    watchdog.start(session)
+    # Nobody touches the mouse, so the hook is not called either.
+    for _ in range(5):
+        assert not watchdog.check()
+    assert session.reinstalls == 0
+
+
+def test_removed_hook_is_reinstalled(desktop, latency, watchdog):
+    session = _Session(desktop)
+    watchdog.start(session)
+    desktop.move_to(10, 0)
+    assert not watchdog.check()
+    desktop.move_to(20, 0)
+    # The cursor has moved during two checks without any call of the hook.
+    assert watchdog.check()
+    assert session.reinstalls == watchdog.reinstalls == 1
+    assert watchdog.stats['incidents'][-1]['kind'] == 'removed'
+
+    # The count starts over after the reinstall.
+    desktop.move_to(30, 0)
+    assert not watchdog.check()
+
+
+def test_slow_calls(desktop, latency, watchdog):
+    desktop.hook_timeout = 0.2
+    watchdog.start(_Session(desktop))
+    latency.record(0.01)
+    latency.record(0.15)
+    latency.record(0.3)
+    watchdog.check()
+    # Slower than half of the timeout
+    assert watchdog.slow_calls == 2
+    incident = watchdog.stats['incidents'][-1]
+    assert (incident['kind'], incident['calls'], incident['max']) == ('slow', 2, 0.3)
+
+    # The calls seen after the last check are checked when the session stops.
+    latency.record(0.5)
+    watchdog.stop()
+    assert watchdog.slow_calls == 3
+
+
+def test_interval(desktop, latency):
+    watchdog = HookWatchdog(latency, interval=10)
+    watchdog.start(_Session(desktop))
+    assert not watchdog.check()
+    assert watchdog.checks == 0
+
+
+def test_stats(desktop, latency, watchdog):
+    watchdog.start(_Session(desktop))
+    latency.record(0.001)
+    watchdog.check()
+    stats = watchdog.stats
+    assert stats['timeout'] == desktop.hook_timeout
+    assert (stats['sessions'], stats['checks'], stats['reinstalls']) == (1, 1, 0)
+    assert 'latency' in stats and 'histogram' in stats
+
+
+def test_grab_survives_the_removal_of_its_hook(desktop, monkeypatch):
+    monkeypatch.setattr(wingrab.hook_watchdog, 'interval', 0.02)
+    reinstalls = wingrab.hook_watchdog.reinstalls
+    result = []
+    thread = threading.Thread(target=lambda: result.append(wingrab_package.grab(timeout=10)))
+    thread.start()
+    assert desktop.wait_for_hook(5)
+
+    # Windows removes the hook silently, the user keeps moving the mouse.
+    desktop.lose_hooks()
+    deadline = time.monotonic() + 5
+    x = 0
+    while wingrab.hook_watchdog.reinstalls == reinstalls:
+        assert time.monotonic() < deadline, 'The hook has not been reinstalled'
+        x += 10
+        desktop.move_to(x % 800, 100)
+        time.sleep(0.01)
+
+    assert desktop.wait_for_hook(5)
+    desktop.click(900, 100)
+    thread.join(5)
+    assert result == [5678]
+    assert not desktop._hooks
+
+
+def test_disabled_watchdog(desktop, monkeypatch):
+    monkeypatch.setattr(wingrab.hook_watchdog, 'enabled', False)
+    sessions = wingrab.hook_watchdog.sessions
+    desktop.click(100, 100)
+    assert wingrab_package.grab_many(1, timeout=5) == [1234]
+    assert wingrab.hook_watchdog.sessions == sessions
@@ -1 +1,6 @@
-from .wingrab import grab, cleanup
+from .wingrab import (grab, grab_many, cleanup, install_exit_handlers, CancellationToken, GrabCancelled, GrabBatch,
+                      ClickTiming)
+from .stream import stream, GrabStream, StreamEvent
+from .aio import grab_async
+from .prepared import prepare, PreparedGrab
+from .masks import EventMask
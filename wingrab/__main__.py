@@ -1,15 +1,27 @@
 import sys
 import wingrab
 
+from wingrab import server
+
+
+def _grab():
+    # Ask the grab server if one is running, which saves the setup of the grab.
+    try:
+        return server.request('grab')
+    except ConnectionError:
+        return wingrab.grab()
+
 
 def main():
     if len(sys.argv) < 2 or sys.argv[1] == 'grab':
-        print(wingrab.grab())
+        print(_grab())
+    elif sys.argv[1] == 'serve':
+        server.serve(sys.argv[2] if len(sys.argv) > 2 else None)
     elif sys.argv[1] == 'cleanup':
         wingrab.cleanup()
         print('Cleaned up.')
     else:
-        print(f'Unknown command: {sys.argv[1]}\nUsage: wingrab [grab|clean]')
+        print(f'Unknown command: {sys.argv[1]}\nUsage: wingrab [grab|serve [ADDRESS]|cleanup]')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,60 @@
+# -*- encoding:utf-8 -*-
+
+"""
+asyncio support: `await wingrab.grab_async()`.
+
+Instead of blocking a thread per grab, the `grab_async()` calls are requests to the scheduler of the grabs (see
+`wingrab.scheduler`), served by its shared dispatcher thread: the click of the user resolves all the requests waiting
+for it, including those of the synchronous `grab()` calls.  When every waiting task has been cancelled (or has timed
+out), the session is stopped: the hook is removed and the cursors are restored, on a thread of the default executor of
+the loop, before the last task gets its `CancelledError` (or `TimeoutError`).
+"""
+from . import wingrab as _wingrab
+from .inputs import get_input
+from .masks import as_mask
+from .scheduler import GrabRequest
+
+__all__ = ['grab_async']
+
+
+def _resolve(future, request):
+    if future.done():
+        return
+    if request.error is not None:
+        future.set_exception(request.error)
+    else:
+        future.set_result(request.result)
+
+
+async def grab_async(*, timeout=None, detail=False, priority=0, mask=None, input_backend=None, _debug=False):
+    """ Wait for the user to click a window and return its PID, without blocking the event loop.
+
+    Concurrent calls share the same click. When the calling task is cancelled, or when `timeout` (in seconds) expires,
+    the call stops waiting, and the hook is removed and the cursors are restored if no other call is waiting, before
+    the error is raised.
+
+    :param detail: Return a `wingrab.procinfo.WindowInfo` instead of the PID, see `wingrab.grab`.
+    :param priority: See `wingrab.grab`.
+    :param mask: See `wingrab.grab`.
+    :param input_backend: See `wingrab.grab`.
+    :raises asyncio.TimeoutError: If `timeout` expires before the click.
+    """
+    # Imported here, as importing asyncio is slow and most users of wingrab do not need it.
+    import asyncio
+
+    _wingrab.install_exit_handlers()
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    request = GrabRequest(detail=detail, priority=priority, mask=as_mask(mask), input_backend=get_input(input_backend),
+                          debug=_debug)
+    request.add_done_callback(lambda done: loop.call_soon_threadsafe(_resolve, future, done))
+    _wingrab.scheduler.submit(request)
+    try:
+        if timeout is None:
+            return await future
+        return await asyncio.wait_for(future, timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        # Wait for the session to remove its hook and restore the cursors, without blocking the event loop.
+        await asyncio.shield(loop.run_in_executor(None, request.cancel))
+        raise
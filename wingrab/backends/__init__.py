@@ -0,0 +1,275 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Platform backends of WinGrab.
+
+Every call WinGrab makes to the operating system (the low-level mouse hook or the raw input, the message queue, the
+system cursors and the window lookup) goes through a `Backend`.  Two backends are shipped:
+
+- `win32`: the real implementation on top of `user32`, only available on Windows.
+- `simulated`: a pure-Python desktop with a virtual window tree and synthetic mouse events, which can be used to drive
+  `wingrab.grab()` on any platform (see `wingrab.backends.simulated`).
+
+The backend used by `wingrab` is the one passed to `set_backend()`, or the one named by the `WINGRAB_BACKEND`
+environment variable, or `win32` on Windows.
+"""
+import contextlib
+import importlib
+import os
+import sys
+import threading
+
+__all__ = ['Backend', 'get_backend', 'set_backend', 'use_backend', 'BACKENDS', 'DEFAULT_HOOK_TIMEOUT']
+
+# The registered backends, name -> (module, class name)
+BACKENDS = {
+    'win32': ('wingrab.backends.win32', 'Win32Backend'),
+    'simulated': ('wingrab.backends.simulated', 'SimulatedBackend'),
+}
+
+# The timeout (in seconds) of the low-level hooks when `LowLevelHooksTimeout` is not set, which is not documented
+DEFAULT_HOOK_TIMEOUT = 0.3
+
+
+class Backend:
+    """ The interface of the platform calls used by WinGrab.
+
+    Handles (hooks, windows, cursors) are opaque integers (or `None`) owned by the backend.
+    """
+
+    # The name of the backend
+    name = None
+
+    # region Low-level mouse hook
+    def set_mouse_hook(self, proc):
+        """ Install a low-level mouse hook on the current thread.
+
+        `proc(nCode, wParam, lParam)` is called from inside the message queue of the current thread, `lParam` being the
+        address of a `MSLLHOOKSTRUCT`.
+
+        :return: The handle of the hook.
+        """
+        raise NotImplementedError
+
+    def unhook(self, hook):
+        """ Remove a hook installed by `set_mouse_hook()`. """
+        raise NotImplementedError
+
+    def call_next_hook(self, nCode, wParam, lParam):
+        """ Pass the hook information to the next hook procedure in the chain. """
+        raise NotImplementedError
+
+    def register_raw_input(self, callback):
+        """ Receive the raw input of the mouse on the current thread, instead of hooking the mouse.
+
+        `callback(wParam, lParam)` is called from inside the message queue of the current thread for each mouse event,
+        `wParam` being the mouse message (`WM_MOUSEMOVE`, `WM_LBUTTONDOWN`...) and `lParam` the address of a
+        `MSLLHOOKSTRUCT` describing it, as for a low-level hook.  Unlike a hook, the events cannot be swallowed, and the
+        input of the desktop never waits for the callback.
+
+        :return: The handle of the registration.
+        """
+        raise NotImplementedError
+
+    def unregister_raw_input(self, handle):
+        """ Remove a registration made by `register_raw_input()`. """
+        raise NotImplementedError
+
+    def is_key_down(self, vk):
+        """ :return: Whether the key of the virtual-key code `vk` is down, e.g. a modifier key during a mouse event.
+
+        Called by the hook procedure, must be fast.
+        """
+        raise NotImplementedError
+
+    def get_hook_timeout(self):
+        """ :return: The time (in seconds) a low-level hook procedure may take before the system silently removes the
+            hook, see `wingrab.watchdog`.
+        """
+        return DEFAULT_HOOK_TIMEOUT
+    # endregion
+
+    # region Message queue
+    def create_message_queue(self):
+        """ Create the `wingrab.msgloop.MessageQueue` of the current thread. """
+        raise NotImplementedError
+    # endregion
+
+    # region Cursors
+    def get_cursor_pos(self):
+        """ :return: The position of the cursor in screen coordinates, as a `(x, y)` tuple. """
+        raise NotImplementedError
+
+    def load_cursor_from_file(self, path):
+        """ :return: The handle of a new cursor loaded from `path`, or `None` on failure. """
+        raise NotImplementedError
+
+    def create_cursor_from_resource(self, resource):
+        """ :return: The handle of a new cursor created from a cursor resource (hotspot + image), or `None`. """
+        raise NotImplementedError
+
+    def copy_cursor(self, cursor):
+        """ :return: The handle of a new copy of `cursor`, or `None` on failure. """
+        raise NotImplementedError
+
+    def destroy_cursor(self, cursor):
+        """ Destroy a cursor which is not owned by the system. """
+        raise NotImplementedError
+
+    def set_system_cursor(self, cursor, cursor_id):
+        """ Replace the system cursor `cursor_id` with `cursor`, the system takes the ownership of `cursor`. """
+        raise NotImplementedError
+
+    def restore_system_cursors(self):
+        """ Reload the system cursors from the user settings. """
+        raise NotImplementedError
+
+    def snapshot_system_cursor(self, cursor_id):
+        """ :return: The handle of a new copy of the current system cursor `cursor_id`, owned by the caller, or `None`.
+        """
+        return None
+
+    def get_cursor_scheme(self):
+        """ :return: The files of the system cursors in the user settings, as a dict cursor id -> path, the path being
+            empty for the built-in cursor of the system. The cursors missing from the dict are unknown.
+        """
+        return {}
+    # endregion
+
+    # region Windows
+    def window_from_point(self, x, y):
+        """ :return: The handle of the window at the given point, or `None` if there is no window. """
+        raise NotImplementedError
+
+    def get_window_thread_process_id(self, hwnd):
+        """ :return: The `(thread id, process id)` tuple of the thread which created the window. """
+        raise NotImplementedError
+
+    def get_root_window(self, hwnd):
+        """ :return: The handle of the top-level window containing `hwnd` (`hwnd` itself if it is a top-level window). """
+        raise NotImplementedError
+
+    def get_owner_window(self, hwnd):
+        """ :return: The handle of the owner of the top-level window `hwnd`, or `None` if it has no owner. """
+        raise NotImplementedError
+
+    def get_class_name(self, hwnd):
+        """ :return: The class name of the window. """
+        raise NotImplementedError
+
+    def get_window_text(self, hwnd):
+        """ :return: The title of the window. """
+        raise NotImplementedError
+
+    def get_window_rect(self, hwnd):
+        """ :return: The `(left, top, right, bottom)` rectangle of the window in screen coordinates. """
+        raise NotImplementedError
+
+    def enum_windows(self):
+        """ :return: The visible top-level windows which can be under the cursor, topmost first, as
+            `(hwnd, rect, pid)` tuples.
+        """
+        raise NotImplementedError
+
+    def get_child_pids(self, hwnd):
+        """ :return: The set of the PIDs of the descendant windows of `hwnd`, e.g. to find the top-level windows hosting
+            the windows of other processes (the frame of a UWP application, `ApplicationFrameHost.exe`).
+        """
+        raise NotImplementedError
+
+    def set_window_event_hook(self, callback):
+        """ Watch the top-level windows.
+
+        `callback(event, hwnd)` is called from inside the message queue of the current thread, `event` being one of
+        `show`, `hide`, `destroy`, `move` and `zorder`.
+
+        :return: The handle of the hook.
+        """
+        raise NotImplementedError
+
+    def unhook_window_events(self, handle):
+        """ Remove a hook installed by `set_window_event_hook()`. """
+        raise NotImplementedError
+    # endregion
+
+    # region Processes
+    def get_process_start_time(self, pid):
+        """ :return: The creation time of the process (an opaque comparable value), or `None` if it is not accessible.
+        """
+        raise NotImplementedError
+
+    def get_process_image_path(self, pid):
+        """ :return: The full path of the executable of the process, or `None` if it is not accessible. """
+        raise NotImplementedError
+    # endregion
+
+    # region Process lock
+    def lock_file(self, f):
+        """ Lock the first byte of the open file `f` without blocking, raise `OSError` if it is already locked. """
+        raise NotImplementedError
+
+    def create_named_lock(self, name):
+        """ :return: A `wingrab.locks.ProcessLock` named `name` which does not touch the disk, or `None` to use the
+            file lock.
+        """
+        return None
+    # endregion
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name):
+    try:
+        module_name, class_name = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown backend: {name!r}, available backends: {", ".join(BACKENDS)}') from None
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def get_backend():
+    """ Return the backend used by WinGrab, creating the default one on first use. """
+    global _backend
+    backend = _backend
+    if backend is not None:
+        return backend
+
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get('WINGRAB_BACKEND')
+            if name is None:
+                if sys.platform != 'win32':
+                    raise NotImplementedError(
+                        'Only support Windows platform, use `wingrab.backends.set_backend()` '
+                        'to select a simulated backend'
+                    )
+                name = 'win32'
+            _backend = _create_backend(name)
+        return _backend
+
+
+def set_backend(backend):
+    """ Select the backend used by WinGrab.
+
+    :param backend: A `Backend` instance, the name of a registered backend, or `None` to go back to the default one.
+    :return: The selected backend.
+    """
+    global _backend
+    if isinstance(backend, str):
+        backend = _create_backend(backend)
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+@contextlib.contextmanager
+def use_backend(backend):
+    """ Context manager selecting `backend` (see `set_backend()`) and restoring the previous one on exit. """
+    global _backend
+    previous = _backend
+    try:
+        yield set_backend(backend)
+    finally:
+        with _backend_lock:
+            _backend = previous
@@ -0,0 +1,564 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The `simulated` backend: a pure-Python desktop used to run WinGrab without Windows.
+
+The simulated desktop has a virtual window tree (top-level windows in z-order, each one owning child windows, every
+window belonging to a process and a thread), a set of system cursors and a mouse.  Synthetic mouse events are delivered
+to the installed low-level hooks through the message queue of the thread which installed them, the same way Windows
+calls a `WH_MOUSE_LL` hook, and to the raw input registrations, which read the events queued in the meantime in one
+batch like `GetRawInputBuffer`.
+
+Example::
+
+    from wingrab import wingrab
+    from wingrab.backends import set_backend
+    from wingrab.backends.simulated import SimulatedBackend
+
+    desktop = set_backend(SimulatedBackend())
+    desktop.create_window((0, 0, 800, 600), pid=1234)
+    desktop.click(100, 100)  # Delivered as soon as the grab installs its hook
+
+    assert wingrab.grab() == 1234
+"""
+import collections
+import itertools
+import threading
+import time
+
+from ctypes import addressof
+
+from . import Backend, DEFAULT_HOOK_TIMEOUT
+from ..locks import create_named_lock
+from ..msgloop import FakeMessageQueue
+from ..resources import tracker
+from ..winuser import (HC_ACTION, MSLLHOOKSTRUCT, WM_MOUSEMOVE, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_RBUTTONDOWN,
+                       WM_RBUTTONUP, WM_MBUTTONDOWN, WM_MBUTTONUP, WM_MOUSEWHEEL, WM_XBUTTONDOWN, WM_XBUTTONUP,
+                       XBUTTON1, XBUTTON2)
+
+__all__ = ['SimulatedBackend', 'VirtualWindow']
+
+# button -> (down message, up message, mouseData)
+_BUTTON_MESSAGES = {
+    'left': (WM_LBUTTONDOWN, WM_LBUTTONUP, 0),
+    'right': (WM_RBUTTONDOWN, WM_RBUTTONUP, 0),
+    'middle': (WM_MBUTTONDOWN, WM_MBUTTONUP, 0),
+    'x1': (WM_XBUTTONDOWN, WM_XBUTTONUP, XBUTTON1 << 16),
+    'x2': (WM_XBUTTONDOWN, WM_XBUTTONUP, XBUTTON2 << 16),
+}
+
+
+class VirtualWindow:
+    """ A window of the simulated desktop. """
+
+    def __init__(self, hwnd, rect, pid, tid, *, parent=None, owner=None, title='', class_name=''):
+        self.hwnd = hwnd
+        # (left, top, right, bottom) in screen coordinates
+        self.rect = tuple(rect)
+        self.pid = pid
+        self.tid = tid
+        self.parent = parent
+        # The owner of a top-level window, e.g. the main window of a dialog box
+        self.owner = owner
+        self.title = title
+        self.class_name = class_name
+        self.visible = True
+        # The child windows, the topmost one first
+        self.children = []
+
+    def contains(self, x, y):
+        left, top, right, bottom = self.rect
+        return left <= x < right and top <= y < bottom
+
+    def hit_test(self, x, y):
+        """ Return the deepest visible window of this subtree containing the point, or `None`. """
+        if not self.visible or not self.contains(x, y):
+            return None
+        for child in self.children:
+            window = child.hit_test(x, y)
+            if window is not None:
+                return window
+        return self
+
+    def __repr__(self):
+        return f'<VirtualWindow hwnd={self.hwnd:#x} pid={self.pid} rect={self.rect} title={self.title!r}>'
+
+
+class SimulatedBackend(Backend):
+    """ A backend simulating a Windows desktop in memory.
+
+    Mouse events injected while no hook is installed are held back and delivered to the next installed hook, so a
+    whole scenario can be scripted before calling `wingrab.grab()`.
+    """
+
+    name = 'simulated'
+
+    # The process of the simulated system, see `create_process()`
+    _Process = collections.namedtuple('_Process', ['exe_path', 'start_time'])
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._hook_installed = threading.Condition(self._lock)
+        self._handles = itertools.count(0x10000, 4)
+        self._start = time.monotonic()
+
+        # The top-level windows, the topmost one first
+        self._windows = []
+        self._windows_by_handle = {}
+        # The running processes, pid -> _Process
+        self._processes = {}
+        # The number of process metadata queries, the expensive calls of a real system
+        self.process_queries = 0
+
+        # The message queue of each thread, thread ident -> queue
+        self._queues = {}
+        # The installed hooks, the most recent one first, as (hook, proc, queue) tuples
+        self._hooks = []
+        # The raw input registrations, as (handle, callback, queue, records) tuples, `records` being the deque of the
+        # (wParam, MSLLHOOKSTRUCT, keys) records not read yet
+        self._raw_inputs = []
+        # The window event hooks, as (hook, callback, queue) tuples
+        self._window_event_hooks = []
+        # The events waiting for a hook, as (wParam, x, y, mouseData, flags, dwExtraInfo, keys) tuples
+        self._pending_input = collections.deque()
+        # The timeout of the low-level hooks (in seconds), and whether a hook procedure taking longer silently removes
+        # its hook, as on Windows 7 and later
+        self.hook_timeout = DEFAULT_HOOK_TIMEOUT
+        self.remove_slow_hooks = False
+        # The number of hooks removed because of the timeout, or by `lose_hooks()`
+        self.hooks_lost = 0
+
+        self._cursor_pos = (0, 0)
+        # The virtual-key codes of the keys held down, and those held down during the event being delivered to a hook
+        self._keys_down = frozenset()
+        self._event_keys = frozenset()
+        # The cursor handles alive in the simulated system
+        self.cursor_handles = set()
+        # What each cursor handle shows: the path of its file, 'resource', or 'default:<id>' for a built-in cursor
+        self._cursor_images = {}
+        # The current system cursors, cursor id -> cursor handle
+        self.system_cursors = {}
+        # The cursor files of the user settings, cursor id -> path ('' for the built-in cursor)
+        self.cursor_scheme = {}
+        # The number of reloads of the whole cursor scheme
+        self.scheme_reloads = 0
+
+    def _new_handle(self):
+        return next(self._handles)
+
+    # region Window tree
+    def create_window(self, rect, pid, *, tid=None, parent=None, owner=None, title='', class_name=''):
+        """ Create a window on top of its siblings.
+
+        :param rect: The `(left, top, right, bottom)` rectangle of the window in screen coordinates.
+        :param pid: The ID of the process owning the window.
+        :param tid: The ID of the thread owning the window, the PID by default.
+        :param parent: The parent `VirtualWindow` or window handle, `None` for a top-level window.
+        :param owner: The owner `VirtualWindow` or window handle of a top-level window.
+        :return: The new `VirtualWindow`.
+        """
+        with self._lock:
+            if parent is not None:
+                parent = self.get_window(parent)
+            if owner is not None:
+                owner = self.get_window(owner)
+            window = VirtualWindow(self._new_handle(), rect, pid, pid if tid is None else tid,
+                                   parent=parent, owner=owner, title=title, class_name=class_name)
+            siblings = self._windows if parent is None else parent.children
+            siblings.insert(0, window)
+            self._windows_by_handle[window.hwnd] = window
+            self._notify_window_event('show', window)
+            return window
+
+    def destroy_window(self, window):
+        """ Destroy a window and all its children. """
+        with self._lock:
+            window = self.get_window(window)
+            siblings = self._windows if window.parent is None else window.parent.children
+            siblings.remove(window)
+
+            stack = [window]
+            while stack:
+                w = stack.pop()
+                self._windows_by_handle.pop(w.hwnd, None)
+                stack.extend(w.children)
+            self._notify_window_event('destroy', window)
+
+    def move_window(self, window, rect):
+        """ Move and resize a window, its children keep their screen coordinates. """
+        with self._lock:
+            window = self.get_window(window)
+            window.rect = tuple(rect)
+            self._notify_window_event('move', window)
+
+    def show_window(self, window, visible=True):
+        """ Show or hide a window. """
+        with self._lock:
+            window = self.get_window(window)
+            window.visible = visible
+            self._notify_window_event('show' if visible else 'hide', window)
+
+    def bring_to_top(self, window):
+        """ Put a window on top of its siblings. """
+        with self._lock:
+            window = self.get_window(window)
+            siblings = self._windows if window.parent is None else window.parent.children
+            siblings.remove(window)
+            siblings.insert(0, window)
+            self._notify_window_event('zorder', window)
+
+    def get_window(self, window):
+        """ Return the `VirtualWindow` of a handle (a `VirtualWindow` is returned as is). """
+        if isinstance(window, VirtualWindow):
+            return window
+        return self._windows_by_handle[window]
+
+    def _notify_window_event(self, event, window):
+        # Like the out-of-context window events of Windows, only the top-level windows are reported, through the
+        # message queue of the thread which installed the hook.
+        if window.parent is not None:
+            return
+        for hook, callback, queue in self._window_event_hooks:
+            queue.post(self._call_window_event_hook, hook, callback, event, window.hwnd)
+
+    def _call_window_event_hook(self, hook, callback, event, hwnd):
+        if any(entry[0] == hook for entry in self._window_event_hooks):
+            callback(event, hwnd)
+
+    @property
+    def windows(self):
+        """ The top-level windows, the topmost one first. """
+        with self._lock:
+            return list(self._windows)
+    # endregion
+
+    # region Processes
+    def create_process(self, pid, exe_path):
+        """ Start a process, replacing any process with the same PID (as Windows reuses the PIDs). """
+        with self._lock:
+            self._processes[pid] = self._Process(exe_path, time.monotonic_ns())
+
+    def terminate_process(self, pid):
+        """ Terminate a process, its windows are left untouched. """
+        with self._lock:
+            self._processes.pop(pid, None)
+    # endregion
+
+    # region Synthetic input
+    def move_to(self, x, y):
+        """ Move the mouse to the given point. """
+        self._send_input(WM_MOUSEMOVE, x, y)
+
+    def press(self, button='left'):
+        """ Press a mouse button (`left`, `right`, `middle`, `x1` or `x2`) at the current position. """
+        down, _, mouse_data = _BUTTON_MESSAGES[button]
+        self._send_input(down, mouse_data=mouse_data)
+
+    def release(self, button='left'):
+        """ Release a mouse button (`left`, `right`, `middle`, `x1` or `x2`) at the current position. """
+        _, up, mouse_data = _BUTTON_MESSAGES[button]
+        self._send_input(up, mouse_data=mouse_data)
+
+    def click(self, x, y, button='left'):
+        """ Move the mouse to the given point and click. """
+        self.move_to(x, y)
+        self.press(button)
+        self.release(button)
+
+    def press_key(self, vk):
+        """ Press the key of the virtual-key code `vk`, e.g. `winuser.VK_CONTROL`.
+
+        The mouse events injected afterwards see the key down, even if they are delivered after `release_key()`.
+        """
+        with self._lock:
+            self._keys_down = self._keys_down | {vk}
+
+    def release_key(self, vk):
+        with self._lock:
+            self._keys_down = self._keys_down - {vk}
+
+    def scroll(self, delta=120):
+        """ Rotate the mouse wheel at the current position. """
+        self._send_input(WM_MOUSEWHEEL, mouse_data=(delta & 0xFFFF) << 16)
+
+    def inject(self, wParam, info):
+        """ Send a mouse event described by a `MSLLHOOKSTRUCT`, e.g. a recorded one (see `wingrab.recorder`).
+
+        The position, the mouse data, the flags and the extra information of `info` are kept, the `time` field is
+        replaced with the simulated system time.
+        """
+        self._send_input(wParam, info.pt.x, info.pt.y, mouse_data=info.mouseData, flags=info.flags,
+                         extra_info=info.dwExtraInfo)
+
+    def lose_hooks(self):
+        """ Silently remove the low-level hooks, as Windows does with a hook procedure which has timed out. """
+        with self._lock:
+            self.hooks_lost += len(self._hooks)
+            self._hooks = []
+
+    def wait_for_hook(self, timeout=None):
+        """ Block until a low-level mouse hook is installed, or the raw input is registered.
+
+        :return: True if a hook is installed, False on timeout.
+        """
+        with self._hook_installed:
+            return self._hook_installed.wait_for(lambda: self._hooks or self._raw_inputs, timeout)
+
+    def _send_input(self, wParam, x=None, y=None, *, mouse_data=0, flags=0, extra_info=0):
+        with self._lock:
+            if x is None:
+                x, y = self._cursor_pos
+            elif wParam == WM_MOUSEMOVE:
+                self._cursor_pos = (x, y)
+
+            if not self._hooks and not self._raw_inputs:
+                self._pending_input.append((wParam, x, y, mouse_data, flags, extra_info, self._keys_down))
+                return
+            self._deliver(wParam, x, y, mouse_data, flags, extra_info, self._keys_down)
+
+    def _deliver(self, wParam, x, y, mouse_data, flags=0, extra_info=0, keys=frozenset()):
+        elapsed = int((time.monotonic() - self._start) * 1000) & 0xFFFFFFFF
+        for hook, proc, queue in self._hooks:
+            info = MSLLHOOKSTRUCT()
+            info.pt.x, info.pt.y = x, y
+            info.mouseData = mouse_data
+            info.flags = flags
+            info.time = elapsed
+            info.dwExtraInfo = extra_info
+            # The structure is kept alive by the posted message until it is dispatched.
+            queue.post(self._call_hook, hook, proc, wParam, info, keys)
+
+        for handle, callback, queue, records in self._raw_inputs:
+            info = MSLLHOOKSTRUCT()
+            info.pt.x, info.pt.y = x, y
+            info.mouseData = mouse_data
+            info.time = elapsed
+            info.dwExtraInfo = extra_info
+            if not records:
+                # Like WM_INPUT, one message reads all the records queued until then.
+                queue.post(self._read_raw_input, handle, callback, records)
+            records.append((wParam, info, keys))
+
+    def _call_hook(self, hook, proc, wParam, info, keys):
+        # Windows calls the hooks synchronously, so an event never reaches a hook removed in the meantime.
+        if any(entry[0] == hook for entry in self._hooks):
+            self._event_keys = keys
+            started = time.perf_counter()
+            proc(HC_ACTION, wParam, addressof(info))
+            if self.remove_slow_hooks and time.perf_counter() - started > self.hook_timeout:
+                with self._lock:
+                    self.hooks_lost += 1
+                    self._hooks = [entry for entry in self._hooks if entry[0] != hook]
+
+    def _read_raw_input(self, handle, callback, records):
+        while True:
+            with self._lock:
+                if not records or not any(entry[0] == handle for entry in self._raw_inputs):
+                    return
+                wParam, info, keys = records.popleft()
+            self._event_keys = keys
+            callback(wParam, addressof(info))
+    # endregion
+
+    # region Backend
+    def set_mouse_hook(self, proc):
+        with self._lock:
+            hook = self._new_handle()
+            self._hooks.insert(0, (hook, proc, self._get_queue()))
+            while self._pending_input:
+                self._deliver(*self._pending_input.popleft())
+            self._hook_installed.notify_all()
+            return tracker.add('hook', hook, self.unhook)
+
+    def unhook(self, hook):
+        with self._lock:
+            self._hooks = [entry for entry in self._hooks if entry[0] != hook]
+        tracker.discard('hook', hook)
+
+    def call_next_hook(self, nCode, wParam, lParam):
+        # Every hook gets its own copy of the event, there is no chain to walk.
+        return 0
+
+    def register_raw_input(self, callback):
+        with self._lock:
+            handle = self._new_handle()
+            self._raw_inputs.insert(0, (handle, callback, self._get_queue(), collections.deque()))
+            while self._pending_input:
+                self._deliver(*self._pending_input.popleft())
+            self._hook_installed.notify_all()
+            return tracker.add('raw_input', handle, self.unregister_raw_input)
+
+    def unregister_raw_input(self, handle):
+        with self._lock:
+            self._raw_inputs = [entry for entry in self._raw_inputs if entry[0] != handle]
+        tracker.discard('raw_input', handle)
+
+    def _get_queue(self):
+        ident = threading.get_ident()
+        queue = self._queues.get(ident)
+        if queue is None:
+            queue = self._queues[ident] = FakeMessageQueue()
+        return queue
+
+    def create_message_queue(self):
+        with self._lock:
+            return self._get_queue()
+
+    def get_cursor_pos(self):
+        return self._cursor_pos
+
+    def is_key_down(self, vk):
+        # The state of the keyboard when the event being handled was injected, as the events are delivered later.
+        return vk in self._event_keys
+
+    def get_hook_timeout(self):
+        return self.hook_timeout
+
+    def load_cursor_from_file(self, path):
+        try:
+            with open(path, 'rb') as f:
+                f.read()
+        except OSError:
+            return None
+        return self._new_cursor(path)
+
+    def create_cursor_from_resource(self, resource):
+        if len(resource) <= 4:
+            return None
+        return self._new_cursor('resource')
+
+    def copy_cursor(self, cursor):
+        if cursor not in self.cursor_handles:
+            return None
+        return self._new_cursor(self._cursor_images.get(cursor))
+
+    def destroy_cursor(self, cursor):
+        with self._lock:
+            self.cursor_handles.discard(cursor)
+            self._cursor_images.pop(cursor, None)
+        tracker.discard('cursor', cursor)
+
+    def _new_cursor(self, image):
+        with self._lock:
+            cursor = self._new_handle()
+            self.cursor_handles.add(cursor)
+            self._cursor_images[cursor] = image
+            return tracker.add('cursor', cursor, self.destroy_cursor)
+
+    def system_cursor_image(self, cursor_id):
+        """ :return: What the system cursor `cursor_id` shows, see `_cursor_images`. """
+        with self._lock:
+            cursor = self.system_cursors.get(cursor_id)
+            if cursor is not None:
+                return self._cursor_images.get(cursor)
+            return self.cursor_scheme.get(cursor_id) or f'default:{cursor_id}'
+
+    def set_system_cursor(self, cursor, cursor_id):
+        with self._lock:
+            if cursor not in self.cursor_handles:
+                return False
+            # The replaced cursor is destroyed by the system, which owns the new one from now on.
+            self.destroy_cursor(self.system_cursors.get(cursor_id))
+            self.system_cursors[cursor_id] = cursor
+            tracker.discard('cursor', cursor)
+            return True
+
+    def restore_system_cursors(self):
+        with self._lock:
+            self.scheme_reloads += 1
+            # All the system cursors are reloaded from the user settings, including those set by other applications.
+            for cursor in self.system_cursors.values():
+                self.destroy_cursor(cursor)
+            self.system_cursors.clear()
+
+    def snapshot_system_cursor(self, cursor_id):
+        return self._new_cursor(self.system_cursor_image(cursor_id))
+
+    def get_cursor_scheme(self):
+        return dict(self.cursor_scheme)
+
+    def window_from_point(self, x, y):
+        with self._lock:
+            for window in self._windows:
+                hit = window.hit_test(x, y)
+                if hit is not None:
+                    return hit.hwnd
+            return None
+
+    def get_window_thread_process_id(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        if window is None:
+            return 0, 0
+        return window.tid, window.pid
+
+    def enum_windows(self):
+        with self._lock:
+            return [(window.hwnd, window.rect, window.pid) for window in self._windows if window.visible]
+
+    def get_child_pids(self, hwnd):
+        with self._lock:
+            window = self._windows_by_handle.get(hwnd)
+            stack = [] if window is None else list(window.children)
+            pids = set()
+            while stack:
+                child = stack.pop()
+                pids.add(child.pid)
+                stack.extend(child.children)
+            return pids
+
+    def set_window_event_hook(self, callback):
+        with self._lock:
+            hook = self._new_handle()
+            self._window_event_hooks.append((hook, callback, self._get_queue()))
+            return tracker.add('window_event_hook', hook, self.unhook_window_events)
+
+    def unhook_window_events(self, handle):
+        with self._lock:
+            self._window_event_hooks = [entry for entry in self._window_event_hooks if entry[0] != handle]
+        tracker.discard('window_event_hook', handle)
+
+    def get_root_window(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        if window is None:
+            return None
+        while window.parent is not None:
+            window = window.parent
+        return window.hwnd
+
+    def get_owner_window(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        if window is None or window.owner is None:
+            return None
+        return window.owner.hwnd
+
+    def get_class_name(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        return '' if window is None else window.class_name
+
+    def get_window_text(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        return '' if window is None else window.title
+
+    def get_window_rect(self, hwnd):
+        window = self._windows_by_handle.get(hwnd)
+        return None if window is None else window.rect
+
+    def get_process_start_time(self, pid):
+        process = self._processes.get(pid)
+        return None if process is None else process.start_time
+
+    def get_process_image_path(self, pid):
+        self.process_queries += 1
+        process = self._processes.get(pid)
+        return None if process is None else process.exe_path
+
+    def lock_file(self, f):
+        try:
+            import fcntl
+        except ImportError:
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def create_named_lock(self, name):
+        return create_named_lock(name)
+    # endregion
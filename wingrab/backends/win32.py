@@ -0,0 +1,1263 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The `win32` backend: WinGrab on top of `user32`.
+"""
+import sys
+
+if sys.platform != 'win32':
+    raise NotImplementedError('Only support Windows platform')
+
+import msvcrt
+import winreg
+
+from ctypes import (POINTER, Structure, addressof, byref, memmove, pointer, sizeof, WinError, get_last_error, c_int,
+                    c_char_p, WinDLL, WINFUNCTYPE, create_unicode_buffer)
+from ctypes.wintypes import (WPARAM, LPARAM, HANDLE, DWORD, BOOL, HINSTANCE, UINT, LPCWSTR, LPDWORD, MSG, HHOOK, HWND,
+                             POINT, LPVOID, LPHANDLE, LPWSTR, RECT, LPRECT, FILETIME, LONG, SHORT, ATOM, HICON, HBRUSH,
+                             HMENU, PUINT)
+
+from . import Backend, DEFAULT_HOOK_TIMEOUT
+from ..locks import ProcessLock
+from ..msgloop import MessageQueue
+from ..resources import tracker
+from ..winuser import (WH_MOUSE_LL, WM_QUIT, SPI_SETCURSORS, IMAGE_CURSOR, LRESULT, HCURSOR, PM_NOREMOVE, PM_REMOVE,
+                       LR_COPYFROMRESOURCE, CURSOR_SCHEME_NAMES, QS_ALLINPUT, MWMO_INPUTAVAILABLE, INFINITE,
+                       WAIT_TIMEOUT, WAIT_FAILED, GA_ROOT, GW_OWNER, PROCESS_QUERY_LIMITED_INFORMATION, MAX_PATH,
+                       WAIT_OBJECT_0, WAIT_ABANDONED, GWL_EXSTYLE, WS_EX_TRANSPARENT, DWMWA_CLOAKED,
+                       EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_MINIMIZESTART, EVENT_SYSTEM_MINIMIZEEND,
+                       EVENT_OBJECT_CREATE, EVENT_OBJECT_DESTROY, EVENT_OBJECT_SHOW, EVENT_OBJECT_HIDE,
+                       EVENT_OBJECT_LOCATIONCHANGE, WINEVENT_OUTOFCONTEXT, OBJID_WINDOW, CHILDID_SELF, WM_INPUT,
+                       WM_MOUSEMOVE, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_RBUTTONDOWN, WM_RBUTTONUP, WM_MBUTTONDOWN,
+                       WM_MBUTTONUP, WM_XBUTTONDOWN, WM_XBUTTONUP, WM_MOUSEWHEEL, WM_MOUSEHWHEEL, XBUTTON1, XBUTTON2,
+                       MSLLHOOKSTRUCT, RAWINPUTDEVICE, RAWINPUTHEADER, RAWINPUT, RAWMOUSE, HID_USAGE_PAGE_GENERIC,
+                       HID_USAGE_GENERIC_MOUSE, RIDEV_INPUTSINK, RIDEV_REMOVE, RID_INPUT, RIM_TYPEMOUSE,
+                       MOUSE_MOVE_ABSOLUTE, RI_MOUSE_LEFT_BUTTON_DOWN, RI_MOUSE_LEFT_BUTTON_UP,
+                       RI_MOUSE_RIGHT_BUTTON_DOWN, RI_MOUSE_RIGHT_BUTTON_UP, RI_MOUSE_MIDDLE_BUTTON_DOWN,
+                       RI_MOUSE_MIDDLE_BUTTON_UP, RI_MOUSE_BUTTON_4_DOWN, RI_MOUSE_BUTTON_4_UP, RI_MOUSE_BUTTON_5_DOWN,
+                       RI_MOUSE_BUTTON_5_UP, RI_MOUSE_WHEEL, RI_MOUSE_HWHEEL, HWND_MESSAGE)
+
+__all__ = ['Win32Backend', 'bind_all']
+
+
+class _LazyDLL:
+    """ A DLL loaded on first use, whose functions get their prototype on first use.
+
+    Setting up `argtypes`/`restype`/`errcheck` of every function at import time is wasted work for the processes which
+    import wingrab but never grab, so the prototypes are only recorded by `declare()` and applied by `__getattr__` when
+    a function is used for the first time.  The configured function is then cached as an instance attribute, so that
+    later lookups do not go through `__getattr__` any more.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._dll = None
+        self._prototypes = {}
+
+    def declare(self, name, *, argtypes, restype=None, errcheck=None):
+        """ Record the prototype of the function `name`. """
+        self._prototypes[name] = (argtypes, restype, errcheck)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if self._dll is None:
+            self._dll = WinDLL(self._name, use_last_error=True)
+
+        func = getattr(self._dll, name)
+        prototype = self._prototypes.get(name)
+        if prototype is not None:
+            argtypes, restype, errcheck = prototype
+            func.argtypes = argtypes
+            if restype is not None:
+                func.restype = restype
+            if errcheck is not None:
+                func.errcheck = errcheck
+
+        setattr(self, name, func)
+        return func
+
+    def bind_all(self):
+        """ Resolve all the declared functions now. """
+        for name in self._prototypes:
+            getattr(self, name)
+
+
+user32 = _LazyDLL('user32')
+kernel32 = _LazyDLL('kernel32')
+dwmapi = _LazyDLL('dwmapi')
+
+LPMSG = POINTER(MSG)
+
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-createiconfromresourceex
+CURSOR_RESOURCE_VERSION = 0x00030000
+LR_DEFAULTCOLOR = 0x00000000
+
+HOOKPROC = WINFUNCTYPE(LRESULT, c_int, WPARAM, LPARAM)
+LowLevelMouseProc = HOOKPROC
+
+HWINEVENTHOOK = HANDLE
+WNDENUMPROC = WINFUNCTYPE(BOOL, HWND, LPARAM)
+WINEVENTPROC = WINFUNCTYPE(None, HWINEVENTHOOK, DWORD, HWND, LONG, LONG, DWORD, DWORD)
+WNDPROC = WINFUNCTYPE(LRESULT, HWND, UINT, WPARAM, LPARAM)
+HRAWINPUT = HANDLE
+
+
+class WNDCLASSEXW(Structure):
+    _fields_ = (('cbSize', UINT),
+                ('style', UINT),
+                ('lpfnWndProc', WNDPROC),
+                ('cbClsExtra', c_int),
+                ('cbWndExtra', c_int),
+                ('hInstance', HINSTANCE),
+                ('hIcon', HICON),
+                ('hCursor', HCURSOR),
+                ('hbrBackground', HBRUSH),
+                ('lpszMenuName', LPCWSTR),
+                ('lpszClassName', LPCWSTR),
+                ('hIconSm', HICON))
+
+
+# The window events reported by `set_window_event_hook()`, as (first event, last event) ranges
+_WINDOW_EVENT_RANGES = (
+    (EVENT_OBJECT_CREATE, EVENT_OBJECT_HIDE),
+    (EVENT_OBJECT_LOCATIONCHANGE, EVENT_OBJECT_LOCATIONCHANGE),
+    (EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND),
+    (EVENT_SYSTEM_MINIMIZESTART, EVENT_SYSTEM_MINIMIZEEND),
+)
+_WINDOW_EVENT_NAMES = {
+    EVENT_OBJECT_DESTROY: 'destroy',
+    EVENT_OBJECT_SHOW: 'show',
+    EVENT_OBJECT_HIDE: 'hide',
+    EVENT_OBJECT_LOCATIONCHANGE: 'move',
+    EVENT_SYSTEM_FOREGROUND: 'zorder',
+    EVENT_SYSTEM_MINIMIZESTART: 'hide',
+    EVENT_SYSTEM_MINIMIZEEND: 'show',
+}
+
+
+def errcheck_bool(result, func, args):
+    if not result:
+        raise WinError(get_last_error())
+    return args
+
+
+def MAKEINTRESOURCEW(x):
+    return LPCWSTR(x)
+
+
+# ===================================
+#  SetWindowsHookEx
+#  https://learn.microsoft.com/zh-cn/windows/win32/api/winuser/nf-winuser-setwindowshookexw
+# ===================================
+user32.declare('SetWindowsHookExW', restype=HHOOK, errcheck=errcheck_bool, argtypes=(
+    # _In_ idHook
+    c_int,
+    # _In_ lpfn
+    HOOKPROC,
+    # _In_ hMod
+    HINSTANCE,
+    # _In_ dwThreadId
+    DWORD,
+))
+
+# ===================================
+#  PostThreadMessageW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-postthreadmessagew
+# ===================================
+user32.declare('PostThreadMessageW', restype=BOOL, argtypes=(
+    # _In_ idThread
+    DWORD,
+    # _In_ Msg
+    UINT,
+    # _In_ wParam
+    WPARAM,
+    # _In_ lParam
+    LPARAM,
+))
+
+# ===================================
+#  UnhookWindowsHookEx
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-unhookwindowshookex
+# ===================================
+user32.declare('UnhookWindowsHookEx', restype=BOOL, argtypes=(
+    # _In_ hhk
+    HHOOK,
+))
+
+# ===================================
+#  CallNextHookEx
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-callnexthookex
+# ===================================
+user32.declare('CallNextHookEx', restype=LRESULT, argtypes=(
+    # _In_opt_ hhk
+    HHOOK,
+    # _In_     nCode
+    c_int,
+    # _In_     wParam
+    WPARAM,
+    # _In_     lParam
+    LPARAM,
+))
+
+# ===================================
+#  GetMessageW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getmessagew
+# ===================================
+user32.declare('GetMessageW', argtypes=(
+    # _Out_    lpMsg
+    LPMSG,
+    # _In_opt_ hWnd
+    HWND,
+    # _In_     wMsgFilterMin
+    UINT,
+    # _In_     wMsgFilterMax
+    UINT,
+))
+
+# ===================================
+#  PeekMessageW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-peekmessagew
+# ===================================
+user32.declare('PeekMessageW', argtypes=(
+    # _Out_    lpMsg
+    LPMSG,
+    # _In_opt_ hWnd
+    HWND,
+    # _In_     wMsgFilterMin
+    UINT,
+    # _In_     wMsgFilterMax
+    UINT,
+    # _In_     wRemoveMsg
+    UINT,
+))
+
+# ===================================
+#  MsgWaitForMultipleObjectsEx
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-msgwaitformultipleobjectsex
+# ===================================
+user32.declare('MsgWaitForMultipleObjectsEx', restype=DWORD, argtypes=(
+    # _In_ nCount
+    DWORD,
+    # _In_ pHandles
+    LPHANDLE,
+    # _In_ dwMilliseconds
+    DWORD,
+    # _In_ dwWakeMask
+    DWORD,
+    # _In_ dwFlags
+    DWORD,
+))
+
+# ===================================
+#  TranslateMessage
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-translatemessage
+# ===================================
+user32.declare('TranslateMessage', argtypes=(
+    # _In_ lpMsg
+    LPMSG,
+))
+
+# ===================================
+#  DispatchMessageW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-dispatchmessagew
+# ===================================
+user32.declare('DispatchMessageW', argtypes=(
+    # _In_ lpMsg
+    LPMSG,
+))
+
+# ===================================
+#  SetSystemCursor
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-setsystemcursor
+# ===================================
+user32.declare('SetSystemCursor', restype=BOOL, argtypes=(
+    # _In_ hcur
+    HCURSOR,
+    # _In_ id
+    DWORD,
+))
+
+# ===================================
+#  LoadCursorW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-loadcursorw
+# ===================================
+user32.declare('LoadCursorW', restype=HCURSOR, argtypes=(
+    # _In_opt_ hInstance
+    HINSTANCE,
+    # _In_ lpCursorName, a cursor id (MAKEINTRESOURCE)
+    LPVOID,
+))
+
+# ===================================
+#  LoadCursorFromFileW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-loadcursorfromfilew
+# ===================================
+user32.declare('LoadCursorFromFileW', restype=HCURSOR, argtypes=(
+    # _In_ lpFileName
+    LPCWSTR,
+))
+
+# ===================================
+#  CreateIconFromResourceEx
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-createiconfromresourceex
+# ===================================
+user32.declare('CreateIconFromResourceEx', restype=HCURSOR, argtypes=(
+    # _In_ presbits
+    c_char_p,
+    # _In_ dwResSize
+    DWORD,
+    # _In_ fIcon
+    BOOL,
+    # _In_ dwVer
+    DWORD,
+    # _In_ cxDesired
+    c_int,
+    # _In_ cyDesired
+    c_int,
+    # _In_ Flags
+    UINT,
+))
+
+# ===================================
+#  CopyImage
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-copyimage
+# ===================================
+user32.declare('CopyImage', restype=HANDLE, argtypes=(
+    # _In_ h
+    HANDLE,
+    # _In_ type
+    UINT,
+    # _In_ cx
+    c_int,
+    # _In_ cy
+    c_int,
+    # _In_ flags
+    UINT,
+))
+
+# ===================================
+#  DestroyCursor
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-destroycursor
+# ===================================
+user32.declare('DestroyCursor', restype=BOOL, argtypes=(
+    # _In_ hCursor
+    HCURSOR,
+))
+
+# ===================================
+#  GetCursorPos
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getcursorpos
+# ===================================
+user32.declare('GetCursorPos', restype=BOOL, argtypes=(
+    # _Out_ lpPoint
+    POINTER(POINT),
+))
+
+# ===================================
+#  GetAsyncKeyState
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getasynckeystate
+# ===================================
+user32.declare('GetAsyncKeyState', restype=SHORT, argtypes=(
+    # _In_ vKey
+    c_int,
+))
+
+# ===================================
+#  WindowFromPoint
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-windowfrompoint
+# ===================================
+user32.declare('WindowFromPoint', restype=HWND, argtypes=(
+    # _In_ Point
+    POINT,
+))
+
+# ===================================
+#  GetWindowThreadProcessId
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowthreadprocessid
+# ===================================
+user32.declare('GetWindowThreadProcessId', restype=DWORD, argtypes=(
+    # _In_      hWnd
+    HWND,
+    # _Out_opt_ lpdwProcessId
+    LPDWORD,
+))
+
+# ===================================
+#  GetAncestor
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getancestor
+# ===================================
+user32.declare('GetAncestor', restype=HWND, argtypes=(
+    # _In_ hwnd
+    HWND,
+    # _In_ gaFlags
+    UINT,
+))
+
+# ===================================
+#  GetWindow
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindow
+# ===================================
+user32.declare('GetWindow', restype=HWND, argtypes=(
+    # _In_ hWnd
+    HWND,
+    # _In_ uCmd
+    UINT,
+))
+
+# ===================================
+#  GetClassNameW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getclassnamew
+# ===================================
+user32.declare('GetClassNameW', restype=c_int, argtypes=(
+    # _In_  hWnd
+    HWND,
+    # _Out_ lpClassName
+    LPWSTR,
+    # _In_  nMaxCount
+    c_int,
+))
+
+# ===================================
+#  GetWindowTextLengthW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowtextlengthw
+# ===================================
+user32.declare('GetWindowTextLengthW', restype=c_int, argtypes=(
+    # _In_ hWnd
+    HWND,
+))
+
+# ===================================
+#  GetWindowTextW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowtextw
+# ===================================
+user32.declare('GetWindowTextW', restype=c_int, argtypes=(
+    # _In_  hWnd
+    HWND,
+    # _Out_ lpString
+    LPWSTR,
+    # _In_  nMaxCount
+    c_int,
+))
+
+# ===================================
+#  GetWindowRect
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowrect
+# ===================================
+user32.declare('GetWindowRect', restype=BOOL, argtypes=(
+    # _In_  hWnd
+    HWND,
+    # _Out_ lpRect
+    LPRECT,
+))
+
+# ===================================
+#  EnumWindows
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-enumwindows
+# ===================================
+user32.declare('EnumWindows', restype=BOOL, argtypes=(
+    # _In_ lpEnumFunc
+    WNDENUMPROC,
+    # _In_ lParam
+    LPARAM,
+))
+
+# ===================================
+#  EnumChildWindows
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-enumchildwindows
+# ===================================
+user32.declare('EnumChildWindows', restype=BOOL, argtypes=(
+    # _In_opt_ hWndParent
+    HWND,
+    # _In_ lpEnumFunc
+    WNDENUMPROC,
+    # _In_ lParam
+    LPARAM,
+))
+
+# ===================================
+#  IsWindowVisible
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-iswindowvisible
+# ===================================
+user32.declare('IsWindowVisible', restype=BOOL, argtypes=(
+    # _In_ hWnd
+    HWND,
+))
+
+# ===================================
+#  IsIconic
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-isiconic
+# ===================================
+user32.declare('IsIconic', restype=BOOL, argtypes=(
+    # _In_ hWnd
+    HWND,
+))
+
+# ===================================
+#  GetWindowLongW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowlongw
+# ===================================
+user32.declare('GetWindowLongW', restype=LONG, argtypes=(
+    # _In_ hWnd
+    HWND,
+    # _In_ nIndex
+    c_int,
+))
+
+# ===================================
+#  SetWinEventHook
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-setwineventhook
+# ===================================
+user32.declare('SetWinEventHook', restype=HWINEVENTHOOK, errcheck=errcheck_bool, argtypes=(
+    # _In_ eventMin
+    DWORD,
+    # _In_ eventMax
+    DWORD,
+    # _In_ hmodWinEventProc
+    HINSTANCE,
+    # _In_ pfnWinEventProc
+    WINEVENTPROC,
+    # _In_ idProcess
+    DWORD,
+    # _In_ idThread
+    DWORD,
+    # _In_ dwFlags
+    DWORD,
+))
+
+# ===================================
+#  UnhookWinEvent
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-unhookwinevent
+# ===================================
+user32.declare('UnhookWinEvent', restype=BOOL, argtypes=(
+    # _In_ hWinEventHook
+    HWINEVENTHOOK,
+))
+
+# ===================================
+#  RegisterClassExW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-registerclassexw
+# ===================================
+user32.declare('RegisterClassExW', restype=ATOM, errcheck=errcheck_bool, argtypes=(
+    # _In_ unnamedParam1
+    POINTER(WNDCLASSEXW),
+))
+
+# ===================================
+#  CreateWindowExW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-createwindowexw
+# ===================================
+user32.declare('CreateWindowExW', restype=HWND, errcheck=errcheck_bool, argtypes=(
+    # _In_     dwExStyle
+    DWORD,
+    # _In_opt_ lpClassName
+    LPCWSTR,
+    # _In_opt_ lpWindowName
+    LPCWSTR,
+    # _In_     dwStyle
+    DWORD,
+    # _In_     X
+    c_int,
+    # _In_     Y
+    c_int,
+    # _In_     nWidth
+    c_int,
+    # _In_     nHeight
+    c_int,
+    # _In_opt_ hWndParent
+    HWND,
+    # _In_opt_ hMenu
+    HMENU,
+    # _In_opt_ hInstance
+    HINSTANCE,
+    # _In_opt_ lpParam
+    LPVOID,
+))
+
+# ===================================
+#  DestroyWindow
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-destroywindow
+# ===================================
+user32.declare('DestroyWindow', restype=BOOL, argtypes=(
+    # _In_ hWnd
+    HWND,
+))
+
+# ===================================
+#  DefWindowProcW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-defwindowprocw
+# ===================================
+user32.declare('DefWindowProcW', restype=LRESULT, argtypes=(
+    # _In_ hWnd
+    HWND,
+    # _In_ Msg
+    UINT,
+    # _In_ wParam
+    WPARAM,
+    # _In_ lParam
+    LPARAM,
+))
+
+# ===================================
+#  RegisterRawInputDevices
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-registerrawinputdevices
+# ===================================
+user32.declare('RegisterRawInputDevices', restype=BOOL, errcheck=errcheck_bool, argtypes=(
+    # _In_ pRawInputDevices
+    POINTER(RAWINPUTDEVICE),
+    # _In_ uiNumDevices
+    UINT,
+    # _In_ cbSize
+    UINT,
+))
+
+# ===================================
+#  GetRawInputData
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdata
+# ===================================
+user32.declare('GetRawInputData', restype=UINT, argtypes=(
+    # _In_      hRawInput
+    HRAWINPUT,
+    # _In_      uiCommand
+    UINT,
+    # _Out_opt_ pData
+    LPVOID,
+    # _Inout_   pcbSize
+    PUINT,
+    # _In_      cbSizeHeader
+    UINT,
+))
+
+# ===================================
+#  GetRawInputBuffer
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputbuffer
+# ===================================
+user32.declare('GetRawInputBuffer', restype=UINT, argtypes=(
+    # _Out_opt_ pData
+    LPVOID,
+    # _Inout_   pcbSize
+    PUINT,
+    # _In_      cbSizeHeader
+    UINT,
+))
+
+# ===================================
+#  GetMessageTime
+#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getmessagetime
+# ===================================
+user32.declare('GetMessageTime', restype=LONG, argtypes=())
+
+# ===================================
+#  IsWow64Process
+#  https://learn.microsoft.com/en-us/windows/win32/api/wow64apiset/nf-wow64apiset-iswow64process
+# ===================================
+kernel32.declare('IsWow64Process', restype=BOOL, argtypes=(
+    # _In_  hProcess
+    HANDLE,
+    # _Out_ Wow64Process
+    POINTER(BOOL),
+))
+
+# ===================================
+#  GetCurrentProcess
+#  https://learn.microsoft.com/en-us/windows/win32/api/processthreadsapi/nf-processthreadsapi-getcurrentprocess
+# ===================================
+kernel32.declare('GetCurrentProcess', restype=HANDLE, argtypes=())
+
+# ===================================
+#  DwmGetWindowAttribute
+#  https://learn.microsoft.com/en-us/windows/win32/api/dwmapi/nf-dwmapi-dwmgetwindowattribute
+# ===================================
+dwmapi.declare('DwmGetWindowAttribute', restype=LONG, argtypes=(
+    # _In_  hwnd
+    HWND,
+    # _In_  dwAttribute
+    DWORD,
+    # _Out_ pvAttribute
+    LPVOID,
+    # _In_  cbAttribute
+    DWORD,
+))
+
+# ===================================
+#  SystemParametersInfoW
+#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-systemparametersinfow
+# ===================================
+user32.declare('SystemParametersInfoW', restype=BOOL, argtypes=(
+    # _In_     uiAction
+    UINT,
+    # _In_     uiParam
+    UINT,
+    # _Inout_  pvParam
+    POINTER(POINT),
+    # _In_     fWinIni
+    UINT,
+))
+
+# ===================================
+#  CreateEventW
+#  https://learn.microsoft.com/en-us/windows/win32/api/synchapi/nf-synchapi-createeventw
+# ===================================
+kernel32.declare('CreateEventW', restype=HANDLE, errcheck=errcheck_bool, argtypes=(
+    # _In_opt_ lpEventAttributes
+    LPVOID,
+    # _In_     bManualReset
+    BOOL,
+    # _In_     bInitialState
+    BOOL,
+    # _In_opt_ lpName
+    LPCWSTR,
+))
+
+# ===================================
+#  SetEvent
+#  https://learn.microsoft.com/en-us/windows/win32/api/synchapi/nf-synchapi-setevent
+# ===================================
+kernel32.declare('SetEvent', restype=BOOL, argtypes=(
+    # _In_ hEvent
+    HANDLE,
+))
+
+# ===================================
+#  OpenProcess
+#  https://learn.microsoft.com/en-us/windows/win32/api/processthreadsapi/nf-processthreadsapi-openprocess
+# ===================================
+kernel32.declare('OpenProcess', restype=HANDLE, argtypes=(
+    # _In_ dwDesiredAccess
+    DWORD,
+    # _In_ bInheritHandle
+    BOOL,
+    # _In_ dwProcessId
+    DWORD,
+))
+
+# ===================================
+#  GetProcessTimes
+#  https://learn.microsoft.com/en-us/windows/win32/api/processthreadsapi/nf-processthreadsapi-getprocesstimes
+# ===================================
+kernel32.declare('GetProcessTimes', restype=BOOL, argtypes=(
+    # _In_  hProcess
+    HANDLE,
+    # _Out_ lpCreationTime
+    POINTER(FILETIME),
+    # _Out_ lpExitTime
+    POINTER(FILETIME),
+    # _Out_ lpKernelTime
+    POINTER(FILETIME),
+    # _Out_ lpUserTime
+    POINTER(FILETIME),
+))
+
+# ===================================
+#  QueryFullProcessImageNameW
+#  https://learn.microsoft.com/en-us/windows/win32/api/winbase/nf-winbase-queryfullprocessimagenamew
+# ===================================
+kernel32.declare('QueryFullProcessImageNameW', restype=BOOL, argtypes=(
+    # _In_    hProcess
+    HANDLE,
+    # _In_    dwFlags
+    DWORD,
+    # _Out_   lpExeName
+    LPWSTR,
+    # _Inout_ lpdwSize
+    LPDWORD,
+))
+
+# ===================================
+#  CreateMutexW
+#  https://learn.microsoft.com/en-us/windows/win32/api/synchapi/nf-synchapi-createmutexw
+# ===================================
+kernel32.declare('CreateMutexW', restype=HANDLE, errcheck=errcheck_bool, argtypes=(
+    # _In_opt_ lpMutexAttributes
+    LPVOID,
+    # _In_     bInitialOwner
+    BOOL,
+    # _In_opt_ lpName
+    LPCWSTR,
+))
+
+# ===================================
+#  ReleaseMutex
+#  https://learn.microsoft.com/en-us/windows/win32/api/synchapi/nf-synchapi-releasemutex
+# ===================================
+kernel32.declare('ReleaseMutex', restype=BOOL, argtypes=(
+    # _In_ hMutex
+    HANDLE,
+))
+
+# ===================================
+#  WaitForSingleObject
+#  https://learn.microsoft.com/en-us/windows/win32/api/synchapi/nf-synchapi-waitforsingleobject
+# ===================================
+kernel32.declare('WaitForSingleObject', restype=DWORD, argtypes=(
+    # _In_ hHandle
+    HANDLE,
+    # _In_ dwMilliseconds
+    DWORD,
+))
+
+# ===================================
+#  CloseHandle
+#  https://learn.microsoft.com/en-us/windows/win32/api/handleapi/nf-handleapi-closehandle
+# ===================================
+kernel32.declare('CloseHandle', restype=BOOL, argtypes=(
+    # _In_ hObject
+    HANDLE,
+))
+
+
+def bind_all():
+    """ Load `user32`/`kernel32`/`dwmapi` and resolve all the declared functions. """
+    user32.bind_all()
+    kernel32.bind_all()
+    dwmapi.bind_all()
+
+
+class _Win32MessageQueue(MessageQueue):
+    """ The message queue of the current thread, waited on with `MsgWaitForMultipleObjectsEx`. """
+
+    def __init__(self):
+        self._msg = MSG()
+        # An auto-reset event signalled by `wake()`
+        self._wake_event = kernel32.CreateEventW(None, False, False, None)
+        self._handles = (HANDLE * 1)(self._wake_event)
+        # Make sure the thread has a message queue before the hook is installed.
+        user32.PeekMessageW(byref(self._msg), None, 0, 0, PM_NOREMOVE)
+        tracker.add('message_queue', self, _Win32MessageQueue.close)
+
+    def wait(self, timeout):
+        milliseconds = INFINITE if timeout is None else int(timeout * 1000)
+        ret = user32.MsgWaitForMultipleObjectsEx(1, self._handles, milliseconds, QS_ALLINPUT, MWMO_INPUTAVAILABLE)
+        if ret == WAIT_FAILED:
+            raise WinError(get_last_error())
+        return ret != WAIT_TIMEOUT
+
+    def pump(self):
+        # The low-level hook procedure is called from inside `PeekMessageW`.
+        msg = self._msg
+        while user32.PeekMessageW(byref(msg), None, 0, 0, PM_REMOVE):
+            if msg.message == WM_QUIT:
+                return False
+
+            user32.TranslateMessage(byref(msg))
+            user32.DispatchMessageW(byref(msg))
+        return True
+
+    def wake(self):
+        kernel32.SetEvent(self._wake_event)
+
+    def close(self):
+        if self._wake_event:
+            kernel32.CloseHandle(self._wake_event)
+            self._wake_event = None
+            tracker.discard('message_queue', self)
+
+
+# The error value of the raw input functions, (UINT)-1
+_RAW_INPUT_ERROR = 0xFFFFFFFF
+
+# The mouse messages of the button transitions of a raw input record, as (flag, message, mouseData) tuples
+_RAW_BUTTON_MESSAGES = (
+    (RI_MOUSE_LEFT_BUTTON_DOWN, WM_LBUTTONDOWN, 0),
+    (RI_MOUSE_LEFT_BUTTON_UP, WM_LBUTTONUP, 0),
+    (RI_MOUSE_RIGHT_BUTTON_DOWN, WM_RBUTTONDOWN, 0),
+    (RI_MOUSE_RIGHT_BUTTON_UP, WM_RBUTTONUP, 0),
+    (RI_MOUSE_MIDDLE_BUTTON_DOWN, WM_MBUTTONDOWN, 0),
+    (RI_MOUSE_MIDDLE_BUTTON_UP, WM_MBUTTONUP, 0),
+    (RI_MOUSE_BUTTON_4_DOWN, WM_XBUTTONDOWN, XBUTTON1 << 16),
+    (RI_MOUSE_BUTTON_4_UP, WM_XBUTTONUP, XBUTTON1 << 16),
+    (RI_MOUSE_BUTTON_5_DOWN, WM_XBUTTONDOWN, XBUTTON2 << 16),
+    (RI_MOUSE_BUTTON_5_UP, WM_XBUTTONUP, XBUTTON2 << 16),
+)
+
+
+class _RawInputReader:
+    """ A message-only window of the current thread receiving the raw input of the mouse.
+
+    Each `WM_INPUT` is read with `GetRawInputData`, then the input queued behind it is read in batches with
+    `GetRawInputBuffer`, which removes the matching `WM_INPUT` messages from the queue.  Every record is translated into
+    the mouse messages of a low-level hook, described by a `MSLLHOOKSTRUCT` whose position is the one of the cursor when
+    the record is read (the raw input only has the relative motion of the device).
+    """
+
+    # The window class shared by the readers, registered on first use
+    _class_name = 'WinGrabRawInput'
+    _class_atom = None
+    _window_proc_thunk = None
+    # The readers of the message-only windows, hwnd -> reader
+    _readers = {}
+
+    def __init__(self, callback, capacity=64):
+        self._callback = callback
+        self._buffer = (RAWINPUT * capacity)()
+        self._buffer_address = addressof(self._buffer)
+        self._record = RAWINPUT()
+        self._record_address = addressof(self._record)
+        self._mouse_address = addressof(self._record.mouse)
+        self._size = UINT()
+        self._size_pointer = pointer(self._size)
+        self._info = MSLLHOOKSTRUCT()
+        self._info_address = addressof(self._info)
+        self._point_pointer = pointer(self._info.pt)
+        # The records of `GetRawInputBuffer` are laid out as 64-bit ones in a 32-bit process of a 64-bit system.
+        self._data_offset = sizeof(RAWINPUTHEADER) + (8 if _is_wow64() else 0)
+
+        cls = type(self)
+        if cls._class_atom is None:
+            cls._window_proc_thunk = WNDPROC(_raw_input_window_proc)
+            window_class = WNDCLASSEXW(cbSize=sizeof(WNDCLASSEXW), lpfnWndProc=cls._window_proc_thunk,
+                                       lpszClassName=cls._class_name)
+            cls._class_atom = user32.RegisterClassExW(byref(window_class))
+        self.hwnd = user32.CreateWindowExW(0, cls._class_name, None, 0, 0, 0, 0, 0, HWND_MESSAGE, None, None, None)
+        cls._readers[self.hwnd] = self
+        try:
+            # RIDEV_INPUTSINK: receive the input even though the window is never in the foreground.
+            device = RAWINPUTDEVICE(HID_USAGE_PAGE_GENERIC, HID_USAGE_GENERIC_MOUSE, RIDEV_INPUTSINK, self.hwnd)
+            user32.RegisterRawInputDevices(byref(device), 1, sizeof(RAWINPUTDEVICE))
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.hwnd is None:
+            return
+        device = RAWINPUTDEVICE(HID_USAGE_PAGE_GENERIC, HID_USAGE_GENERIC_MOUSE, RIDEV_REMOVE, None)
+        try:
+            user32.RegisterRawInputDevices(byref(device), 1, sizeof(RAWINPUTDEVICE))
+        except OSError:
+            pass
+        user32.DestroyWindow(self.hwnd)
+        type(self)._readers.pop(self.hwnd, None)
+        self.hwnd = None
+
+    def read(self, handle):
+        """ Handle the `WM_INPUT` of the raw input `handle`, and the input queued behind it. """
+        self._size.value = sizeof(RAWINPUT)
+        if user32.GetRawInputData(handle, RID_INPUT, self._record_address, self._size_pointer,
+                                  sizeof(RAWINPUTHEADER)) != _RAW_INPUT_ERROR:
+            self._dispatch(self._record)
+
+        buffer_size = sizeof(self._buffer)
+        while True:
+            self._size.value = buffer_size
+            count = user32.GetRawInputBuffer(self._buffer_address, self._size_pointer, sizeof(RAWINPUTHEADER))
+            if count == 0 or count == _RAW_INPUT_ERROR:
+                return
+            offset = 0
+            for _ in range(count):
+                address = self._buffer_address + offset
+                memmove(self._record_address, address, sizeof(RAWINPUTHEADER))
+                memmove(self._mouse_address, address + self._data_offset, sizeof(RAWMOUSE))
+                self._dispatch(self._record)
+                # NEXTRAWINPUTBLOCK: the records are aligned on 8 bytes.
+                offset = (offset + self._record.header.dwSize + 7) & ~7
+
+    def _dispatch(self, record):
+        if record.header.dwType != RIM_TYPEMOUSE:
+            return
+        mouse = record.mouse
+        info = self._info
+        user32.GetCursorPos(self._point_pointer)
+        info.time = user32.GetMessageTime()
+        info.flags = 0
+        info.dwExtraInfo = mouse.ulExtraInformation
+        info.mouseData = 0
+        callback = self._callback
+
+        if mouse.lLastX or mouse.lLastY or mouse.usFlags & MOUSE_MOVE_ABSOLUTE:
+            callback(WM_MOUSEMOVE, self._info_address)
+
+        flags = mouse.usButtonFlags
+        if not flags:
+            return
+        for flag, message, mouse_data in _RAW_BUTTON_MESSAGES:
+            if flags & flag:
+                info.mouseData = mouse_data
+                callback(message, self._info_address)
+        if flags & RI_MOUSE_WHEEL:
+            info.mouseData = mouse.usButtonData << 16
+            callback(WM_MOUSEWHEEL, self._info_address)
+        if flags & RI_MOUSE_HWHEEL:
+            info.mouseData = mouse.usButtonData << 16
+            callback(WM_MOUSEHWHEEL, self._info_address)
+
+
+def _raw_input_window_proc(hwnd, message, wParam, lParam):
+    if message == WM_INPUT:
+        reader = _RawInputReader._readers.get(hwnd)
+        if reader is not None:
+            reader.read(lParam)
+    # For WM_INPUT as well, so that the system cleans the input up.
+    return user32.DefWindowProcW(hwnd, message, wParam, lParam)
+
+
+def _is_wow64():
+    is_wow64 = BOOL()
+    try:
+        kernel32.IsWow64Process(kernel32.GetCurrentProcess(), byref(is_wow64))
+    except (AttributeError, OSError):
+        return False
+    return bool(is_wow64.value)
+
+
+class _NamedMutex(ProcessLock):
+    """ A mutex of the user session, opened once and kept open for the lifetime of the process.
+
+    A mutex is owned by a thread, so it must be released by the thread which acquired it.  If the owner process dies,
+    the mutex is abandoned and the next `acquire()` gets it.
+    """
+
+    def __init__(self, name):
+        self.name = f'Local\\{name}'
+        self._mutex = None
+
+    def acquire(self):
+        if self._mutex is None:
+            self._mutex = kernel32.CreateMutexW(None, False, self.name)
+            tracker.add('mutex', self, _NamedMutex.close)
+        ret = kernel32.WaitForSingleObject(self._mutex, 0)
+        if ret == WAIT_FAILED:
+            raise WinError(get_last_error())
+        return ret == WAIT_OBJECT_0 or ret == WAIT_ABANDONED
+
+    def release(self):
+        kernel32.ReleaseMutex(self._mutex)
+
+    def close(self):
+        if self._mutex is not None:
+            kernel32.CloseHandle(self._mutex)
+            self._mutex = None
+            tracker.discard('mutex', self)
+
+
+class Win32Backend(Backend):
+    """ The backend calling the real `user32` functions. """
+
+    name = 'win32'
+
+    def __init__(self):
+        # The ctypes thunks of the hook procedures, built on first use and kept alive for the lifetime of the backend
+        self._thunks = {}
+
+    def set_mouse_hook(self, proc):
+        thunk = self._thunks.get(proc)
+        if thunk is None:
+            thunk = self._thunks[proc] = LowLevelMouseProc(proc)
+        return tracker.add('hook', user32.SetWindowsHookExW(WH_MOUSE_LL, thunk, None, 0), self.unhook)
+
+    def unhook(self, hook):
+        user32.UnhookWindowsHookEx(hook)
+        tracker.discard('hook', hook)
+
+    def call_next_hook(self, nCode, wParam, lParam):
+        return user32.CallNextHookEx(None, nCode, wParam, lParam)
+
+    def register_raw_input(self, callback):
+        return tracker.add('raw_input', _RawInputReader(callback), self.unregister_raw_input)
+
+    def unregister_raw_input(self, handle):
+        handle.close()
+        tracker.discard('raw_input', handle)
+
+    def create_message_queue(self):
+        return _Win32MessageQueue()
+
+    def get_cursor_pos(self):
+        point = POINT()
+        user32.GetCursorPos(byref(point))
+        return point.x, point.y
+
+    def is_key_down(self, vk):
+        # The most significant bit is set while the key is down, i.e. the SHORT is negative.
+        return user32.GetAsyncKeyState(vk) < 0
+
+    def get_hook_timeout(self):
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r'Control Panel\Desktop') as key:
+                # A REG_DWORD, or a REG_SZ when set by hand
+                value, _ = winreg.QueryValueEx(key, 'LowLevelHooksTimeout')
+            milliseconds = int(value)
+        except (OSError, ValueError):
+            return DEFAULT_HOOK_TIMEOUT
+        if milliseconds <= 0:
+            return DEFAULT_HOOK_TIMEOUT
+        # Windows 7 and later do not wait longer than one second, whatever the setting.
+        return min(milliseconds, 1000) / 1000
+
+    def load_cursor_from_file(self, path):
+        return tracker.add('cursor', user32.LoadCursorFromFileW(path), self.destroy_cursor)
+
+    def create_cursor_from_resource(self, resource):
+        cursor = user32.CreateIconFromResourceEx(resource, len(resource), False, CURSOR_RESOURCE_VERSION, 0, 0,
+                                                 LR_DEFAULTCOLOR)
+        return tracker.add('cursor', cursor, self.destroy_cursor)
+
+    def copy_cursor(self, cursor):
+        return tracker.add('cursor', user32.CopyImage(cursor, IMAGE_CURSOR, 0, 0, 0), self.destroy_cursor)
+
+    def destroy_cursor(self, cursor):
+        user32.DestroyCursor(cursor)
+        tracker.discard('cursor', cursor)
+
+    def set_system_cursor(self, cursor, cursor_id):
+        if not user32.SetSystemCursor(cursor, cursor_id):
+            return False
+        # The system owns the cursor from now on.
+        tracker.discard('cursor', cursor)
+        return True
+
+    def restore_system_cursors(self):
+        user32.SystemParametersInfoW(SPI_SETCURSORS, 0, None, 0)
+
+    def snapshot_system_cursor(self, cursor_id):
+        # The handle of a system cursor is shared and keeps its id, `SetSystemCursor` replaces its content: a copy
+        # keeps the current content. The copy is made from the resource where possible, which keeps animated cursors.
+        shared = user32.LoadCursorW(None, cursor_id)
+        if not shared:
+            return None
+        cursor = (user32.CopyImage(shared, IMAGE_CURSOR, 0, 0, LR_COPYFROMRESOURCE)
+                  or user32.CopyImage(shared, IMAGE_CURSOR, 0, 0, 0) or None)
+        return tracker.add('cursor', cursor, self.destroy_cursor)
+
+    def get_cursor_scheme(self):
+        scheme = {}
+        try:
+            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r'Control Panel\Cursors')
+        except OSError:
+            return scheme
+        with key:
+            for cursor_id, name in CURSOR_SCHEME_NAMES.items():
+                try:
+                    path, value_type = winreg.QueryValueEx(key, name)
+                except OSError:
+                    # No value: the built-in cursor
+                    path, value_type = '', winreg.REG_SZ
+                if value_type == winreg.REG_EXPAND_SZ:
+                    path = winreg.ExpandEnvironmentStrings(path)
+                scheme[cursor_id] = path
+        return scheme
+
+    def window_from_point(self, x, y):
+        return user32.WindowFromPoint(POINT(x, y))
+
+    def get_window_thread_process_id(self, hwnd):
+        pid = DWORD()
+        tid = user32.GetWindowThreadProcessId(hwnd, byref(pid))
+        return tid, pid.value
+
+    def enum_windows(self):
+        windows = []
+        cloaked = DWORD()
+
+        def callback(hwnd, lParam):
+            # Skip the windows `WindowFromPoint` never returns: hidden, minimized, click-through or cloaked (e.g. on
+            # another virtual desktop).
+            if not user32.IsWindowVisible(hwnd) or user32.IsIconic(hwnd):
+                return True
+            if user32.GetWindowLongW(hwnd, GWL_EXSTYLE) & WS_EX_TRANSPARENT:
+                return True
+            if dwmapi.DwmGetWindowAttribute(hwnd, DWMWA_CLOAKED, byref(cloaked), sizeof(cloaked)) == 0 and cloaked:
+                return True
+
+            rect = self.get_window_rect(hwnd)
+            if rect is not None and rect[0] < rect[2] and rect[1] < rect[3]:
+                windows.append((hwnd, rect, self.get_window_thread_process_id(hwnd)[1]))
+            return True
+
+        user32.EnumWindows(WNDENUMPROC(callback), 0)
+        return windows
+
+    def get_child_pids(self, hwnd):
+        pids = set()
+        pid = DWORD()
+
+        def callback(child, lParam):
+            # All the descendants are enumerated, not only the direct children.
+            user32.GetWindowThreadProcessId(child, byref(pid))
+            pids.add(pid.value)
+            return True
+
+        user32.EnumChildWindows(hwnd, WNDENUMPROC(callback), 0)
+        return pids
+
+    def set_window_event_hook(self, callback):
+        def proc(hook, event, hwnd, id_object, id_child, thread_id, event_time):
+            if id_object != OBJID_WINDOW or id_child != CHILDID_SELF or not hwnd:
+                return
+            name = _WINDOW_EVENT_NAMES.get(event)
+            if name is None:
+                return
+            # The destroyed windows cannot be queried any more, the other events are only reported for the top-level
+            # windows.
+            if name != 'destroy' and user32.GetAncestor(hwnd, GA_ROOT) != hwnd:
+                return
+            callback(name, hwnd)
+
+        thunk = WINEVENTPROC(proc)
+        hooks = tuple(user32.SetWinEventHook(first, last, None, thunk, 0, 0, WINEVENT_OUTOFCONTEXT)
+                      for first, last in _WINDOW_EVENT_RANGES)
+        # The thunk must outlive the hooks.
+        self._thunks[hooks] = thunk
+        return tracker.add('window_event_hook', hooks, self.unhook_window_events)
+
+    def unhook_window_events(self, handle):
+        for hook in handle:
+            user32.UnhookWinEvent(hook)
+        self._thunks.pop(handle, None)
+        tracker.discard('window_event_hook', handle)
+
+    def get_root_window(self, hwnd):
+        return user32.GetAncestor(hwnd, GA_ROOT)
+
+    def get_owner_window(self, hwnd):
+        return user32.GetWindow(hwnd, GW_OWNER)
+
+    def get_class_name(self, hwnd):
+        # The class names are limited to 256 characters.
+        buffer = create_unicode_buffer(257)
+        length = user32.GetClassNameW(hwnd, buffer, len(buffer))
+        return buffer.value[:length]
+
+    def get_window_text(self, hwnd):
+        buffer = create_unicode_buffer(user32.GetWindowTextLengthW(hwnd) + 1)
+        length = user32.GetWindowTextW(hwnd, buffer, len(buffer))
+        return buffer.value[:length]
+
+    def get_window_rect(self, hwnd):
+        rect = RECT()
+        if not user32.GetWindowRect(hwnd, byref(rect)):
+            return None
+        return rect.left, rect.top, rect.right, rect.bottom
+
+    def get_process_start_time(self, pid):
+        process = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not process:
+            return None
+        try:
+            creation, exit_time, kernel, user = FILETIME(), FILETIME(), FILETIME(), FILETIME()
+            if not kernel32.GetProcessTimes(process, byref(creation), byref(exit_time), byref(kernel), byref(user)):
+                return None
+            return (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+        finally:
+            kernel32.CloseHandle(process)
+
+    def get_process_image_path(self, pid):
+        process = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not process:
+            return None
+        try:
+            # Leave room for the executables installed under a long path.
+            buffer = create_unicode_buffer(MAX_PATH * 4)
+            size = DWORD(len(buffer))
+            if not kernel32.QueryFullProcessImageNameW(process, 0, buffer, byref(size)):
+                return None
+            return buffer.value[:size.value]
+        finally:
+            kernel32.CloseHandle(process)
+
+    def lock_file(self, f):
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def create_named_lock(self, name):
+        return _NamedMutex(name)
@@ -0,0 +1,341 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The cache of the cursor displayed during a grab.
+
+All the standard system cursors are replaced by the same cursor, and `SetSystemCursor` takes the ownership of (and
+eventually destroys) the handle it is given, so one handle is needed per cursor id.  Instead of loading `cursor.cur`
+from disk for every id, `CursorCache` reads the file once per process, creates one cursor from memory and hands out
+in-memory copies of it.  The file is checked (size and modification time) once per patch, before the cursor is
+reused, and reloaded if it has changed.
+
+`CursorPatch` replaces the system cursors and puts the original cursors back.  Reloading the whole cursor scheme
+(`SPI_SETCURSORS`) reads every cursor of the user settings from the registry and broadcasts a setting change to every
+top-level window, and it also resets the cursors set by other applications.  Instead, a copy of each cursor is taken
+before it is replaced, and set back when the grab is over; the scheme is only reloaded when a copy cannot be made or
+set.  The copies die with the process, so a `CursorJournal` on disk records which cursors are replaced and which files
+they come from, for `recover_cursors()` to restore them after a crash.
+"""
+import functools
+import json
+import os
+import pkgutil
+import struct
+import threading
+import time
+
+from .resources import tracker
+
+__all__ = ['CursorCache', 'CursorPatch', 'CursorJournal', 'recover_cursors', 'cursor_resource_from_file']
+
+# https://learn.microsoft.com/en-us/previous-versions/ms997538(v=msdn.10)
+_ICONDIR = struct.Struct('<HHH')
+_ICONDIRENTRY = struct.Struct('<BBBBHHII')
+_CURSOR_TYPE = 2
+
+
+def cursor_resource_from_file(data):
+    """ Convert the content of a `.cur` file to the cursor resource format expected by `CreateIconFromResourceEx`.
+
+    The resource of a cursor is the image (DIB or PNG) of the first entry of the file, prefixed with its hotspot.
+    """
+    reserved, image_type, count = _ICONDIR.unpack_from(data)
+    if reserved != 0 or image_type != _CURSOR_TYPE or count < 1:
+        raise ValueError('Not a cursor file')
+
+    _width, _height, _colors, _reserved, x_hotspot, y_hotspot, size, offset = _ICONDIRENTRY.unpack_from(
+        data, _ICONDIR.size
+    )
+    if offset + size > len(data):
+        raise ValueError('Truncated cursor file')
+    return struct.pack('<HH', x_hotspot, y_hotspot) + bytes(data[offset:offset + size])
+
+
+class CursorCache:
+    """ Load a cursor once per process and hand out copies of it.
+
+    :param path: The path of the `.cur` file. If the file does not exist (e.g. wingrab is run from a zip archive), the
+        cursor is read from the `resource` of `package` instead.
+    """
+
+    def __init__(self, path, *, package=__package__, resource='cursor.cur'):
+        self.path = path
+        self.package = package
+        self.resource = resource
+
+        self._lock = threading.Lock()
+        # The (size, mtime) of the file the cursor has been loaded from, `None` for the embedded resource
+        self._signature = None
+        self._resource = None
+        # The cursor created from the resource, per backend
+        self._cursors = {}
+
+        # Counters and timings (in seconds), see `record()`
+        self.stats = {
+            'loads': 0,
+            'copies': 0,
+            'patch_count': 0,
+            'patch_seconds': 0.0,
+            'restore_count': 0,
+            'restore_seconds': 0.0,
+            # The restores which have reloaded the whole cursor scheme, see `CursorPatch.restore()`
+            'scheme_reloads': 0,
+        }
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _load(self, signature):
+        """ Read the cursor resource from the file, or from the package data if there is no file. """
+        data = None
+        if signature is not None:
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                signature = None
+        if data is None:
+            data = pkgutil.get_data(self.package, self.resource)
+
+        self.stats['loads'] += 1
+        self._resource = cursor_resource_from_file(data)
+        self._signature = signature
+
+    def _get_master(self, backend, check):
+        if self._resource is None or check:
+            signature = self._stat()
+            if self._resource is None or signature != self._signature:
+                # The file has changed, the cursors created from the old content are stale.
+                for stale_backend, cursor in self._cursors.items():
+                    if cursor:
+                        stale_backend.destroy_cursor(cursor)
+                self._cursors.clear()
+                self._load(signature)
+
+        cursor = self._cursors.get(backend)
+        if cursor is None:
+            cursor = self._cursors[backend] = backend.create_cursor_from_resource(self._resource)
+            # Released through the cache, which must not hand out copies of a destroyed cursor.
+            tracker.add('cursor', cursor, functools.partial(self._release_master, backend))
+        return cursor
+
+    def _release_master(self, backend, cursor):
+        """ Destroy the cursor `cursor` created for `backend`, see `wingrab.resources.ResourceTracker.release_all()`.
+        """
+        with self._lock:
+            if self._cursors.get(backend) == cursor:
+                del self._cursors[backend]
+        backend.destroy_cursor(cursor)
+
+    def copy(self, backend, *, check=True):
+        """ Return a new cursor handle owned by the caller, or `None` if the cursor cannot be created.
+
+        :param check: Whether to check that the file has not changed first, once per patch is enough: the file lives in
+            the profile of the user, which may be on a slow network disk.
+        """
+        with self._lock:
+            cursor = self._get_master(backend, check)
+            if not cursor:
+                return None
+            copy = backend.copy_cursor(cursor)
+            if copy:
+                self.stats['copies'] += 1
+            return copy
+
+    def warm(self, backend):
+        """ Load the cursor and create it for `backend` ahead of the first `copy()`, e.g. when a server starts. """
+        with self._lock:
+            self._get_master(backend, True)
+
+    def clear(self):
+        """ Destroy the cached cursors and forget the loaded file. """
+        with self._lock:
+            for backend, cursor in self._cursors.items():
+                if cursor:
+                    backend.destroy_cursor(cursor)
+            self._cursors.clear()
+            self._resource = None
+            self._signature = None
+
+    def record(self, name, started):
+        """ Add the time elapsed since `started` (from `time.perf_counter()`) to the `name` counters. """
+        self.stats[name + '_count'] += 1
+        self.stats[name + '_seconds'] += time.perf_counter() - started
+
+
+class CursorJournal:
+    """ The file recording the system cursors replaced by the running grab, see `recover_cursors()`. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, entry):
+        """ Replace the content of the journal with the dict `entry`, atomically. """
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, self.path)
+
+    def read(self):
+        """ :return: The dict written by `write()`, or `None` if there is no journal or it cannot be read. """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class CursorPatch:
+    """ The system cursors `cursor_ids` replaced by a grab, and the copies of the original cursors to put back.
+
+    `apply()` is split into `prepare()` and `commit()`, so that a prepared grab (see `wingrab.prepared`) makes the
+    cursors ahead of time and only sets them when it is activated.
+
+    :param journal: The `CursorJournal` written before the cursors are replaced, if any.
+    """
+
+    def __init__(self, backend, cursor_ids, *, journal=None):
+        self.backend = backend
+        self.cursor_ids = tuple(cursor_ids)
+        self.journal = journal
+        # cursor id -> the copy of the original cursor, owned by us until it is set back
+        self._originals = {}
+        # cursor id -> the cursor made by `prepare()`, owned by us until it is set
+        self._replacements = {}
+        # The ids of the cursors replaced so far
+        self._patched = []
+
+    def apply(self, make_cursor):
+        """ Take a copy of the cursors, then replace them with the cursors made by `make_cursor()`.
+
+        If it fails, the cursors replaced so far are put back before the error is raised.
+        """
+        self.prepare(make_cursor)
+        self.commit()
+
+    def prepare(self, make_cursor):
+        """ The first half of `apply()`: take a copy of the cursors and make their replacements, without replacing any
+        cursor yet.  The copies are those of the cursors at the time of the call, which `restore()` puts back.
+        """
+        backend = self.backend
+        try:
+            for cursor_id in self.cursor_ids:
+                self._originals[cursor_id] = backend.snapshot_system_cursor(cursor_id)
+
+            if self.journal is not None:
+                pid = os.getpid()
+                try:
+                    self.journal.write({
+                        'pid': pid,
+                        'start_time': backend.get_process_start_time(pid),
+                        'cursors': list(self.cursor_ids),
+                        'scheme': {str(cursor_id): path for cursor_id, path in backend.get_cursor_scheme().items()},
+                    })
+                except OSError:
+                    # The grab goes on without crash recovery.
+                    pass
+
+            for cursor_id in self.cursor_ids:
+                cursor = make_cursor()
+                if cursor:
+                    self._replacements[cursor_id] = cursor
+        except BaseException:
+            self.restore()
+            raise
+
+    def commit(self):
+        """ The second half of `apply()`: replace the cursors with those made by `prepare()`. """
+        backend = self.backend
+        try:
+            for cursor_id in self.cursor_ids:
+                cursor = self._replacements.pop(cursor_id, None)
+                if cursor is None:
+                    continue
+                if backend.set_system_cursor(cursor, cursor_id):
+                    self._patched.append(cursor_id)
+                else:
+                    # Not taken over by the system, still ours.
+                    backend.destroy_cursor(cursor)
+        except BaseException:
+            self.restore()
+            raise
+
+    def restore(self):
+        """ Put the original cursors back.
+
+        :return: True if every cursor has been set back from its copy, False if the whole scheme has been reloaded.
+        """
+        backend = self.backend
+        is_precise = True
+        for cursor_id in self._patched:
+            original = self._originals.pop(cursor_id, None)
+            if original and backend.set_system_cursor(original, cursor_id):
+                continue
+            is_precise = False
+            if original:
+                backend.destroy_cursor(original)
+        self._patched.clear()
+
+        # The copies of the cursors which have not been replaced, and the replacements which have not been set
+        for cursor in list(self._originals.values()) + list(self._replacements.values()):
+            if cursor:
+                backend.destroy_cursor(cursor)
+        self._originals.clear()
+        self._replacements.clear()
+
+        if not is_precise:
+            backend.restore_system_cursors()
+        if self.journal is not None:
+            self.journal.remove()
+        return is_precise
+
+
+def recover_cursors(backend, journal):
+    """ Restore the cursors recorded in `journal` by a grab whose process has exited without restoring them.
+
+    The cursors are loaded again from the files of the cursor scheme recorded in the journal.  The scheme is only
+    reloaded as a whole when a cursor has no file (built-in cursor) or fails to load.
+
+    :return: True if cursors have been restored, False if there is no journal or its grab is still running.
+    """
+    entry = journal.read()
+    if entry is None:
+        return False
+
+    pid, start_time = entry.get('pid'), entry.get('start_time')
+    if start_time is not None:
+        is_running = backend.get_process_start_time(pid) == start_time
+    else:
+        is_running = pid == os.getpid()
+    if is_running:
+        return False
+
+    scheme = entry.get('scheme') or {}
+    cursor_ids = entry.get('cursors') or ()
+    paths = [scheme.get(str(cursor_id)) for cursor_id in cursor_ids]
+    # Reloading the scheme restores all the cursors at once, including those with a file.
+    needs_reload = not all(paths)
+    if not needs_reload:
+        for cursor_id, path in zip(cursor_ids, paths):
+            cursor = backend.load_cursor_from_file(path)
+            if cursor and backend.set_system_cursor(cursor, cursor_id):
+                continue
+            needs_reload = True
+            if cursor:
+                backend.destroy_cursor(cursor)
+
+    if needs_reload:
+        backend.restore_system_cursors()
+    journal.remove()
+    return True
@@ -0,0 +1,180 @@
+# -*- encoding:utf-8 -*-
+
+"""
+A spatial index of the top-level windows, answering point -> window lookups without any system call.
+
+Following the window under the cursor (`wingrab.stream(hover=True)`) means one `WindowFromPoint` and one
+`GetWindowThreadProcessId` per mouse move.  `WindowIndex` takes a snapshot of the visible top-level windows
+(`Backend.enum_windows()`), spreads their rectangles over a grid of square cells, and answers lookups from the cell of
+the point.  It is kept up to date by the window events of the backend:
+
+- `move`: the rectangle of the window is updated in place.
+- `hide`, `destroy`: the window is removed.
+- `show`, `zorder`: the z-order cannot be known from the event, the next lookup takes a new snapshot.
+
+The snapshot is taken again after `max_age` seconds anyway, in case an event was missed.  A lookup finding no window
+is a miss, and the caller falls back to `WindowFromPoint`.
+
+The index knows the top-level windows only, so a hit returns the top-level window under the point rather than the child
+window `WindowFromPoint` would return.  The PID is the same, except for the top-level windows hosting the windows of
+other processes, e.g. the frame of a UWP application (`ApplicationFrameHost.exe`) around the window of the application:
+the snapshot finds them (`Backend.get_child_pids()`), and a lookup landing on one of them is a miss, so that the caller
+asks `WindowFromPoint` for the child.
+"""
+import bisect
+import threading
+import time
+
+__all__ = ['WindowIndex']
+
+
+class WindowIndex:
+    """ A grid of `cell_size` pixels over the rectangles of the top-level windows, see the module documentation. """
+
+    def __init__(self, *, cell_size=256, max_age=5.0):
+        self.cell_size = cell_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._backend = None
+        self._event_hook = None
+
+        # hwnd -> (z, rect, pid), z being the position of the window in the snapshot (0 for the topmost window)
+        self._windows = {}
+        # The windows hosting child windows of other processes, looked up with `WindowFromPoint`
+        self._hosts = set()
+        # (column, row) -> sorted list of (z, hwnd)
+        self._cells = {}
+        self._is_dirty = True
+        self._snapshot_time = 0.0
+
+        # Counters
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        # The misses on a window hosting other processes
+        self.hosted = 0
+        self.rebuilds = 0
+        self.updates = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hosted': self.hosted,
+            'hit_rate': self.hit_rate,
+            'rebuilds': self.rebuilds,
+            'updates': self.updates,
+        }
+
+    def attach(self, backend):
+        """ Index the windows of `backend` and follow their changes. Must be called on a thread pumping messages. """
+        self._backend = backend
+        self._event_hook = backend.set_window_event_hook(self.on_window_event)
+        self.invalidate()
+
+    def detach(self):
+        """ Stop following the changes of the windows, the next lookups are all misses. """
+        if self._event_hook is not None:
+            self._backend.unhook_window_events(self._event_hook)
+            self._event_hook = None
+        with self._lock:
+            self._backend = None
+            self._windows.clear()
+            self._hosts.clear()
+            self._cells.clear()
+
+    def invalidate(self):
+        """ Take a new snapshot at the next lookup. """
+        self._is_dirty = True
+
+    def _cell_range(self, rect):
+        left, top, right, bottom = rect
+        size = self.cell_size
+        return range(left // size, (right - 1) // size + 1), range(top // size, (bottom - 1) // size + 1)
+
+    def _add(self, hwnd, z, rect, pid):
+        self._windows[hwnd] = (z, rect, pid)
+        columns, rows = self._cell_range(rect)
+        for column in columns:
+            for row in rows:
+                bisect.insort(self._cells.setdefault((column, row), []), (z, hwnd))
+
+    def _remove(self, hwnd):
+        entry = self._windows.pop(hwnd, None)
+        if entry is None:
+            return None
+        z, rect, pid = entry
+        columns, rows = self._cell_range(rect)
+        for column in columns:
+            for row in rows:
+                cell = self._cells.get((column, row))
+                if cell is not None:
+                    cell.remove((z, hwnd))
+                    if not cell:
+                        del self._cells[column, row]
+        return entry
+
+    def _rebuild(self):
+        """ Take a new snapshot of the windows. Lock must be held. """
+        backend = self._backend
+        self._windows.clear()
+        self._hosts.clear()
+        self._cells.clear()
+        for z, (hwnd, rect, pid) in enumerate(backend.enum_windows()):
+            self._add(hwnd, z, tuple(rect), pid)
+            if backend.get_child_pids(hwnd) - {pid}:
+                self._hosts.add(hwnd)
+        self._is_dirty = False
+        self._snapshot_time = time.monotonic()
+        self.rebuilds += 1
+
+    def on_window_event(self, event, hwnd):
+        """ Apply a window event of the backend. """
+        if event == 'show' or event == 'zorder':
+            self._is_dirty = True
+            return
+
+        with self._lock:
+            if self._is_dirty:
+                return
+            if event == 'move':
+                entry = self._remove(hwnd)
+                if entry is not None:
+                    rect = self._backend.get_window_rect(hwnd)
+                    if rect is not None and rect[0] < rect[2] and rect[1] < rect[3]:
+                        self._add(hwnd, entry[0], tuple(rect), entry[2])
+                    self.updates += 1
+            elif event == 'hide' or event == 'destroy':
+                self._hosts.discard(hwnd)
+                if self._remove(hwnd) is not None:
+                    self.updates += 1
+
+    def lookup(self, x, y):
+        """ :return: The `(hwnd, pid)` of the topmost indexed window containing the point, or `None` on a miss. """
+        with self._lock:
+            self.lookups += 1
+            if self._backend is None:
+                self.misses += 1
+                return None
+            if self._is_dirty or time.monotonic() - self._snapshot_time > self.max_age:
+                self._rebuild()
+
+            size = self.cell_size
+            for z, hwnd in self._cells.get((x // size, y // size), ()):
+                left, top, right, bottom = self._windows[hwnd][1]
+                if left <= x < right and top <= y < bottom:
+                    if hwnd in self._hosts:
+                        # The PID of the top-level window may not be the one of the child under the point.
+                        self.hosted += 1
+                        break
+                    self.hits += 1
+                    return hwnd, self._windows[hwnd][2]
+
+            self.misses += 1
+            return None
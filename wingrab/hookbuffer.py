@@ -0,0 +1,158 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The hand-off between the low-level mouse hook and the worker thread of a session.
+
+Windows silently removes a low-level hook whose procedure takes longer than `LowLevelHooksTimeout`, so the hook
+procedure does as little as possible: it copies the `MSLLHOOKSTRUCT` into a preallocated `EventRing` and returns.  The
+events are then handled (window lookup, debug logging) on a worker thread draining the ring.
+
+`LatencyRecorder` keeps the durations of the recent hook calls, to check how far the hook is from the timeout (see
+`wingrab.watchdog`).
+"""
+import bisect
+import threading
+
+from array import array
+from ctypes import addressof, memmove, sizeof
+from ctypes.wintypes import WPARAM
+
+from .winuser import MSLLHOOKSTRUCT
+
+__all__ = ['EventRing', 'LatencyRecorder', 'HISTOGRAM_BOUNDS']
+
+# The upper bounds (in seconds) of the buckets of `LatencyRecorder.histogram()`
+HISTOGRAM_BOUNDS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 1.0)
+
+
+class EventRing:
+    """ A fixed-size ring buffer of `(wParam, MSLLHOOKSTRUCT, trigger)` records, with one producer and one consumer.
+
+    `trigger` flags the event triggering the session, e.g. the release of the button of the grab (see `wingrab.masks`).
+
+    When the consumer falls behind by more than `capacity` records, the oldest ones are overwritten and counted in
+    `dropped`.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._records = (MSLLHOOKSTRUCT * capacity)()
+        self._messages = (WPARAM * capacity)()
+        self._triggers = bytearray(capacity)
+        self._record_size = sizeof(MSLLHOOKSTRUCT)
+        # The address of each record, computed once: the address arithmetic would allocate large ints in the hook.
+        base = addressof(self._records)
+        self._addresses = tuple(base + index * self._record_size for index in range(capacity))
+
+        # The total number of records written and read
+        self._written = 0
+        self._read = 0
+        self.dropped = 0
+
+        self._ready = threading.Event()
+
+    def push(self, wParam, lParam, trigger=False):
+        """ Copy the `MSLLHOOKSTRUCT` at address `lParam` into a preallocated slot. Called by the hook.
+
+        No ctypes structure, pointer or copy is created per event, the record is copied with `memmove()` between fixed
+        addresses.  The call still allocates short-lived objects: the arguments converted by the ctypes call and the
+        address it returns, and the ints of the counter past the small int cache (see `benchmarks/bench_hook.py`).
+        """
+        index = self._written % self.capacity
+        memmove(self._addresses[index], lParam, self._record_size)
+        self._messages[index] = wParam
+        self._triggers[index] = trigger
+        self._written += 1
+        # `set()` takes the lock of the event and notifies its waiters, only needed when the consumer may be waiting:
+        # the consumer clears the event before draining, so a record written before the check is always drained.
+        if not self._ready.is_set():
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        """ Block until records are pushed or `wake()` is called. """
+        self._ready.wait(timeout)
+        self._ready.clear()
+
+    def wake(self):
+        self._ready.set()
+
+    def drain(self, callback):
+        """ Call `callback(wParam, info, trigger)` for every pending record, `info` being a copy of the structure.
+
+        :return: The number of records handled.
+        """
+        capacity = self.capacity
+        written = self._written
+        read = self._read
+        if written - read > capacity:
+            self.dropped += written - read - capacity
+            read = written - capacity
+
+        count = 0
+        for position in range(read, written):
+            index = position % capacity
+            wParam = self._messages[index]
+            trigger = bool(self._triggers[index])
+            info = MSLLHOOKSTRUCT.from_buffer_copy(self._records[index])
+            if self._written - position > capacity:
+                # Overwritten by the producer while being copied
+                self.dropped += 1
+                continue
+            callback(wParam, info, trigger)
+            count += 1
+
+        self._read = written
+        return count
+
+    @property
+    def pending(self):
+        return min(self._written - self._read, self.capacity)
+
+
+class LatencyRecorder:
+    """ Keep the last `capacity` durations (in seconds) and report their percentiles. """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._samples = array('d', bytes(8 * capacity))
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self._samples[self.count % self.capacity] = seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def reset(self):
+        self.count = 0
+        self.max = 0.0
+
+    def since(self, count):
+        """ :return: The samples recorded since `count` samples had been recorded, as far as they are kept. """
+        if count > self.count:
+            # Reset in the meantime
+            count = 0
+        start = max(count, self.count - self.capacity)
+        return [self._samples[position % self.capacity] for position in range(start, self.count)]
+
+    def histogram(self, bounds=HISTOGRAM_BOUNDS):
+        """ :return: A dict with the upper `bounds` of the buckets and the `counts` of the samples in each bucket, the
+            last count being the samples above the last bound.
+        """
+        counts = [0] * (len(bounds) + 1)
+        for seconds in self._samples[:min(self.count, self.capacity)]:
+            counts[bisect.bisect_left(bounds, seconds)] += 1
+        return {'bounds': list(bounds), 'counts': counts}
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """ :return: A dict with the `count`, the `max` and the `p<N>` percentiles (in seconds) of the samples. """
+        samples = sorted(self._samples[:min(self.count, self.capacity)])
+        result = {'count': self.count, 'max': self.max}
+        for percent in percents:
+            if samples:
+                rank = min(len(samples) - 1, max(0, int(round(percent / 100 * len(samples))) - 1))
+                result[f'p{percent}'] = samples[rank]
+            else:
+                result[f'p{percent}'] = 0.0
+        return result
@@ -0,0 +1,589 @@
+# -*- encoding:utf-8 -*-
+
+"""
+An out-of-process host for the low-level mouse hook.
+
+Windows calls a low-level hook procedure for every mouse event of the desktop, and the event waits for it before
+reaching any window.  With the `hook` input (see `wingrab.inputs`) the procedure runs in the interpreter of the
+application, so any thread holding the GIL for a while (a GUI, a computation...) stalls the mouse of the whole desktop.
+
+With the `host` input, a small child process (running `wingrab.hookhost.main()`) owns the hook and its message loop
+instead.  The session compiles its `EventMask` in the child, so the click of the grab is still swallowed, and the child
+publishes the observed events into a ring buffer in shared memory, which the application reads on a thread of its
+own::
+
+    pid = wingrab.grab(input_backend='host')
+
+The ring is a memory-mapped file in the temporary directory: a `_RingHeader` followed by `_HostRecord` slots.  It has a
+single writer (the hook of the child) and a single reader (the application), and no lock:
+
+- Each slot carries a sequence number, the position of the record plus one.  The writer zeroes it, writes the record,
+  stores the sequence, then the total count of records `written` in the header.  The reader copies the slot and keeps
+  it only if its sequence matched before and after the copy, so a slot overwritten during the copy is dropped instead
+  of being read torn.  This relies on the stores being seen in order, as on x86 and x64.
+- The reader stores the count of records it has read in `read`, and sets `waiting` before blocking on the standard
+  output of the child.  The writer rings it (writes a newline) only when `waiting` is set, so the hook does not make a
+  system call per event while the reader keeps up.  The message loop of the child re-checks `waiting` every
+  `BELL_INTERVAL` seconds, in case both sides have missed each other.
+
+The child is started on the first hosted session and kept for the next ones, it exits when the application closes its
+standard input.  The control messages are JSON lines: `{"op": "start", "mask": {...}, "observe_all": false}` and
+`{"op": "stop"}` on the standard input of the child, answered by `{"op": "started"}`, `{"op": "stopped"}` or
+`{"op": "error", "message": "..."}` on its standard output, between the rings of the doorbell.  A running session can
+change its mask with `{"op": "mask", "mask": {...}, "observe_all": false}`, answered by `{"op": "masked"}`, without
+reinstalling the hook.
+
+The `simulated` backend only exists in the application, so its host runs on a thread of the application instead of a
+child process, over the same shared memory and pipes.
+"""
+import atexit
+import json
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from ctypes import Structure, addressof, memmove, sizeof, c_ubyte, c_uint32, c_uint64
+from queue import Empty, SimpleQueue
+
+from .backends import get_backend
+from .masks import EventMask
+from .msgloop import run_message_loop
+from .resources import tracker
+from .winuser import HC_ACTION, MSLLHOOKSTRUCT
+
+__all__ = ['HookHost', 'get_host', 'close_hosts', 'serve', 'BELL_INTERVAL']
+
+MAGIC = b'WGHOST01'
+VERSION = 1
+
+# The longest time (in seconds) an event waits in the ring when the reader and the writer have missed each other
+BELL_INTERVAL = 0.05
+
+# The longest time (in seconds) to wait for the answer of the host to a control message
+_REPLY_TIMEOUT = 10.0
+
+_BELL = b'\n'
+
+
+class _RingHeader(Structure):
+    _fields_ = (('magic', c_ubyte * 8),
+                ('version', c_uint32),
+                # The size of a record, which depends on the pointer size of the processes
+                ('record_size', c_uint32),
+                ('capacity', c_uint64),
+                # The total number of records written by the host
+                ('written', c_uint64),
+                # The total number of records read by the application
+                ('read', c_uint64),
+                # Set by the application before it blocks waiting for the doorbell
+                ('waiting', c_uint32),
+                # The PID of the host
+                ('pid', c_uint32))
+
+
+class _HostRecord(Structure):
+    _fields_ = (('sequence', c_uint64),
+                ('wParam', c_uint64),
+                ('trigger', c_uint64),
+                ('info', MSLLHOOKSTRUCT))
+
+
+_HEADER_SIZE = sizeof(_RingHeader)
+_RECORD_SIZE = sizeof(_HostRecord)
+
+
+class _SharedRing:
+    """ The ring buffer shared by the host and the application, mapped from the file `path`. """
+
+    def __init__(self, path, capacity=None):
+        self.path = path
+        if capacity is not None:
+            # Created by the application
+            with open(path, 'w+b') as f:
+                f.truncate(_HEADER_SIZE + capacity * _RECORD_SIZE)
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        self.header = _RingHeader.from_buffer(self._map)
+        if capacity is not None:
+            self.header.magic[:] = MAGIC
+            self.header.version = VERSION
+            self.header.record_size = _RECORD_SIZE
+            self.header.capacity = capacity
+        elif bytes(self.header.magic) != MAGIC or self.header.version != VERSION:
+            raise ValueError(f'{path} is not a WinGrab hook host ring')
+        elif self.header.record_size != _RECORD_SIZE:
+            raise ValueError(f'{path} has been created by a process with another pointer size')
+
+        self.capacity = self.header.capacity
+        # The slots viewed as 64-bit words, so that the sequence numbers are stored without creating any ctypes object
+        self._words = (c_uint64 * (self.capacity * _RECORD_SIZE // 8)).from_buffer(self._map, _HEADER_SIZE)
+        self._stride = _RECORD_SIZE // 8
+        base = addressof(self._words)
+        self._addresses = tuple(base + index * _RECORD_SIZE for index in range(self.capacity))
+
+    def close(self):
+        if self._map is None:
+            return
+        # The views must be released before the map is closed.
+        del self._words, self.header
+        self._map.close()
+        self._map = None
+        self._file.close()
+
+
+class _RingWriter(_SharedRing):
+    """ The host side of the ring, with the `push()` of a `wingrab.hookbuffer.EventRing`. """
+
+    def __init__(self, path, bell):
+        super().__init__(path)
+        self._bell = bell
+        self._info_offset = _HostRecord.info.offset
+        self._info_size = sizeof(MSLLHOOKSTRUCT)
+        self.written = self.header.written
+        self.header.pid = os.getpid()
+
+    def push(self, wParam, lParam, trigger=False):
+        """ Copy the `MSLLHOOKSTRUCT` at address `lParam` to the next slot. Called by the hook procedure. """
+        position = self.written
+        index = position % self.capacity
+        words = self._words
+        slot = index * self._stride
+        words[slot] = 0
+        words[slot + 1] = wParam
+        words[slot + 2] = trigger
+        memmove(self._addresses[index] + self._info_offset, lParam, self._info_size)
+        self.written = position + 1
+        words[slot] = position + 1
+        header = self.header
+        header.written = position + 1
+        if header.waiting:
+            header.waiting = 0
+            self._bell()
+
+    def check_bell(self):
+        """ Ring the reader if it waits while records are pending, in case it has missed the last ring. """
+        header = self.header
+        if header.waiting and header.read != header.written:
+            header.waiting = 0
+            self._bell()
+
+
+class _RingReader(_SharedRing):
+    """ The application side of the ring. """
+
+    def __init__(self, path, capacity):
+        super().__init__(path, capacity)
+        self._record = _HostRecord()
+        self._record_address = addressof(self._record)
+        self._info_address = addressof(self._record.info)
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        return self.header.written != self.header.read
+
+    def drain(self, callback):
+        """ Call `callback(wParam, lParam, trigger)` for every pending record, `lParam` being the address of a copy of
+        its `MSLLHOOKSTRUCT`, valid during the call.
+
+        :return: The number of records handled.
+        """
+        header = self.header
+        capacity = self.capacity
+        words = self._words
+        stride = self._stride
+        record = self._record
+        written = header.written
+        read = header.read
+        if written - read > capacity:
+            self.dropped += written - read - capacity
+            read = written - capacity
+
+        count = 0
+        for position in range(read, written):
+            index = position % capacity
+            memmove(self._record_address, self._addresses[index], _RECORD_SIZE)
+            if record.sequence != position + 1 or words[index * stride] != position + 1:
+                # Overwritten by the host while being copied
+                self.dropped += 1
+                continue
+            callback(record.wParam, self._info_address, bool(record.trigger))
+            count += 1
+
+        header.read = written
+        return count
+
+
+def _mask_to_json(mask):
+    return {'button': mask.button, 'modifiers': sorted(mask.modifiers), 'moves': mask.moves, 'wheel': mask.wheel,
+            'buttons': mask.buttons}
+
+
+def _mask_from_json(data):
+    return EventMask(data['button'], modifiers=data['modifiers'], moves=data['moves'], wheel=data['wheel'],
+                     buttons=data['buttons'])
+
+
+# region Host
+class _Host:
+    """ The hook of the host, installed for each session of the application. """
+
+    def __init__(self, path, events, backend):
+        self._events = events
+        self._events_lock = threading.Lock()
+        self._backend = backend
+        self._ring = _RingWriter(path, self._ring_bell)
+        # The dispatch table of the current session, see `EventMask.compile()`
+        self._dispatch = {}
+        self._commands = SimpleQueue()
+        self._queue = None
+        self._is_stopping = False
+
+    def _write(self, data):
+        try:
+            with self._events_lock:
+                self._events.write(data)
+                self._events.flush()
+        except OSError:
+            # The application is gone, the host exits once its standard input is closed.
+            pass
+
+    def _ring_bell(self):
+        self._write(_BELL)
+
+    def _reply(self, op, **fields):
+        self._write(json.dumps(dict(op=op, **fields)).encode() + b'\n')
+
+    def _proc(self, nCode, wParam, lParam):
+        if nCode == HC_ACTION:
+            handler = self._dispatch.get(wParam)
+            if handler is not None and handler(wParam, lParam):
+                return 1
+        return self._backend.call_next_hook(nCode, wParam, lParam)
+
+    def read_commands(self, commands):
+        """ Read the control messages of the application, until it closes `commands`. """
+        try:
+            for line in commands:
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                except ValueError:
+                    self._reply('error', message=f'Invalid command: {line!r}')
+                    continue
+                op = command.get('op')
+                if op == 'stop':
+                    self._stop()
+                elif op == 'mask':
+                    self._set_mask(command)
+                else:
+                    self._commands.put(command)
+        finally:
+            self._stop()
+            self._commands.put(None)
+
+    def _set_mask(self, command):
+        """ Replace the dispatch table of the running session, the hook stays installed. """
+        if self._queue is None:
+            self._reply('error', message='No session is running.')
+            return
+        try:
+            mask = _mask_from_json(command['mask'])
+            self._dispatch = mask.compile(self._ring, self._backend, observe_all=command.get('observe_all', False))
+        except Exception as e:
+            self._reply('error', message=f'{type(e).__name__}: {e}')
+            return
+        self._reply('masked')
+
+    def _stop(self):
+        self._is_stopping = True
+        queue = self._queue
+        if queue is not None:
+            queue.wake()
+
+    def _is_finished(self):
+        self._ring.check_bell()
+        return self._is_stopping
+
+    def run(self):
+        """ Run the sessions of the application, until it closes the standard input of the host. """
+        try:
+            while True:
+                command = self._commands.get()
+                if command is None:
+                    break
+                if command.get('op') != 'start':
+                    self._reply('error', message=f'Unknown command: {command.get("op")!r}')
+                    continue
+                self._run_session(command)
+        finally:
+            self._ring.close()
+
+    def _run_session(self, command):
+        backend = self._backend
+        self._is_stopping = False
+        try:
+            mask = _mask_from_json(command['mask'])
+            self._dispatch = mask.compile(self._ring, backend, observe_all=command.get('observe_all', False))
+            self._queue = queue = backend.create_message_queue()
+            hook = backend.set_mouse_hook(self._proc)
+        except Exception as e:
+            self._queue = None
+            self._reply('error', message=f'{type(e).__name__}: {e}')
+            return
+
+        self._reply('started')
+        try:
+            run_message_loop(queue, self._is_finished, poll_interval=BELL_INTERVAL)
+        finally:
+            backend.unhook(hook)
+            self._dispatch = {}
+            self._queue = None
+            queue.close()
+            self._reply('stopped')
+
+
+def serve(path, commands, events, backend=None):
+    """ Run a hook host on the current thread, until `commands` is closed.
+
+    :param path: The path of the ring created by the application.
+    :param commands: The binary file of the control messages of the application.
+    :param events: The binary file of the doorbell and of the answers to the application.
+    :param backend: The backend of the hook, the current backend by default.
+    """
+    host = _Host(path, events, backend if backend is not None else get_backend())
+    threading.Thread(target=host.read_commands, args=(commands,), name='wingrab-host-commands', daemon=True).start()
+    host.run()
+# endregion
+
+
+# region Application
+class HookHost:
+    """ The application side of a hook host: starts the host, and hands the events of a session to `proc`.
+
+    :param backend: The backend of the sessions. A host process is started for the `win32` backend, a host thread for
+        the others, whose desktop only exists in the current process.
+    :param capacity: The number of records of the ring.
+    :param command: The command line of the host process, followed by the path of the ring, e.g. to start a host with
+        its own simulated desktop. `main()` by default for the `win32` backend.
+    """
+
+    def __init__(self, backend, capacity=4096, *, command=None):
+        self.backend = backend
+        self.capacity = capacity
+        fd, self.path = tempfile.mkstemp(prefix='wingrab-host-', suffix='.ring')
+        os.close(fd)
+        self._ring = _RingReader(self.path, capacity)
+        self._process = None
+        self._thread = None
+        self._replies = SimpleQueue()
+        self._lock = threading.Lock()
+        # The `proc` and `on_lost` callbacks of the current session
+        self._proc = None
+        self._on_lost = None
+        self.is_alive = False
+
+        if command is None and backend.name == 'win32':
+            command = [sys.executable, '-c', 'from wingrab.hookhost import main; main()']
+        if command is not None:
+            self._start_process(command)
+        else:
+            self._start_thread()
+        self.is_alive = True
+        self._reader = threading.Thread(target=self._read_events, name='wingrab-host-reader', daemon=True)
+        self._reader.start()
+        tracker.add('hook_host', self, HookHost.close)
+
+    def _start_process(self, command):
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, WINGRAB_BACKEND=self.backend.name)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (package_root, env.get('PYTHONPATH'))))
+        self._process = subprocess.Popen(
+            list(command) + [self.path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0, env=env,
+            # Do not open a console window for a GUI application
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0),
+        )
+        self._commands = self._process.stdin
+        self._events = self._process.stdout
+
+    def _start_thread(self):
+        commands_read, commands_write = os.pipe()
+        events_read, events_write = os.pipe()
+        self._commands = os.fdopen(commands_write, 'wb', buffering=0)
+        self._events = os.fdopen(events_read, 'rb', buffering=0)
+        self._thread = threading.Thread(
+            target=self._serve_thread, args=(os.fdopen(commands_read, 'rb'), os.fdopen(events_write, 'wb')),
+            name='wingrab-host', daemon=True,
+        )
+        self._thread.start()
+
+    def _serve_thread(self, commands, events):
+        with commands, events:
+            serve(self.path, commands, events, self.backend)
+
+    @property
+    def pid(self):
+        """ The PID of the host, the current one for a host thread. """
+        return self._ring.header.pid if self.is_alive else None
+
+    @property
+    def dropped(self):
+        """ The number of events dropped because the application has fallen behind the host. """
+        return self._ring.dropped
+
+    def _deliver(self, wParam, lParam, trigger):
+        proc = self._proc
+        if proc is not None:
+            proc(wParam, lParam, trigger)
+
+    def _read_events(self):
+        ring = self._ring
+        header = ring.header
+        events = self._events
+        try:
+            while True:
+                header.waiting = 1
+                if ring.pending:
+                    header.waiting = 0
+                    ring.drain(self._deliver)
+                    continue
+                line = events.readline()
+                if not line:
+                    break
+                if line == _BELL:
+                    continue
+                reply = json.loads(line)
+                if reply.get('op') == 'stopped':
+                    # The hook is removed: the ring holds the last events of the session.
+                    ring.drain(self._deliver)
+                self._replies.put(reply)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.is_alive = False
+            self._replies.put({'op': 'error', 'message': 'The hook host has exited.'})
+            on_lost = self._on_lost
+            if on_lost is not None:
+                on_lost(RuntimeError('The hook host has exited.'))
+
+    def _send(self, op, **fields):
+        """ Send a control message to the host, and wait for its answer. """
+        if not self.is_alive:
+            raise RuntimeError('The hook host has exited.')
+        self._commands.write(json.dumps(dict(op=op, **fields)).encode() + b'\n')
+        self._commands.flush()
+        try:
+            reply = self._replies.get(timeout=_REPLY_TIMEOUT)
+        except Empty:
+            self.close()
+            raise RuntimeError('The hook host is not responding.') from None
+        if reply['op'] == 'error':
+            raise RuntimeError(reply['message'])
+        return reply
+
+    def begin(self, mask, proc, *, observe_all=False, on_lost=None):
+        """ Install the hook of a session in the host.
+
+        :param mask: The `EventMask` of the session, compiled by the host.
+        :param proc: Called as `proc(wParam, lParam, trigger)` on the reader thread for each event observed by the
+            session, see `EventRing.push()`.
+        :param observe_all: Hand every mouse event to `proc`.
+        :param on_lost: Called with a `RuntimeError` if the host exits during the session.
+        """
+        self._lock.acquire()
+        self._proc = proc
+        self._on_lost = on_lost
+        try:
+            self._send('start', mask=_mask_to_json(mask), observe_all=observe_all)
+        except BaseException:
+            self._proc = self._on_lost = None
+            self._lock.release()
+            raise
+
+    def set_mask(self, mask, *, observe_all=False):
+        """ Change the `EventMask` of the session, between `begin()` and `end()`. """
+        self._send('mask', mask=_mask_to_json(mask), observe_all=observe_all)
+
+    def end(self):
+        """ Remove the hook of the session, once all its events have been handed to `proc`. """
+        try:
+            if self.is_alive:
+                self._send('stop')
+        finally:
+            self._proc = self._on_lost = None
+            self._lock.release()
+
+    def close(self):
+        """ Stop the host. """
+        self.is_alive = False
+        try:
+            self._commands.close()
+        except OSError:
+            pass
+        if self._process is not None:
+            try:
+                self._process.wait(1)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        elif self._thread is not None:
+            self._thread.join(1)
+        self._reader.join(1)
+        if not self._reader.is_alive():
+            self._ring.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        tracker.discard('hook_host', self)
+
+
+# The hosts of the backends, backend -> HookHost
+_hosts = {}
+_hosts_lock = threading.Lock()
+_is_atexit_registered = False
+
+
+def get_host(backend):
+    """ :return: The `HookHost` of `backend`, started on first use or when the previous one has exited. """
+    global _is_atexit_registered
+    with _hosts_lock:
+        host = _hosts.get(backend)
+        if host is None or not host.is_alive:
+            if host is not None:
+                host.close()
+            if not _is_atexit_registered:
+                atexit.register(close_hosts)
+                _is_atexit_registered = True
+            _hosts[backend] = host = HookHost(backend)
+        return host
+
+
+def close_hosts():
+    """ Stop all the hosts. """
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+        _hosts.clear()
+    for host in hosts:
+        host.close()
+# endregion
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('Usage: python -c "from wingrab.hookhost import main; main()" RING_PATH', file=sys.stderr)
+        sys.exit(2)
+    # The standard output carries the doorbell, nothing else may be printed there.
+    events = os.fdopen(os.dup(sys.stdout.fileno()), 'wb', buffering=0)
+    sys.stdout = sys.stderr
+    serve(sys.argv[1], sys.stdin.buffer, events)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The sources of the mouse events of the grab sessions.
+
+- `hook` (the default): a `WH_MOUSE_LL` low-level mouse hook.  Every mouse event of the desktop waits for the hook
+  procedure, a Python function, before reaching the windows, and Windows silently removes a hook which takes longer than
+  `LowLevelHooksTimeout`.  In return the hook can swallow the click of the grab, which never reaches the clicked window.
+- `raw`: the Raw Input of the mouse, received by a message-only window of the session thread (`WM_INPUT`, read in
+  batches with `GetRawInputBuffer`).  The input of the desktop never waits for the interpreter, so a busy or slow
+  Python process does not make the mouse lag, but the clicks cannot be swallowed: the clicked window receives the click
+  as well.  The position of an event is the position of the cursor when the event is read.
+- `host`: a low-level mouse hook installed by a child process, which hands the events over through shared memory (see
+  `wingrab.hookhost`).  The clicks are swallowed as with `hook`, but the input of the desktop only waits for the child,
+  never for the interpreter of the application.
+
+The source is chosen with the `input_backend` argument of the grabs, or with the `WINGRAB_INPUT` environment variable::
+
+    pid = wingrab.grab(input_backend='raw')
+
+The sources hand the events to the same `wingrab.masks` dispatch table of the session (compiled by the child for
+`host`), so the sessions do not know which one is used.  They are all available with the `simulated` backend.
+"""
+import os
+
+from .hookhost import get_host
+
+__all__ = ['InputSource', 'HookInput', 'RawInput', 'HostedInput', 'register_input', 'get_input', 'INPUTS']
+
+# The registered sources, name -> InputSource
+INPUTS = {}
+
+
+class InputSource:
+    """ A source of mouse events, installed by a session on its thread for its lifetime. """
+
+    # The name of the source
+    name = None
+    # Whether the source can keep an event from the windows, e.g. the click of the grab
+    can_swallow = False
+    # Whether the system may remove the source without notice, so that the session runs `wingrab.watchdog`
+    may_be_removed = False
+
+    def install(self, session):
+        """ Start delivering the mouse events of `session` (a `_HookSession`), on its thread.
+
+        :return: The handle of the installation.
+        """
+        raise NotImplementedError
+
+    def uninstall(self, session, handle):
+        """ Stop delivering the mouse events of `session`. """
+        raise NotImplementedError
+
+    def update(self, session, handle):
+        """ Apply a change of the mask of `session` (see `_HookSession.set_mask()`), from any thread.  Nothing to do by
+        default: the procedure reads the dispatch table of the session on each event.
+        """
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.name!r}>'
+
+
+class HookInput(InputSource):
+    """ A low-level mouse hook calling `proc(nCode, wParam, lParam)`. """
+
+    name = 'hook'
+    can_swallow = True
+    may_be_removed = True
+
+    def __init__(self, proc):
+        self.proc = proc
+
+    def install(self, session):
+        return session.backend.set_mouse_hook(self.proc)
+
+    def uninstall(self, session, handle):
+        session.backend.unhook(handle)
+
+
+class RawInput(InputSource):
+    """ The raw input of the mouse, calling `proc(wParam, lParam)` for each event, see `Backend.register_raw_input()`.
+    """
+
+    name = 'raw'
+
+    def __init__(self, proc):
+        self.proc = proc
+
+    def install(self, session):
+        return session.backend.register_raw_input(self.proc)
+
+    def uninstall(self, session, handle):
+        session.backend.unregister_raw_input(handle)
+
+
+class HostedInput(InputSource):
+    """ A low-level mouse hook installed by a `wingrab.hookhost.HookHost`, calling `proc(wParam, lParam, trigger)` on
+    the reader thread of the host for each event observed by the session.
+
+    :param host: The `HookHost` of the sessions, the shared host of their backend by default.
+    """
+
+    name = 'host'
+    can_swallow = True
+
+    def __init__(self, proc, host=None):
+        self.proc = proc
+        self.host = host
+
+    def install(self, session):
+        host = self.host if self.host is not None else get_host(session.backend)
+        host.begin(session.mask, self.proc, observe_all=session.debug, on_lost=session.fail)
+        return host
+
+    def uninstall(self, session, host):
+        dropped = host.dropped
+        host.end()
+        session.ring.dropped += host.dropped - dropped
+
+    def update(self, session, host):
+        host.set_mask(session.mask, observe_all=session.debug)
+
+
+def register_input(source):
+    """ Register a source under its name. :return: `source`. """
+    INPUTS[source.name] = source
+    return source
+
+
+def get_input(source=None):
+    """ :return: The `InputSource` of `source`: a source, the name of a registered one, or `None` for the one named by
+        the `WINGRAB_INPUT` environment variable (`hook` by default).
+    """
+    if isinstance(source, InputSource):
+        return source
+    if source is None:
+        source = os.environ.get('WINGRAB_INPUT') or 'hook'
+    try:
+        return INPUTS[source]
+    except KeyError:
+        raise ValueError(f'Unknown input backend: {source!r}, expected one of {", ".join(INPUTS)}') from None
@@ -0,0 +1,211 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The lock ensuring that only one grab is running at a time.
+
+Only one low-level hook may patch the system cursors at a time, in this process as well as in the other processes of
+the user session.  `LockManager` checks a `threading.Lock` first, so `LockManager.acquire()` returns False without any
+system call while another grab of the same process holds the lock (`wingrab.scheduler` then waits and tries again),
+then takes a lock shared by the processes:
+
+- `named` (default): a lock provided by the backend without touching the disk, a named mutex on Windows
+  (`Local\\WinGrab`), an abstract Unix socket on Linux.  The system releases it when the owner process dies.
+- `file`: the legacy `WINGRAB.LOCKFILE` next to the module, locked with `Backend.lock_file()`.  It needs a writable
+  installation directory and costs some disk I/O per grab.
+
+The kind of lock is the one passed to `set_lock_kind()`, or the one named by the `WINGRAB_LOCK` environment variable,
+or `named`.  The `file` lock is used as well when the backend has no named lock.
+"""
+import os
+import socket
+import sys
+import threading
+
+from .resources import tracker
+
+__all__ = ['ProcessLock', 'FileLock', 'AbstractSocketLock', 'LockManager', 'LOCK_KINDS', 'LOCK_NAME',
+           'get_lock_kind', 'set_lock_kind']
+
+LOCK_KINDS = ('named', 'file')
+
+# The name of the lock shared by the processes
+LOCK_NAME = 'WinGrab'
+
+_lock_kind = None
+
+
+def get_lock_kind():
+    """ Return the kind of lock used by WinGrab, see the module documentation. """
+    kind = _lock_kind or os.environ.get('WINGRAB_LOCK') or 'named'
+    if kind not in LOCK_KINDS:
+        raise ValueError(f'Unknown lock kind: {kind!r}, available kinds: {", ".join(LOCK_KINDS)}')
+    return kind
+
+
+def set_lock_kind(kind):
+    """ Select the kind of lock used by WinGrab (`named` or `file`), `None` to go back to the default one.
+
+    The change applies from the next grab.
+    """
+    global _lock_kind
+    if kind is not None and kind not in LOCK_KINDS:
+        raise ValueError(f'Unknown lock kind: {kind!r}, available kinds: {", ".join(LOCK_KINDS)}')
+    _lock_kind = kind
+
+
+class ProcessLock:
+    """ A non-blocking lock shared by the processes of the user session. """
+
+    def acquire(self):
+        """ :return: True if the lock has been acquired, False if another process holds it. """
+        raise NotImplementedError
+
+    def release(self):
+        raise NotImplementedError
+
+    def close(self):
+        """ Release any resource held by the lock, which must not be acquired. """
+
+
+class FileLock(ProcessLock):
+    """ Lock the first byte of a file with `lock_file(f)`, the file is removed on release. """
+
+    def __init__(self, path, lock_file):
+        self.path = path
+        self._lock_file = lock_file
+        self._file = None
+
+    def acquire(self):
+        try:
+            f = open(self.path, 'w+')
+        except PermissionError:
+            raise RuntimeError(
+                'Unable to open lock file. Ensure that the path exists and you have write permission.'
+            ) from None
+
+        try:
+            self._lock_file(f)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        tracker.add('lock_file', self, FileLock.release)
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is None:
+            return
+        f.close()
+        tracker.discard('lock_file', self)
+        try:
+            os.remove(self.path)
+        except OSError:
+            # Ignore the error, e.g. the file has already been opened by another process, as it does not affect the
+            # subsequent lock operations.
+            pass
+
+
+class AbstractSocketLock(ProcessLock):
+    """ Bind a Unix socket in the abstract namespace (Linux only), the address is freed when the socket is closed. """
+
+    def __init__(self, name):
+        self.address = f'\0{name}-{os.getuid()}'
+        self._socket = None
+
+    def acquire(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.address)
+        except OSError:
+            sock.close()
+            return False
+        self._socket = sock
+        tracker.add('lock_socket', self, AbstractSocketLock.release)
+        return True
+
+    def release(self):
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            sock.close()
+            tracker.discard('lock_socket', self)
+
+
+def create_named_lock(name):
+    """ The named lock of the platforms which are not handled by a backend, `None` if there is none. """
+    if sys.platform.startswith('linux'):
+        return AbstractSocketLock(name)
+    return None
+
+
+class LockManager:
+    """ The in-process lock, then the lock shared by the processes.
+
+    `acquired` and `contended` count the successful and the failed `acquire()` calls.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._thread_lock = threading.Lock()
+        # The lock shared by the processes, created on first use for the backend and the kind of lock it was made for
+        self._process_lock = None
+        self._key = None
+        self._kind = None
+
+        self.acquired = 0
+        self.contended = 0
+
+    @property
+    def kind(self):
+        """ The kind of the current process lock, `None` before the first `acquire()`. """
+        return self._kind
+
+    def _get_process_lock(self, backend):
+        key = (backend, get_lock_kind())
+        if self._key == key:
+            return self._process_lock
+
+        if self._process_lock is not None:
+            self._process_lock.close()
+
+        kind, lock = key[1], None
+        if kind == 'named':
+            lock = backend.create_named_lock(LOCK_NAME)
+        if lock is None:
+            kind = 'file'
+            lock = FileLock(self.file_path, backend.lock_file)
+
+        self._process_lock = lock
+        self._kind = kind
+        # The requested kind is remembered, so that a fallback is not created again on every call.
+        self._key = key
+        return lock
+
+    def acquire(self, backend):
+        """ Acquire the lock without blocking.
+
+        :return: True if the lock has been acquired, False if another grab of this process or of another process holds
+            it.
+        """
+        if not self._thread_lock.acquire(blocking=False):
+            self.contended += 1
+            return False
+
+        try:
+            is_acquired = self._get_process_lock(backend).acquire()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+        if not is_acquired:
+            self._thread_lock.release()
+            self.contended += 1
+            return False
+        self.acquired += 1
+        return True
+
+    def release(self):
+        try:
+            self._process_lock.release()
+        finally:
+            self._thread_lock.release()
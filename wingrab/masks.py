@@ -0,0 +1,197 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The mouse events observed by a grab, and the button (and the modifier keys) triggering it.
+
+The low-level hook procedure is called for every mouse event of the desktop, while a grab only cares about a few of
+them.  A session compiles its `EventMask` into a dispatch table, a dict from the mouse message to the function handling
+it in the hook, so that an event the session does not observe costs a single dict lookup before being passed to the next
+hook::
+
+    import wingrab
+    from wingrab.masks import EventMask
+
+    pid = wingrab.grab(mask=EventMask('right', modifiers=('ctrl',)))  # Ctrl + right click
+    pid = wingrab.grab(mask='ctrl+right')                             # The same
+
+The press and the release of the trigger button are swallowed, so the clicked window never sees them, but only when
+the modifier keys are held down at the press: a click without them goes through to the window as usual.
+"""
+from ctypes import addressof, c_uint32, memmove
+
+from .winuser import (MSLLHOOKSTRUCT, WM_MOUSEMOVE, WM_LBUTTONDOWN, WM_LBUTTONUP, WM_RBUTTONDOWN, WM_RBUTTONUP,
+                      WM_MBUTTONDOWN, WM_MBUTTONUP, WM_MOUSEWHEEL, WM_MOUSEHWHEEL, WM_XBUTTONDOWN, WM_XBUTTONUP,
+                      XBUTTON1, XBUTTON2, VK_SHIFT, VK_CONTROL, VK_MENU, VK_LWIN, VK_RWIN)
+
+__all__ = ['EventMask', 'as_mask', 'BUTTONS', 'MODIFIERS']
+
+# button -> (down message, up message, X button)
+BUTTONS = {
+    'left': (WM_LBUTTONDOWN, WM_LBUTTONUP, 0),
+    'right': (WM_RBUTTONDOWN, WM_RBUTTONUP, 0),
+    'middle': (WM_MBUTTONDOWN, WM_MBUTTONUP, 0),
+    'x1': (WM_XBUTTONDOWN, WM_XBUTTONUP, XBUTTON1),
+    'x2': (WM_XBUTTONDOWN, WM_XBUTTONUP, XBUTTON2),
+}
+
+# modifier -> virtual-key codes, the modifier is held if any of them is down
+MODIFIERS = {
+    'ctrl': (VK_CONTROL,),
+    'shift': (VK_SHIFT,),
+    'alt': (VK_MENU,),
+    'win': (VK_LWIN, VK_RWIN),
+}
+
+_BUTTON_MESSAGES = (WM_LBUTTONDOWN, WM_LBUTTONUP, WM_RBUTTONDOWN, WM_RBUTTONUP, WM_MBUTTONDOWN, WM_MBUTTONUP,
+                    WM_XBUTTONDOWN, WM_XBUTTONUP)
+_WHEEL_MESSAGES = (WM_MOUSEWHEEL, WM_MOUSEHWHEEL)
+
+
+class EventMask:
+    """ Which mouse events a session observes, and which button triggers it.
+
+    :param button: The button whose release triggers the grab (`left`, `right`, `middle`, `x1` or `x2`), `None` for a
+        session without trigger, e.g. a stream of the hovered windows.
+    :param modifiers: The modifier keys (`ctrl`, `shift`, `alt`, `win`) which must be held down when the button is
+        pressed.
+    :param moves: Whether the mouse moves are handed to the session.
+    :param wheel: Whether the rotations of the wheels are handed to the session.
+    :param buttons: Whether the other button events (other buttons, clicks without the modifiers) are handed to the
+        session. They are passed to the windows anyway.
+    """
+
+    def __init__(self, button='left', *, modifiers=(), moves=False, wheel=False, buttons=False):
+        if button is not None and button not in BUTTONS:
+            raise ValueError(f'Unknown button: {button!r}, expected one of {", ".join(BUTTONS)}')
+        if isinstance(modifiers, str):
+            modifiers = (modifiers,)
+        modifiers = frozenset(modifier.lower() for modifier in modifiers)
+        unknown = modifiers.difference(MODIFIERS)
+        if unknown:
+            raise ValueError(f'Unknown modifiers: {", ".join(sorted(unknown))}, '
+                             f'expected some of {", ".join(MODIFIERS)}')
+
+        self.button = button
+        self.modifiers = modifiers
+        self.moves = moves
+        self.wheel = wheel
+        self.buttons = buttons
+
+    @classmethod
+    def parse(cls, text):
+        """ Parse a mask written like a shortcut, e.g. `right`, `ctrl+left` or `ctrl+shift+x1`. """
+        *modifiers, button = [part.strip().lower() for part in text.split('+')]
+        return cls(button, modifiers=modifiers)
+
+    def replace(self, **changes):
+        """ :return: A copy of the mask with the given attributes changed. """
+        attributes = dict(button=self.button, modifiers=self.modifiers, moves=self.moves, wheel=self.wheel,
+                          buttons=self.buttons)
+        attributes.update(changes)
+        return EventMask(attributes.pop('button'), **attributes)
+
+    def _key(self):
+        return self.button, self.modifiers, self.moves, self.wheel, self.buttons
+
+    def __eq__(self, other):
+        if not isinstance(other, EventMask):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        return '+'.join(sorted(self.modifiers) + [str(self.button)])
+
+    def __repr__(self):
+        return (f'EventMask({self.button!r}, modifiers={tuple(sorted(self.modifiers))!r}, moves={self.moves!r}, '
+                f'wheel={self.wheel!r}, buttons={self.buttons!r})')
+
+    def compile(self, ring, backend, *, observe_all=False):
+        """ Build the dispatch table of a session.
+
+        :param ring: The `wingrab.hookbuffer.EventRing` of the session, receiving the observed events.
+        :param backend: The backend reading the state of the modifier keys.
+        :param observe_all: Hand every event to the session, e.g. to print them.
+        :return: A dict message -> `handler(wParam, lParam)`, called by the hook procedure, which returns True to
+            swallow the event. The messages missing from the dict are not observed.
+        """
+        observe = ring.push
+        table = {}
+        if self.moves or observe_all:
+            table[WM_MOUSEMOVE] = observe
+        if self.wheel or observe_all:
+            for message in _WHEEL_MESSAGES:
+                table[message] = observe
+        if self.buttons or observe_all:
+            for message in _BUTTON_MESSAGES:
+                table[message] = observe
+        if self.button is not None:
+            trigger = _Trigger(self, ring, backend, observe if self.buttons or observe_all else None)
+            down, up, _ = BUTTONS[self.button]
+            table[down] = trigger.press
+            table[up] = trigger.release
+        return table
+
+
+def as_mask(mask):
+    """ :return: The `EventMask` of `mask`: an `EventMask`, a string for `EventMask.parse()`, or `None` for the left
+        button.
+    """
+    if mask is None:
+        return EventMask()
+    if isinstance(mask, str):
+        return EventMask.parse(mask)
+    if not isinstance(mask, EventMask):
+        raise TypeError(f'Expected an EventMask or a string, got {mask!r}')
+    return mask
+
+
+class _Trigger:
+    """ The state of the trigger button of a session, updated by the hook procedure. """
+
+    def __init__(self, mask, ring, backend, observe):
+        self._ring = ring
+        self._is_key_down = backend.is_key_down
+        self._observe = observe
+        self._key_groups = tuple(MODIFIERS[modifier] for modifier in sorted(mask.modifiers))
+        self._xbutton = BUTTONS[mask.button][2]
+        # The `mouseData` of an X button event is copied there, instead of creating a structure on each event.
+        self._mouse_data = c_uint32()
+        self._mouse_data_address = addressof(self._mouse_data)
+        # Whether the press of the button has been swallowed, so must be its release
+        self.is_pressed = False
+
+    def _is_other_xbutton(self, lParam):
+        memmove(self._mouse_data_address, lParam + MSLLHOOKSTRUCT.mouseData.offset, 4)
+        return self._mouse_data.value >> 16 != self._xbutton
+
+    def _are_modifiers_down(self):
+        is_key_down = self._is_key_down
+        for keys in self._key_groups:
+            for key in keys:
+                if is_key_down(key):
+                    break
+            else:
+                return False
+        return True
+
+    def _pass(self, wParam, lParam):
+        if self._observe is not None:
+            self._observe(wParam, lParam)
+        return False
+
+    def press(self, wParam, lParam):
+        if self._xbutton and self._is_other_xbutton(lParam) or not self._are_modifiers_down():
+            return self._pass(wParam, lParam)
+        self.is_pressed = True
+        self._ring.push(wParam, lParam)
+        return True
+
+    def release(self, wParam, lParam):
+        if not self.is_pressed or self._xbutton and self._is_other_xbutton(lParam):
+            return self._pass(wParam, lParam)
+        self.is_pressed = False
+        self._ring.push(wParam, lParam, True)
+        return True
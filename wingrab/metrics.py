@@ -0,0 +1,192 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Metrics of the grab sessions: how long each phase of a session takes, and how many mouse events it sees.
+
+Every session (`grab`, `grab_many`, `stream`...) measures its phases and counts its events into a `SessionMetrics`, and
+hands it to the registered sinks once its hook is removed.  A sink is any callable taking the `SessionMetrics`::
+
+    from wingrab import metrics
+
+    metrics.add_sink(print)
+    metrics.add_sink(metrics.JSONLSink('grabs.jsonl'))
+    openmetrics = metrics.add_sink(metrics.OpenMetricsSink())
+    ...
+    print(openmetrics.render())
+
+Nothing is measured while no sink is registered: the sessions then skip the timers and the counters altogether.
+
+The phases, in seconds (`PHASES`):
+
+- `queue`: waiting for the other grabs to finish, see `wingrab.scheduler`.
+- `hook_install`: installing the hook (or registering the raw input, or installing the hook in the hook host, see
+  `wingrab.inputs`) and creating the message queue.
+- `cursor_patch`: replacing the system cursors.
+- `wait`: waiting for the user, from the installed hook to the end of the session.
+- `resolve`: looking up the windows (window from point, hit-test index, process information), overlapping `wait`.
+- `unhook`: removing the hook (or the raw input registration, or the hook of the hook host).
+- `restore`: restoring the system cursors.
+- `total`: the whole session, `queue` excepted.
+
+The counters (`COUNTERS`): the mouse `events` observed by the session (see `wingrab.masks`), among them the `moves` and
+the `clicks` (trigger button released), the events `dropped` by the ring buffer of the hook, the mouse moves
+`coalesced` by a stream, and the `reinstalls` of a hook removed by the system (see `wingrab.watchdog`).
+"""
+import json
+import threading
+import time
+import warnings
+
+from time import perf_counter
+
+__all__ = ['SessionMetrics', 'add_sink', 'remove_sink', 'JSONLSink', 'OpenMetricsSink', 'PHASES', 'COUNTERS']
+
+PHASES = ('queue', 'hook_install', 'cursor_patch', 'wait', 'resolve', 'unhook', 'restore', 'total')
+COUNTERS = ('events', 'moves', 'clicks', 'dropped', 'coalesced', 'reinstalls')
+
+# The registered sinks, replaced (never mutated) so that the sessions can read it without locking
+_sinks = ()
+_lock = threading.Lock()
+
+
+class SessionMetrics:
+    """ The measures of one session.
+
+    `kind` is the kind of the session (`grab`, `grab_many`, `stream`, `prepared`), `timestamp` the `time.time()` of its
+    start, and `outcome` how it ended: `grabbed`, `stopped` (interrupted, or ended by the caller), `timeout`,
+    `cancelled`, `error`, or `abandoned` (every grab sharing the session has timed out or has been cancelled).
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.timestamp = time.time()
+        self.outcome = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def lap(self, phase, since):
+        """ Add the time elapsed since the `perf_counter()` value `since` to `phase`, return the current time. """
+        now = perf_counter()
+        self.phases[phase] += now - since
+        return now
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'timestamp': self.timestamp,
+            'outcome': self.outcome,
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+        }
+
+    def __repr__(self):
+        return f'SessionMetrics({self.as_dict()!r})'
+
+
+def add_sink(sink):
+    """ Register a sink, a callable receiving the `SessionMetrics` of each session.
+
+    :return: `sink`.
+    """
+    global _sinks
+    with _lock:
+        _sinks = _sinks + (sink,)
+    return sink
+
+
+def remove_sink(sink):
+    global _sinks
+    with _lock:
+        _sinks = tuple(registered for registered in _sinks if registered is not sink)
+
+
+def start(kind):
+    """ :return: A new `SessionMetrics`, or `None` if no sink is registered. """
+    if not _sinks:
+        return None
+    return SessionMetrics(kind)
+
+
+def emit(metrics):
+    """ Hand `metrics` to the sinks. A failing sink is reported as a warning, it does not fail the session. """
+    for sink in _sinks:
+        try:
+            sink(metrics)
+        except Exception as e:
+            warnings.warn(f'The metrics sink {sink!r} failed: {e!r}', RuntimeWarning)
+
+
+class JSONLSink:
+    """ Append the metrics of each session to a file, one JSON object per line. """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics):
+        line = json.dumps(metrics.as_dict()) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class OpenMetricsSink:
+    """ Aggregate the metrics of the sessions, and render them in the OpenMetrics text format.
+
+    https://github.com/OpenObservability/OpenMetrics/blob/main/specification/OpenMetrics.md
+    """
+
+    def __init__(self, prefix='wingrab'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # (kind, outcome) -> count
+        self._sessions = {}
+        # (kind, phase) -> [sum, count]
+        self._phases = {}
+        # (kind, counter) -> total
+        self._counters = {}
+
+    def __call__(self, metrics):
+        kind = metrics.kind
+        with self._lock:
+            key = (kind, metrics.outcome)
+            self._sessions[key] = self._sessions.get(key, 0) + 1
+            for phase, seconds in metrics.phases.items():
+                summary = self._phases.setdefault((kind, phase), [0.0, 0])
+                summary[0] += seconds
+                summary[1] += 1
+            for counter, value in metrics.counters.items():
+                self._counters[kind, counter] = self._counters.get((kind, counter), 0) + value
+
+    def render(self):
+        """ :return: The aggregated metrics, in the OpenMetrics text format. """
+        prefix = self.prefix
+        with self._lock:
+            lines = [f'# TYPE {prefix}_sessions counter',
+                     f'# HELP {prefix}_sessions The grab sessions, by kind and outcome.']
+            for (kind, outcome), count in sorted(self._sessions.items(), key=str):
+                lines.append(f'{prefix}_sessions_total{{kind="{kind}",outcome="{outcome}"}} {count}')
+
+            lines += [f'# TYPE {prefix}_phase_seconds summary',
+                      f'# UNIT {prefix}_phase_seconds seconds',
+                      f'# HELP {prefix}_phase_seconds The time spent in each phase of the sessions.']
+            for (kind, phase), (seconds, count) in sorted(self._phases.items()):
+                labels = f'{{kind="{kind}",phase="{phase}"}}'
+                lines.append(f'{prefix}_phase_seconds_sum{labels} {seconds!r}')
+                lines.append(f'{prefix}_phase_seconds_count{labels} {count}')
+
+            lines += [f'# TYPE {prefix}_mouse_events counter',
+                      f'# HELP {prefix}_mouse_events The mouse events seen by the sessions.']
+            for (kind, counter), total in sorted(self._counters.items()):
+                lines.append(f'{prefix}_mouse_events_total{{kind="{kind}",type="{counter}"}} {total}')
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """ Write `render()` to a file, e.g. for the textfile collector of a node exporter. """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
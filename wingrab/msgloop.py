@@ -0,0 +1,128 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The wait engine driving the WinGrab message loop.
+
+The low-level mouse hook is called by Windows from inside the message retrieval functions of the thread which installed
+it, so that thread has to keep pumping its message queue until the grab is finished.  Instead of spinning on
+`PeekMessageW`, the engine blocks on the queue (`MsgWaitForMultipleObjectsEx` on Windows) and is woken either by a new
+message or by an explicit `wake()` call, e.g. from `_quit()`.
+
+The engine only talks to the `MessageQueue` interface, so the wait logic can be exercised on any platform against
+`FakeMessageQueue`.
+"""
+import collections
+import threading
+import time
+
+__all__ = ['MessageQueue', 'FakeMessageQueue', 'run_message_loop', 'POLL_INTERVAL']
+
+# The longest time (in seconds) the engine blocks before re-checking whether the loop should stop.
+# Python only runs signal handlers on the main thread between bytecodes, so a bounded wait keeps SIGINT/SIGTERM
+# responsive even when nobody calls `wake()`.
+POLL_INTERVAL = 0.1
+
+
+class MessageQueue:
+    """ The message queue of the thread running the message loop. """
+
+    def wait(self, timeout):
+        """ Block until a message is pending, `wake()` is called or `timeout` (in seconds, `None` for no limit) expires.
+
+        :return: True if the queue has been signalled, False on timeout.
+        """
+        raise NotImplementedError
+
+    def pump(self):
+        """ Dispatch all pending messages.
+
+        :return: False if a quit message has been received, True otherwise.
+        """
+        raise NotImplementedError
+
+    def wake(self):
+        """ Wake up a blocked `wait()`. Can be called from any thread. """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release any resource held by the queue. """
+
+
+class FakeMessageQueue(MessageQueue):
+    """ An in-memory message queue, used to drive the wait engine without a Windows desktop.
+
+    Messages are plain callables which are invoked by `pump()` on the thread running the loop, just like a hook
+    procedure is invoked by Windows on the thread which installed it.
+    """
+
+    _QUIT = object()
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._messages = collections.deque()
+        self._is_woken = False
+
+        # Counters, useful to check that the loop does not spin.
+        self.wait_count = 0
+        self.dispatch_count = 0
+
+    def post(self, callback, *args):
+        """ Post a message which calls `callback(*args)` when dispatched. """
+        with self._cond:
+            self._messages.append((callback, args))
+            self._cond.notify_all()
+
+    def post_quit(self):
+        """ Post a quit message, the counterpart of `PostQuitMessage`. """
+        self.post(self._QUIT)
+
+    def wait(self, timeout):
+        with self._cond:
+            self.wait_count += 1
+            if not self._messages and not self._is_woken:
+                self._cond.wait(timeout)
+            is_signalled = bool(self._messages) or self._is_woken
+            self._is_woken = False
+            return is_signalled
+
+    def pump(self):
+        while True:
+            with self._cond:
+                if not self._messages:
+                    return True
+                callback, args = self._messages.popleft()
+
+            if callback is self._QUIT:
+                return False
+
+            self.dispatch_count += 1
+            callback(*args)
+
+    def wake(self):
+        with self._cond:
+            self._is_woken = True
+            self._cond.notify_all()
+
+
+def run_message_loop(queue, is_finished, *, poll_interval=POLL_INTERVAL, deadline=None):
+    """ Pump `queue` until `is_finished()` returns True, a quit message is received or `deadline` is reached.
+
+    :param queue: The `MessageQueue` of the current thread.
+    :param is_finished: A callable checked after every wake-up.
+    :param poll_interval: The longest time (in seconds) to block between two checks of `is_finished()`.
+    :param deadline: The `time.monotonic()` time at which the loop is left, `None` for no limit.
+    :return: False if the loop was left because of a quit message, True otherwise.
+    """
+    while not is_finished():
+        timeout = poll_interval
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+
+        queue.wait(timeout)
+        if not queue.pump():
+            return False
+    return True
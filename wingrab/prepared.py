@@ -0,0 +1,321 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Prepared grabs: the setup of a grab made ahead of time, so that it starts at once.
+
+`grab()` does all its setup once it is called: it waits for its turn and the lock shared by the processes, installs the
+hook on a new message loop, and makes and sets the grab cursors, before the user sees the crosshair.  `prepare()` does
+the invisible part ahead of time, e.g. when the window holding a "pick window" button opens, and keeps it until the
+prepared grab is closed:
+
+- the turn of the grabs and the lock of the processes are held,
+- the source of the mouse events (see `wingrab.inputs`) is installed on a background thread, observing nothing: every
+  event goes straight on to the windows,
+- the copies of the current cursors and the grab cursors are made, see `CursorPatch.prepare()`.
+
+`activate()` then only sets the grab cursors and arms the trigger, and `wait()` returns the PID of the clicked window::
+
+    import wingrab
+
+    with wingrab.prepare() as picker:
+        ...
+        picker.activate()  # When the button is pressed
+        pid = picker.wait(timeout=30)
+
+Once the window is clicked, the cursors are put back and the grab cursors are made again for the next activation.
+`stats` reports the durations of the activations.
+
+While a grab is prepared, the other grabs (of this process and of the others) wait for it to be closed.  With the
+`hook` input, the hook procedure runs in the interpreter for every mouse event even while the grab is idle, the `raw`
+and `host` inputs keep the mouse of the desktop away from the interpreter.  The cursors put back are the copies made
+when the grab was prepared (or after the previous click): a cursor changed in the meantime, by another application or
+by the user, is reverted.
+"""
+import threading
+
+from time import perf_counter
+
+from . import wingrab as _wingrab
+from .hookbuffer import LatencyRecorder
+from .masks import EventMask, as_mask
+from .procinfo import describe_window
+from .scheduler import CancellationToken, GrabCancelled, GrabRequest
+
+__all__ = ['prepare', 'PreparedGrab']
+
+
+class _PreparedSession(_wingrab._HookSession):
+    """ A hook session observing nothing until it is activated, serving one grab per activation. """
+
+    kind = 'prepared'
+    # The mask of the idle session
+    idle_mask = EventMask(None)
+
+    def __init__(self, *, detail=False, patch_cursors=True, mask=None, input_backend=None, debug=False):
+        # The cursors are handled by the activations, not by `run()`.
+        super().__init__(patch_cursors=False, mask=self.idle_mask, input_backend=input_backend, debug=debug)
+        self.detail = detail
+        self.armed_mask = as_mask(mask)
+        self.wants_cursors = patch_cursors
+        # The `GrabRequest` of the current activation, `None` while idle
+        self.activation = None
+        self.grabbed = 0
+        # Set once the session is ready to be activated, or has failed to start
+        self.started = threading.Event()
+        self.start_error = None
+        self._lock = threading.Lock()
+        self._is_closed = False
+        # The `CursorPatch` ready for the next activation, and the one set by the current activation
+        self._patch = None
+        self._active_patch = None
+        # Cancels the wait for the turn of the session when it is closed before starting
+        self._turn_token = CancellationToken()
+
+    def on_started(self):
+        if self.wants_cursors:
+            self._patch = _wingrab._prepare_system_cursors(self.backend)
+        self.started.set()
+
+    def stop(self):
+        self._turn_token.cancel()
+        super().stop()
+
+    def activate(self):
+        """ Set the grab cursors and arm the trigger, from any thread.
+
+        :return: The `GrabRequest` resolved by the click.
+        """
+        with self._lock:
+            if self._is_closed or self.is_finished():
+                raise RuntimeError('The prepared grab is closed.')
+            if self.activation is not None:
+                raise RuntimeError('The prepared grab is already active.')
+
+            patch, self._patch = self._patch, None
+            if patch is None and self.wants_cursors:
+                # Not made again yet since the previous click
+                patch = _wingrab._prepare_system_cursors(self.backend)
+            # The activation is set first, so that a click arriving right after the trigger is armed is not missed.
+            self.activation = request = GrabRequest(detail=self.detail, mask=self.armed_mask)
+            try:
+                if patch is not None:
+                    started = perf_counter()
+                    patch.commit()
+                    self._active_patch = patch
+                    _wingrab.cursor_cache.record('patch', started)
+                self.set_mask(self.armed_mask)
+            except BaseException:
+                self.activation = None
+                self._active_patch = None
+                if patch is not None:
+                    _wingrab._restore_system_cursors(patch)
+                raise
+        return request
+
+    def complete(self, request, result=None, error=None, *, is_grabbed=False):
+        """ End the activation of `request`: disarm the trigger, put the cursors back, then resolve `request`.
+
+        :param is_grabbed: Whether `result` is a grabbed window, counted before `request` is resolved.
+        :return: False if `request` is not the current activation any more.
+        """
+        with self._lock:
+            if self.activation is not request:
+                return False
+            self.activation = None
+            if is_grabbed:
+                self.grabbed += 1
+            patch, self._active_patch = self._active_patch, None
+            try:
+                if not self._is_closed:
+                    self.set_mask(self.idle_mask)
+            finally:
+                if patch is not None:
+                    _wingrab._restore_system_cursors(patch)
+                request._resolve(result, error)
+
+        # Made again off the path of the next activation.
+        with self._lock:
+            if self.wants_cursors and self._patch is None and not self._is_closed:
+                self._patch = _wingrab._prepare_system_cursors(self.backend)
+        return True
+
+    def on_trigger(self, info):
+        request = self.activation
+        if request is None:
+            # A click drained after the end of the activation
+            return
+
+        started = perf_counter()
+        if self.detail:
+            result = describe_window(self.backend, (info.pt.x, info.pt.y))
+            pid = result.pid
+        else:
+            result = pid = _wingrab._get_pid_from_point(self.backend, info.pt)
+        if self.metrics is not None:
+            self.metrics.lap('resolve', started)
+        if not pid:
+            # No window under the cursor, just like `grab` ignore the click.
+            return
+        self.complete(request, result, is_grabbed=True)
+
+    def _shut_down(self, error):
+        """ Fail the current activation with `error` (-1 without error), and destroy the prepared cursors. """
+        with self._lock:
+            self._is_closed = True
+            request = self.activation
+            patch, self._patch = self._patch, None
+        if request is not None:
+            self.complete(request, None if error is not None else -1, error)
+        if patch is not None:
+            _wingrab._restore_system_cursors(patch)
+
+    def run_locked(self, timeout):
+        """ The body of the thread of the session, which waits for its turn first. """
+        error = None
+        try:
+            with _wingrab._global_wingrab_process_lock(timeout=timeout, token=self._turn_token):
+                self.run()
+        except BaseException as e:
+            error = e
+            if not self.started.is_set():
+                self.start_error = e
+        finally:
+            self._shut_down(error)
+            # Unblock `PreparedGrab.start()` if the session failed before starting.
+            self.started.set()
+
+
+class PreparedGrab:
+    """ A grab prepared ahead of time, see `prepare()`. """
+
+    def __init__(self, *, detail=False, patch_cursors=True, mask=None, input_backend=None, _debug=False):
+        self._session = _PreparedSession(detail=detail, patch_cursors=patch_cursors, mask=mask,
+                                         input_backend=input_backend, debug=_debug)
+        self._thread = None
+        self._request = None
+        # The durations (in seconds) of the activations, see `LatencyRecorder.percentiles()`
+        self.activation_latency = LatencyRecorder()
+
+    def start(self, timeout=None):
+        """ Wait for the turn of the grabs, then install the hook and make the cursors on a background thread, return
+        once they are ready.
+
+        :param timeout: The longest time (in seconds) to wait for the turn, `None` for no limit.
+        :raises TimeoutError: If `timeout` expires before the turn.
+        :raises GrabCancelled: If the prepared grab is closed or the program is interrupted before the turn.
+        """
+        if self._thread is not None:
+            return self
+
+        _wingrab.install_exit_handlers()
+
+        # The thread must not hold a reference to the prepared grab, so that a dropped one is closed by `__del__`.
+        session = self._session
+        self._thread = threading.Thread(target=session.run_locked, args=(timeout,), name='wingrab-prepared',
+                                        daemon=True)
+        self._thread.start()
+        # Bounded waits, so that the main thread still runs its signal handlers.
+        while not session.started.wait(0.1):
+            pass
+        if session.start_error is not None:
+            raise session.start_error
+        return self
+
+    def activate(self):
+        """ Set the grab cursors and arm the trigger, the click is then returned by `wait()`.
+
+        :raises RuntimeError: If the prepared grab is closed, or already active.
+        """
+        started = perf_counter()
+        self._request = self._session.activate()
+        self.activation_latency.record(perf_counter() - started)
+        return self
+
+    def wait(self, timeout=None, *, token=None):
+        """ Wait for the click of the current activation, the prepared grab is idle again when it returns.
+
+        :param timeout: The longest time (in seconds) to wait for the click, `None` for no limit.
+        :param token: A `CancellationToken` which can be used to cancel the wait from another thread.
+        :return: The PID of the clicked window (or its `WindowInfo` with `detail`), -1 if the prepared grab has been
+            closed or the program interrupted.
+        :raises TimeoutError: If `timeout` expires before the click.
+        :raises GrabCancelled: If `token` is cancelled or `cancel()` is called before the click.
+        """
+        request = self._request
+        if request is None:
+            raise RuntimeError('The prepared grab is not active.')
+
+        session = self._session
+
+        def cancel():
+            session.complete(request, error=GrabCancelled('The grab has been cancelled.'))
+
+        if token is not None:
+            token._register(cancel)
+        try:
+            if not request.wait(timeout):
+                session.complete(request, error=TimeoutError(f'No window has been grabbed within {timeout} seconds.'))
+        finally:
+            if token is not None:
+                token._unregister(cancel)
+            self._request = None
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def grab(self, timeout=None, *, token=None):
+        """ `activate()`, then `wait()`. """
+        return self.activate().wait(timeout, token=token)
+
+    def cancel(self):
+        """ End the current activation, if any, `wait()` raises `GrabCancelled`. Can be called from any thread. """
+        request = self._session.activation
+        if request is not None:
+            self._session.complete(request, error=GrabCancelled('The grab has been cancelled.'))
+
+    def close(self):
+        """ Remove the hook, destroy the prepared cursors and release the turn, wait for the background thread to exit.
+        """
+        self._session.stop()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    @property
+    def closed(self):
+        return self._session._is_closed
+
+    @property
+    def active(self):
+        return self._session.activation is not None
+
+    @property
+    def stats(self):
+        """ The number of windows grabbed, and the percentiles of the durations (in seconds) of the activations. """
+        return {'grabbed': self._session.grabbed, 'activation': self.activation_latency.percentiles()}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if self._thread is not None:
+            self.close()
+
+
+def prepare(*, detail=False, patch_cursors=True, mask=None, input_backend=None, timeout=None, _debug=False):
+    """ Prepare a grab, see the module documentation.
+
+    :param detail: Grab `wingrab.procinfo.WindowInfo` instead of PIDs, see `wingrab.grab`.
+    :param patch_cursors: Change the cursors to the grab cursor while the grab is active.
+    :param mask: The button (and the modifier keys) of the click, see `wingrab.grab`.
+    :param input_backend: The source of the mouse events, see `wingrab.grab`.
+    :param timeout: The longest time (in seconds) to wait for the other grabs to finish, `None` for no limit.
+    :return: A started `PreparedGrab`, to be closed with `close()` or used as a context manager.
+    :raises TimeoutError: If `timeout` expires while waiting for the other grabs to finish.
+    """
+    return PreparedGrab(detail=detail, patch_cursors=patch_cursors, mask=mask, input_backend=input_backend,
+                        _debug=_debug).start(timeout)
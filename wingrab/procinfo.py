@@ -0,0 +1,98 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Detailed information about a grabbed window and its process.
+
+`describe_window()` gathers everything about the window under the cursor in one pass, on the worker thread of the grab.
+The metadata of the processes (executable path, start time) are kept in a bounded LRU cache: a cached entry is reused
+as long as the process with that PID has the same start time, so repeated grabs over the same application only cost
+one cheap start time query, and a reused PID is never mistaken for the process which owned it before.
+"""
+import collections
+import ntpath
+import threading
+
+__all__ = ['WindowInfo', 'ProcessInfo', 'ProcessCache', 'describe_window', 'process_cache']
+
+ProcessInfo = collections.namedtuple('ProcessInfo', ['pid', 'exe_path', 'name', 'start_time'])
+ProcessInfo.__doc__ = """ The metadata of a process, `exe_path` and `name` are `None` if the process is not accessible. """
+
+WindowInfo = collections.namedtuple('WindowInfo', [
+    'pid', 'hwnd', 'root_hwnd', 'owner_hwnd', 'thread_id', 'class_name', 'title', 'rect', 'point', 'process',
+])
+WindowInfo.__doc__ = """ A grabbed window.
+
+`root_hwnd` is the top-level window containing `hwnd`, `owner_hwnd` the owner of the root window (or `None`), `rect`
+the `(left, top, right, bottom)` rectangle of `hwnd` in screen coordinates, `point` the `(x, y)` position of the click
+and `process` the `ProcessInfo` of `pid`.
+"""
+
+
+class ProcessCache:
+    """ A bounded LRU cache of `ProcessInfo`, validated by the start time of the processes. """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._backend = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, backend, pid):
+        """ Return the `ProcessInfo` of `pid`, querying `backend` only if the cached entry is missing or stale. """
+        start_time = backend.get_process_start_time(pid)
+
+        with self._lock:
+            if backend is not self._backend:
+                # The handles and PIDs of another backend are meaningless.
+                self._entries.clear()
+                self._backend = backend
+
+            info = self._entries.get(pid)
+            if info is not None and start_time is not None and info.start_time == start_time:
+                self._entries.move_to_end(pid)
+                self.hits += 1
+                return info
+            self.misses += 1
+
+        exe_path = backend.get_process_image_path(pid)
+        info = ProcessInfo(pid, exe_path, None if exe_path is None else ntpath.basename(exe_path), start_time)
+        if start_time is None:
+            # Without a start time the entry could not be validated later.
+            return info
+
+        with self._lock:
+            self._entries[pid] = info
+            self._entries.move_to_end(pid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return info
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# The process-wide cache used by `describe_window()`
+process_cache = ProcessCache()
+
+
+def describe_window(backend, point, *, cache=process_cache):
+    """ Gather the `WindowInfo` of the window at `point` (an `(x, y)` tuple). """
+    hwnd = backend.window_from_point(*point)
+    thread_id, pid = backend.get_window_thread_process_id(hwnd)
+    root_hwnd = backend.get_root_window(hwnd) if hwnd else None
+    return WindowInfo(
+        pid=pid,
+        hwnd=hwnd,
+        root_hwnd=root_hwnd,
+        owner_hwnd=backend.get_owner_window(root_hwnd) if root_hwnd else None,
+        thread_id=thread_id,
+        class_name=backend.get_class_name(hwnd) if hwnd else '',
+        title=backend.get_window_text(hwnd) if hwnd else '',
+        rect=backend.get_window_rect(hwnd) if hwnd else None,
+        point=tuple(point),
+        process=cache.get(backend, pid) if pid else None,
+    )
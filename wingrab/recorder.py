@@ -0,0 +1,166 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Recording and replay of the low-level mouse traffic.
+
+`EventRecorder` appends every event seen by the hook procedure to a memory-mapped file, as fixed-size binary records
+(the `wParam` followed by the raw `MSLLHOOKSTRUCT`).  Recording an event is a `memmove` and two integer stores, so it
+can stay enabled in production, and as the event count is stored in the file header at every event, the trace of a
+stuck or crashed grab is readable as is.  When the file is full, the oldest records are overwritten.
+
+`replay()` feeds a trace back into a hook procedure, or into the simulated backend, at the original or an accelerated
+speed::
+
+    wingrab.grab(record='grab.trace')
+
+    from wingrab.backends.simulated import SimulatedBackend
+    from wingrab.recorder import replay
+
+    desktop = set_backend(SimulatedBackend())
+    ...
+    threading.Thread(target=replay, args=('grab.trace', desktop), kwargs={'speed': 10}).start()
+    wingrab.grab()
+"""
+import mmap
+import os
+import time
+
+from ctypes import Structure, addressof, memmove, sizeof, c_ubyte, c_uint32, c_uint64
+
+from .winuser import HC_ACTION, MSLLHOOKSTRUCT
+
+__all__ = ['EventRecorder', 'TraceRecord', 'read_trace', 'replay']
+
+MAGIC = b'WGTRACE1'
+VERSION = 1
+
+
+class _TraceHeader(Structure):
+    _fields_ = (('magic', c_ubyte * 8),
+                ('version', c_uint32),
+                # The size of a record, which depends on the pointer size of the recording process
+                ('record_size', c_uint32),
+                ('capacity', c_uint64),
+                # The total number of events recorded, the records are overwritten once it exceeds the capacity
+                ('count', c_uint64))
+
+
+class TraceRecord(Structure):
+    _fields_ = (('wParam', c_uint64),
+                ('info', MSLLHOOKSTRUCT))
+
+
+_HEADER_SIZE = sizeof(_TraceHeader)
+_RECORD_SIZE = sizeof(TraceRecord)
+_INFO_OFFSET = TraceRecord.info.offset
+
+
+class EventRecorder:
+    """ Record the events of the hook procedure into the file `path`, which holds up to `capacity` records. """
+
+    def __init__(self, path, capacity=65536):
+        self.path = path
+        self.capacity = capacity
+        self._file = open(path, 'w+b')
+        self._file.truncate(_HEADER_SIZE + capacity * _RECORD_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), _HEADER_SIZE + capacity * _RECORD_SIZE)
+
+        self._header = _TraceHeader.from_buffer(self._map)
+        self._header.magic[:] = MAGIC
+        self._header.version = VERSION
+        self._header.record_size = _RECORD_SIZE
+        self._header.capacity = capacity
+
+        # The records viewed as 64-bit words, so that the hook stores the wParam without creating any ctypes object
+        self._words = (c_uint64 * (capacity * _RECORD_SIZE // 8)).from_buffer(self._map, _HEADER_SIZE)
+        self._stride = _RECORD_SIZE // 8
+        self._base = addressof(self._words)
+        self._info_size = sizeof(MSLLHOOKSTRUCT)
+        self.count = 0
+
+    def push(self, wParam, lParam):
+        """ Record the `MSLLHOOKSTRUCT` at address `lParam`. Called by the hook procedure. """
+        index = self.count % self.capacity
+        self._words[index * self._stride] = wParam
+        memmove(self._base + index * _RECORD_SIZE + _INFO_OFFSET, lParam, self._info_size)
+        self.count += 1
+        self._header.count = self.count
+
+    @property
+    def closed(self):
+        return self._map is None
+
+    def close(self):
+        """ Unmap the file and shrink it to the records written. """
+        if self._map is None:
+            return
+        # The views must be released before the map is closed.
+        del self._words, self._header
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(_HEADER_SIZE + min(self.count, self.capacity) * _RECORD_SIZE)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_trace(path):
+    """ Read a trace written by `EventRecorder`.
+
+    :return: The list of `TraceRecord`, the oldest one first.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < _HEADER_SIZE:
+        raise ValueError(f'{path} is not a WinGrab trace')
+    header = _TraceHeader.from_buffer_copy(data)
+    if bytes(header.magic) != MAGIC or header.version != VERSION:
+        raise ValueError(f'{path} is not a WinGrab trace')
+    if header.record_size != _RECORD_SIZE:
+        raise ValueError(f'{path} has been recorded by a process with another pointer size')
+
+    count = min(header.count, header.capacity, (len(data) - _HEADER_SIZE) // _RECORD_SIZE)
+    records = [TraceRecord.from_buffer_copy(data, _HEADER_SIZE + i * _RECORD_SIZE) for i in range(count)]
+    if header.count > header.capacity:
+        # The ring has wrapped, the oldest record is the next one to be overwritten.
+        start = header.count % header.capacity
+        records = records[start:] + records[:start]
+    return records
+
+
+def replay(trace, target, *, speed=1.0):
+    """ Feed a trace into a hook procedure or a backend.
+
+    :param trace: The path of a trace file, or a list of `TraceRecord`.
+    :param target: A hook procedure `proc(nCode, wParam, lParam)`, called on the current thread, or a backend with an
+        `inject(wParam, info)` method, such as `SimulatedBackend`.
+    :param speed: The speed factor applied to the delays between the events (from their `time` field), `None` to send
+        the events without any delay.
+    :return: The number of events replayed.
+    """
+    if isinstance(trace, (str, bytes, os.PathLike)):
+        trace = read_trace(trace)
+
+    inject = getattr(target, 'inject', None)
+    started = time.perf_counter()
+    first_time = trace[0].info.time if trace else 0
+    for record in trace:
+        if speed:
+            # The `time` field is a 32-bit millisecond counter, which wraps around after 49.7 days.
+            delay = ((record.info.time - first_time) & 0xFFFFFFFF) / 1000 / speed
+            remaining = started + delay - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+
+        if inject is not None:
+            inject(record.wParam, record.info)
+        else:
+            info = MSLLHOOKSTRUCT.from_buffer_copy(record.info)
+            target(HC_ACTION, record.wParam, addressof(info))
+    return len(trace)
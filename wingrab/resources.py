@@ -0,0 +1,111 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The accounting of the operating system resources created by wingrab.
+
+Every handle wingrab creates (hooks, raw input windows, cursors, window event hooks, message queue events, locks, hook
+host processes) is added to `tracker` by the code creating it, with the function releasing it, and discarded once it is
+released, or once its ownership has gone to the system (e.g. a cursor given to `SetSystemCursor`).  A long-running
+process can therefore check that its grabs do not leak anything::
+
+    from wingrab.resources import tracker
+
+    print(tracker.counts())   # {'cursor': 1, 'mutex': 1}: the cached grab cursor and the lock of the grabs
+    print(tracker.stats)      # The live, created and released resources of each kind
+
+The resources kept on purpose for the lifetime of the process (the cached grab cursor, the named mutex of the grabs, the
+hook host) are live between the grabs, and `release_all()` releases them, e.g. before unloading wingrab from a process
+which keeps running.  `benchmarks/soak_grab.py` runs thousands of grabs and checks that the counts and the memory of
+the process do not grow.
+"""
+import threading
+import warnings
+
+__all__ = ['ResourceTracker', 'tracker']
+
+
+class ResourceTracker:
+    """ The live resources, by kind, with the function releasing each of them. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # kind -> {handle: release}
+        self._live = {}
+        # kind -> count
+        self.created = {}
+        self.released = {}
+
+    def add(self, kind, handle, release):
+        """ Track `handle`, released by `release(handle)`. A null handle (creation failure) is not tracked, and adding
+        a tracked handle again only replaces its `release`, e.g. by the owner of a handle created by a backend.
+
+        :return: `handle`.
+        """
+        if not handle:
+            return handle
+        with self._lock:
+            live = self._live.setdefault(kind, {})
+            if handle not in live:
+                self.created[kind] = self.created.get(kind, 0) + 1
+            live[handle] = release
+        return handle
+
+    def discard(self, kind, handle):
+        """ Forget `handle`, which has been released or handed over to the system.
+
+        :return: True if `handle` was tracked.
+        """
+        with self._lock:
+            live = self._live.get(kind)
+            if not live or live.pop(handle, None) is None:
+                return False
+            self.released[kind] = self.released.get(kind, 0) + 1
+            return True
+
+    def counts(self):
+        """ :return: A dict kind -> number of live resources, without the kinds with none. """
+        with self._lock:
+            return {kind: len(live) for kind, live in self._live.items() if live}
+
+    def total(self):
+        """ :return: The number of live resources. """
+        with self._lock:
+            return sum(len(live) for live in self._live.values())
+
+    @property
+    def stats(self):
+        """ The `live`, `created` and `released` resources of each kind. """
+        with self._lock:
+            return {
+                'live': {kind: len(live) for kind, live in self._live.items() if live},
+                'created': dict(self.created),
+                'released': dict(self.released),
+            }
+
+    def release_all(self, kinds=None):
+        """ Release the live resources of `kinds` (all of them by default).
+
+        A window (e.g. the one of the raw input) can only be destroyed by the thread which created it, so this is meant
+        for the resources left once the grabs are over.  A failing release is reported as a warning.
+
+        :return: The number of resources released.
+        """
+        with self._lock:
+            pending = [(kind, handle, release) for kind, live in self._live.items()
+                       if kinds is None or kind in kinds for handle, release in live.items()]
+        count = 0
+        for kind, handle, release in pending:
+            try:
+                release(handle)
+            except Exception as e:
+                warnings.warn(f'Unable to release the {kind} {handle!r}: {e!r}', RuntimeWarning)
+            else:
+                count += 1
+            finally:
+                # Usually done by `release()` already.
+                self.discard(kind, handle)
+        return count
+
+
+# The resources of the process
+tracker = ResourceTracker()
@@ -0,0 +1,480 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The queue of the grabs: concurrent grabs wait for their turn instead of failing.
+
+Only one hook session runs at a time, in the whole user session.  The grabs of this process wait in a queue ordered
+by priority (highest first) then by arrival, and the head of the queue waits for the lock shared by the processes
+(`wingrab.locks`), polling it every `poll_interval` seconds: the grabs of another process are not ordered against ours.
+
+There are two kinds of entries:
+
+- The requests for the next click (`GrabRequest`, made by `grab()` and `grab_async()`) are coalesced: all the requests
+  waiting when a session starts, and those arriving while it runs, are served by the same click, provided that they
+  wait for the same kind of click (their `mask`, see `wingrab.masks`) from the same source of events (see
+  `wingrab.inputs`).  The session is run by the dispatcher thread of
+  the scheduler, and is stopped once every request has been cancelled or has timed out.
+- The exclusive turns (`Scheduler.turn()`, taken by `grab_many()`, `stream()` and the recording grabs) run their own
+  session on the calling thread.
+
+Each entry has its own deadline and cancellation token, which also count the time spent waiting in the queue.
+"""
+import contextlib
+import itertools
+import threading
+import time
+import warnings
+
+__all__ = ['Scheduler', 'GrabRequest', 'CancellationToken', 'GrabCancelled']
+
+
+class GrabCancelled(Exception):
+    """ Raised by `grab` when its `CancellationToken` is cancelled. """
+
+
+class CancellationToken:
+    """ A token cancelling the grabs it is passed to.
+
+    `cancel()` can be called from any thread: the grabs using the token remove their hook, restore the cursors, release
+    the lock and raise `GrabCancelled`.
+
+    Example:
+        token = CancellationToken()
+        threading.Timer(10, token.cancel).start()
+        pid = grab(token=token)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._is_cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._is_cancelled
+
+    def cancel(self):
+        with self._lock:
+            if self._is_cancelled:
+                return
+            self._is_cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+    def _register(self, callback):
+        """ Call `callback()` when the token is cancelled, right now if it is already cancelled. """
+        with self._lock:
+            if not self._is_cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _unregister(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+
+class GrabRequest:
+    """ A request for the next click, see `Scheduler.submit()`.
+
+    Once done, `result` holds the PID (or the `WindowInfo` with `detail`), -1 if the grab has been interrupted, or
+    `error` holds the error of the request.
+    """
+
+    def __init__(self, *, detail=False, priority=0, mask=None, input_backend=None, debug=False):
+        self.detail = detail
+        self.priority = priority
+        # The click the request waits for, and the source of the mouse events, `None` for the defaults of the sessions
+        self.mask = mask
+        self.input_backend = input_backend
+        self.debug = debug
+        # The `perf_counter()` of the creation of the request
+        self.created = time.perf_counter()
+        self.result = None
+        self.error = None
+        self._scheduler = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def shares_click(self, other):
+        """ Whether the request can be served by the click of `other`, a request or a `RequestBatch`. """
+        return self.mask == other.mask and self.input_backend == other.input_backend
+
+    def wait(self, timeout=None):
+        """ Wait for the request to be done.
+
+        :return: True if the request is done, False if `timeout` (in seconds) has expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            # Bounded waits, so that the main thread still runs its signal handlers.
+            if self._done.wait(max(0.0, remaining)):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def add_done_callback(self, callback):
+        """ Call `callback(request)` once the request is done, right now if it is already done. """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self, error=None, *, wait=True):
+        """ Stop waiting for the click, the request fails with `error` (`GrabCancelled` by default).
+
+        :param wait: If the session serving the request is stopped because no other request is waiting, wait for it to
+            remove its hook and restore the cursors.
+        :return: False if the request was already done.
+        """
+        scheduler = self._scheduler
+        batch = scheduler._discard(self) if scheduler is not None else None
+        if batch is not None and wait and threading.current_thread() is not scheduler._thread:
+            # Resolved afterwards, so that the caller waiting for the request finds the hook removed.
+            batch.finished.wait()
+        return self._resolve(None, error if error is not None else GrabCancelled('The grab has been cancelled.'))
+
+    def _resolve(self, result, error):
+        with self._lock:
+            if self._done.is_set():
+                return False
+            self.result = result
+            self.error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                # Resolved on the dispatcher thread, which must keep serving the other requests.
+                warnings.warn(f'The done callback {callback!r} of a grab request failed: {e!r}', RuntimeWarning)
+        return True
+
+
+class RequestBatch:
+    """ The requests served by one click. """
+
+    def __init__(self, requests):
+        self.requests = requests
+        # The requests of a batch share their mask and their source
+        self.mask = requests[0].mask
+        self.input_backend = requests[0].input_backend
+        # The session serving the batch, set by the runner of the scheduler
+        self.session = None
+        # Whether the click has been made, no request joins the batch any more
+        self.is_closed = False
+        # Whether the session has been stopped because all the requests have left
+        self.is_abandoned = False
+        # Set once the session is over
+        self.finished = threading.Event()
+
+    @property
+    def wants_detail(self):
+        return any(request.detail for request in self.requests)
+
+    @property
+    def debug(self):
+        return any(request.debug for request in self.requests)
+
+
+class _Turn:
+    """ An entry of the queue of the scheduler. """
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+        self.is_interrupted = False
+
+
+class Scheduler:
+    """ The queue of the grabs, see the module documentation.
+
+    :param run_batch: Called on the dispatcher thread with a `RequestBatch`, runs a session serving its requests and
+        returns its `(pid, info)` result. It must set `batch.session` through `start_batch()` before running it.
+    :param acquire: Called without argument to acquire the lock shared by the processes without blocking, returns
+        True on success.
+    :param release: Called without argument to release that lock.
+    """
+
+    def __init__(self, run_batch, *, acquire, release, poll_interval=0.05):
+        self._run_batch = run_batch
+        self._acquire = acquire
+        self._release = release
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # The turns waiting in the queue
+        self._turns = []
+        # Whether a turn is running in this process
+        self._is_busy = False
+        # The requests waiting for the next batch, and the running batch
+        self._pending = []
+        self._batch = None
+        self._dispatch_turn = None
+        self._thread = None
+
+        # Counters
+        self.submitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.turns = 0
+        self.cross_process_waits = 0
+
+    @property
+    def stats(self):
+        with self._cond:
+            return {
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'turns': self.turns,
+                'cross_process_waits': self.cross_process_waits,
+                'waiting': len(self._pending) + sum(1 for turn in self._turns if turn is not self._dispatch_turn),
+            }
+
+    # region Turns
+    def _is_head(self, entry):
+        return min(self._turns, key=lambda turn: (-turn.priority, turn.seq)) is entry
+
+    def _acquire_turn(self, entry, *, deadline=None, token=None, is_abandoned=None):
+        """ Wait until `entry` is the head of the queue and acquire the lock shared by the processes.
+
+        :return: False if `is_abandoned()` returned True while waiting.
+        :raises TimeoutError, GrabCancelled: If `deadline` expires or `token` is cancelled while waiting.
+        """
+
+        def check():
+            if entry.is_interrupted:
+                raise GrabCancelled('The grab has been interrupted.')
+            if token is not None and token.cancelled:
+                raise GrabCancelled('The grab has been cancelled.')
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError('No window has been grabbed before the timeout, the grab was waiting for its turn.')
+            return is_abandoned is None or not is_abandoned()
+
+        with self._cond:
+            self._turns.append(entry)
+            try:
+                while True:
+                    if not check():
+                        return False
+                    if not self._is_busy and self._is_head(entry):
+                        break
+                    self._cond.wait(self.poll_interval * 2)
+                self._is_busy = True
+            finally:
+                self._turns.remove(entry)
+
+        # Another process may hold the lock: poll it, as the processes have no queue to wait in.
+        try:
+            is_waiting = False
+            while not self._acquire():
+                if not is_waiting:
+                    is_waiting = True
+                    with self._cond:
+                        self.cross_process_waits += 1
+                with self._cond:
+                    if not check():
+                        self._set_idle()
+                        return False
+                    self._cond.wait(self.poll_interval)
+        except BaseException:
+            with self._cond:
+                self._set_idle()
+            raise
+
+        with self._cond:
+            self.turns += 1
+        return True
+
+    def _set_idle(self):
+        """ Let the next turn run. Lock must be held. """
+        self._is_busy = False
+        self._cond.notify_all()
+
+    def _release_turn(self):
+        try:
+            self._release()
+        finally:
+            with self._cond:
+                self._set_idle()
+
+    @contextlib.contextmanager
+    def turn(self, *, priority=0, timeout=None, token=None):
+        """ Wait for an exclusive turn, and hold it during the `with` block.
+
+        :param timeout: The longest time (in seconds) to wait for the turn, `None` for no limit.
+        :raises TimeoutError: If `timeout` expires before the turn.
+        :raises GrabCancelled: If `token` is cancelled or the program is interrupted before the turn.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = _Turn(priority, next(self._seq))
+        self._acquire_turn(entry, deadline=deadline, token=token)
+        try:
+            yield
+        finally:
+            self._release_turn()
+    # endregion
+
+    # region Requests
+    def submit(self, request):
+        """ Queue `request`, it is served by the next click. """
+        with self._cond:
+            request._scheduler = self
+            self.submitted += 1
+            batch = self._batch
+            if batch is not None and not batch.is_closed and not batch.is_abandoned and request.shares_click(batch):
+                # Share the click of the running session.
+                batch.requests.append(request)
+                self.coalesced += 1
+            else:
+                self._pending.append(request)
+                if self._dispatch_turn is not None:
+                    self._dispatch_turn.priority = max(self._dispatch_turn.priority, request.priority)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='wingrab-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return request
+
+    def start_batch(self, batch, session):
+        """ Attach the session serving `batch`.
+
+        :return: False if all the requests have left the batch already, the session must not be run.
+        """
+        with self._cond:
+            batch.session = session
+            return not batch.is_abandoned
+
+    def close_batch(self, batch):
+        """ Called by the session of `batch` on the click, the requests arriving later wait for the next click.
+
+        :return: Whether a request of the batch wants the detail of the window.
+        """
+        with self._cond:
+            batch.is_closed = True
+            return batch.wants_detail
+
+    def _discard(self, request):
+        """ Forget a request which is no longer waiting, stop its session if nobody else is waiting.
+
+        :return: The batch of the request if its session has been stopped.
+        """
+        with self._cond:
+            if request in self._pending:
+                self._pending.remove(request)
+                return None
+
+            batch = self._batch
+            if batch is None or request not in batch.requests:
+                return None
+            batch.requests.remove(request)
+            if batch.requests or batch.is_closed:
+                return None
+            batch.is_abandoned = True
+            if batch.session is not None:
+                batch.session.stop()
+            return batch
+
+    def interrupt(self):
+        """ Resolve the queued requests with -1 and fail the waiting turns with `GrabCancelled`.
+
+        The running session is stopped by the caller.
+        """
+        with self._cond:
+            requests, self._pending = self._pending, []
+            for entry in self._turns:
+                entry.is_interrupted = True
+            self._cond.notify_all()
+
+        for request in requests:
+            request._resolve(-1, None)
+
+    def _fail_pending(self, error):
+        """ Fail the queued requests with `error`. """
+        with self._cond:
+            requests, self._pending = self._pending, []
+        for request in requests:
+            request._resolve(None, error)
+
+    def _run(self):
+        while True:
+            try:
+                self._dispatch()
+            except Exception as e:
+                # Whatever fails, the dispatcher keeps serving the next requests.
+                self._fail_pending(e)
+
+    def _dispatch(self):
+        """ Wait for the turn of the queued requests and serve them with one batch. """
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            entry = self._dispatch_turn = _Turn(max(request.priority for request in self._pending),
+                                                next(self._seq))
+
+        try:
+            is_acquired = self._acquire_turn(entry, is_abandoned=lambda: not self._pending)
+        except GrabCancelled:
+            # Interrupted, the queued requests have been resolved.
+            is_acquired = False
+        except Exception as e:
+            # The lock shared by the processes has failed: the requests waiting for it fail, the next ones retry.
+            self._fail_pending(e)
+            is_acquired = False
+        finally:
+            with self._cond:
+                self._dispatch_turn = None
+        if not is_acquired:
+            return
+
+        with self._cond:
+            batch = None
+            if self._pending:
+                # The requests waiting for another click than the first request in line wait for the next batch.
+                head = max(self._pending, key=lambda request: request.priority)
+                batch = self._batch = RequestBatch([request for request in self._pending
+                                                    if request.shares_click(head)])
+                self._pending = [request for request in self._pending if not request.shares_click(head)]
+                self.batches += 1
+                self.coalesced += len(batch.requests) - 1
+        if batch is None:
+            # All the requests have left while the turn was being acquired.
+            self._release_turn()
+            return
+
+        try:
+            pid = info = error = None
+            try:
+                pid, info = self._run_batch(batch)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._batch = None
+                batch.is_closed = True
+                requests = [] if batch.is_abandoned else list(batch.requests)
+        finally:
+            try:
+                self._release_turn()
+            except Exception as e:
+                warnings.warn(f'Unable to release the lock of the grabs: {e!r}', RuntimeWarning)
+            batch.finished.set()
+
+        for request in requests:
+            request._resolve(info if request.detail else pid, error)
+    # endregion
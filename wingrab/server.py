@@ -0,0 +1,235 @@
+# -*- encoding:utf-8 -*-
+
+"""
+A long-running grab server, answering grab requests over a local socket.
+
+`py-wingrab serve` starts a server which keeps the backend warm (prototypes resolved, grab cursor loaded), so that a
+script calling `py-wingrab` in a loop does not pay the whole setup at every call.  The `py-wingrab grab` command then
+only sends a request to the server if one is running, and grabs in-process otherwise.  The requests of concurrent
+clients go through the queue of the grabs (`wingrab.scheduler`): those waiting at the same time share the next click.
+
+The protocol is line-delimited JSON, one request and one response per line::
+
+    -> {"id": 1, "method": "grab", "params": {"timeout": 30, "detail": false, "priority": 0, "mask": "ctrl+left"}}
+    <- {"id": 1, "result": 1234}
+    <- {"id": 1, "error": {"type": "TimeoutError", "message": "No window has been grabbed within 30 seconds."}}
+
+The methods are `grab` (params: `timeout`, `detail`, `priority`, `mask` (see `wingrab.masks.EventMask.parse`) and
+`input_backend`), `ping` and `stats` (including the health of the hook, see `wingrab.watchdog`, and the live handles,
+see `wingrab.resources`).  A grab is cancelled when its client disconnects.
+
+The server listens on `127.0.0.1:47421` by default, or on the address of the `WINGRAB_SERVER` environment variable: a
+`host:port` pair, or the path of a Unix socket where available.
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from . import wingrab as _wingrab
+from .backends import get_backend
+from .resources import tracker
+
+__all__ = ['GrabServer', 'serve', 'request', 'ServerError', 'DEFAULT_ADDRESS']
+
+DEFAULT_ADDRESS = '127.0.0.1:47421'
+
+# The longest time (in seconds) a client waits for the connection to the server
+_CONNECT_TIMEOUT = 1.0
+
+
+class ServerError(RuntimeError):
+    """ An error reported by the server which has no matching local exception. """
+
+
+def _parse_address(address):
+    """ :return: A `(family, address)` tuple for `socket.socket()`. """
+    address = address or os.environ.get('WINGRAB_SERVER') or DEFAULT_ADDRESS
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError(f'Invalid server address: {address!r}, expected host:port')
+    return socket.AF_UNIX, address
+
+
+def _to_json(result):
+    """ Convert a grab result (PID or `WindowInfo`) to JSON-compatible values. """
+    if hasattr(result, '_asdict'):
+        return {key: _to_json(value) for key, value in result._asdict().items()}
+    if isinstance(result, tuple):
+        return list(result)
+    return result
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.dispatch(line, self.connection)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class _Watcher(threading.Thread):
+    """ Cancel a grab when the client disconnects. """
+
+    def __init__(self, connection, token):
+        super().__init__(name='wingrab-server-watcher', daemon=True)
+        self.connection = connection
+        self.token = token
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            try:
+                self.connection.settimeout(0.5)
+                data = self.connection.recv(1, socket.MSG_PEEK)
+            except socket.timeout:
+                continue
+            except OSError:
+                data = b''
+            finally:
+                self.connection.settimeout(None)
+            if not data:
+                self.token.cancel()
+            # Either disconnected, or the client sent its next request, which is read once the grab is done.
+            return
+
+
+class GrabServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """ The grab server, see the module documentation. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=None):
+        self.address_family, address = _parse_address(address)
+        if self.address_family != socket.AF_INET:
+            # A Unix socket left behind by a server which has not been shut down cleanly
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
+        super().__init__(address, _RequestHandler)
+        self._counter_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.served = 0
+        self.waiting = 0
+
+    def warm_up(self):
+        """ Select the backend, resolve its prototypes and load the grab cursor before the first request. """
+        backend = get_backend()
+        if backend.name == 'win32':
+            from .backends import win32
+            win32.bind_all()
+        _wingrab.cursor_cache.warm(backend)
+
+    def dispatch(self, line, connection):
+        """ Handle a request line, return the response. """
+        request_id = None
+        try:
+            message = json.loads(line)
+            request_id = message.get('id')
+            method = message.get('method')
+            params = message.get('params') or {}
+
+            if method == 'ping':
+                result = 'pong'
+            elif method == 'stats':
+                result = {'served': self.served, 'waiting': self.waiting,
+                          'uptime': time.monotonic() - self.started, 'scheduler': _wingrab.scheduler.stats,
+                          'hook': _wingrab.hook_watchdog.stats, 'resources': tracker.stats}
+            elif method == 'grab':
+                result = self._grab(connection, timeout=params.get('timeout'), detail=bool(params.get('detail')),
+                                    priority=params.get('priority', 0), mask=params.get('mask'),
+                                    input_backend=params.get('input_backend'))
+            else:
+                raise ValueError(f'Unknown method: {method!r}')
+        except Exception as e:
+            return {'id': request_id, 'error': {'type': type(e).__name__, 'message': str(e)}}
+        return {'id': request_id, 'result': result}
+
+    def _grab(self, connection, *, timeout, detail, priority, mask, input_backend):
+        token = _wingrab.CancellationToken()
+        watcher = _Watcher(connection, token)
+        watcher.start()
+        with self._counter_lock:
+            self.waiting += 1
+        try:
+            result = _wingrab.grab(detail=detail, timeout=timeout, token=token, priority=priority, mask=mask,
+                                   input_backend=input_backend)
+            with self._counter_lock:
+                self.served += 1
+            return _to_json(result)
+        finally:
+            with self._counter_lock:
+                self.waiting -= 1
+            watcher.done.set()
+            watcher.join()
+
+
+def serve(address=None):
+    """ Run a grab server until SIGINT/SIGTERM. Must be called from the main thread. """
+    server = GrabServer(address)
+    server.warm_up()
+    _wingrab.install_exit_handlers()
+
+    stopped = threading.Event()
+
+    def on_signal(sig, frame):
+        # Stop the running grab as well, which restores the cursors.
+        _wingrab._quit()
+        stopped.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    thread = threading.Thread(target=server.serve_forever, name='wingrab-server', daemon=True)
+    thread.start()
+    try:
+        # Bounded waits, so that the main thread still runs its signal handlers.
+        while not stopped.wait(0.1):
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def request(method, params=None, *, address=None, timeout=None):
+    """ Send a request to a running grab server and return its result.
+
+    :param timeout: The longest time (in seconds) to wait for the response, `None` for no limit.
+    :raises ConnectionError: If no server is running.
+    :raises TimeoutError, wingrab.GrabCancelled, ServerError: The errors reported by the server.
+    """
+    family, address = _parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(_CONNECT_TIMEOUT)
+        try:
+            sock.connect(address)
+        except OSError as e:
+            raise ConnectionError(f'No grab server is listening on {address}.') from e
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps({'id': 1, 'method': method, 'params': params or {}}).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+
+    if not line:
+        raise ConnectionError('The grab server closed the connection.')
+    response = json.loads(line)
+    error = response.get('error')
+    if error is None:
+        return response.get('result')
+
+    error_class = {
+        'TimeoutError': TimeoutError,
+        'GrabCancelled': _wingrab.GrabCancelled,
+    }.get(error.get('type'), ServerError)
+    raise error_class(error.get('message'))
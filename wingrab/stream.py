@@ -0,0 +1,323 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Streaming grab: follow the window under the cursor.
+
+`stream()` keeps one low-level mouse hook installed on a background thread and yields the window under the cursor
+whenever the mouse moves (hover) or the left button (or the button of its `mask`) is clicked, until the consumer
+stops::
+
+    import wingrab
+
+    with wingrab.stream() as windows:
+        for pid, hwnd, point, timestamp in windows:
+            print(pid, hwnd, point)
+
+The hook only records the events, and the worker of the session keeps the latest mouse move, overwriting the previous
+one: a flood of `WM_MOUSEMOVE` is coalesced into a single sample and a slow consumer never backs up the hook.  The window
+lookup is made by the consumer when it asks for the next sample, from a `wingrab.hittest.WindowIndex` of the top-level
+windows with `hit_test_cache=True`.
+"""
+import collections
+import threading
+import time
+
+from ctypes.wintypes import POINT
+
+from . import wingrab as _wingrab
+from .hittest import WindowIndex
+from .masks import as_mask
+from .winuser import WM_MOUSEMOVE
+
+__all__ = ['stream', 'GrabStream', 'StreamEvent']
+
+# The maximum number of clicks waiting for the consumer, older clicks are dropped
+_MAX_PENDING_CLICKS = 64
+
+
+class StreamEvent(collections.namedtuple('StreamEvent', ['pid', 'hwnd', 'point', 'timestamp'])):
+    """ A window under the cursor.
+
+    `point` is the `(x, y)` position of the cursor, `timestamp` the `time.monotonic()` of the mouse event, and the
+    `clicked` attribute tells whether the event is a click (True) or a mouse move (False).
+    """
+
+    def __new__(cls, pid, hwnd, point, timestamp, clicked=False):
+        self = super().__new__(cls, pid, hwnd, point, timestamp)
+        self.clicked = clicked
+        return self
+
+
+class _StreamBuffer:
+    """ The events recorded by the hook, waiting for the consumer. """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        # The latest mouse move, as a ((x, y), timestamp) tuple, overwritten by every move
+        self.move = None
+        # The clicks, as ((x, y), timestamp) tuples
+        self.clicks = collections.deque(maxlen=_MAX_PENDING_CLICKS)
+        self.is_closed = False
+        self.error = None
+        # The asyncio futures waiting for an event, as (loop, future) tuples
+        self.waiters = []
+
+        # Counters
+        self.moves_seen = 0
+        self.moves_coalesced = 0
+
+    def _notify(self):
+        self.cond.notify_all()
+        if self.waiters:
+            for loop, future in self.waiters:
+                loop.call_soon_threadsafe(_set_future_done, future)
+            self.waiters.clear()
+
+    def push_move(self, point, timestamp):
+        with self.cond:
+            self.moves_seen += 1
+            if self.move is not None:
+                self.moves_coalesced += 1
+            self.move = (point, timestamp)
+            self._notify()
+
+    def push_click(self, point, timestamp):
+        with self.cond:
+            self.clicks.append((point, timestamp))
+            self._notify()
+
+    def close(self, error=None):
+        with self.cond:
+            self.is_closed = True
+            if error is not None and self.error is None:
+                self.error = error
+            self._notify()
+
+    def pop(self):
+        """ Pop the next event as a (point, timestamp, clicked) tuple, `None` if there is none. Lock must be held. """
+        if self.clicks:
+            return self.clicks.popleft() + (True,)
+        if self.move is not None:
+            move, self.move = self.move, None
+            return move + (False,)
+        if self.is_closed:
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        return None
+
+
+def _set_future_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _StreamSession(_wingrab._HookSession):
+    """ A hook session recording the mouse moves and the clicks into a `_StreamBuffer`. """
+
+    kind = 'stream'
+
+    def __init__(self, buffer, *, hover, clicks, patch_cursors, started, index=None, mask=None, input_backend=None,
+                 debug=False):
+        # Only the moves are observed, besides the trigger button of the clicks.
+        mask = as_mask(mask).replace(moves=hover, wheel=False, buttons=False)
+        if not clicks:
+            mask = mask.replace(button=None, modifiers=())
+        super().__init__(patch_cursors=patch_cursors, mask=mask, input_backend=input_backend, debug=debug)
+        self.buffer = buffer
+        self.hover = hover
+        self.clicks = clicks
+        self.index = index
+        self._started = started
+        # Cancels the wait for the turn of the stream when it is closed before starting
+        self._turn_token = _wingrab.CancellationToken()
+
+    def on_started(self):
+        if self.index is not None:
+            # The window events are delivered through the message queue of this thread.
+            self.index.attach(self.backend)
+        self._started.set()
+
+    def collect_metrics(self, metrics):
+        metrics.counters['coalesced'] = self.buffer.moves_coalesced
+
+    def stop(self):
+        self._turn_token.cancel()
+        super().stop()
+
+    def on_event(self, wParam, info):
+        if wParam == WM_MOUSEMOVE and self.hover:
+            self.buffer.push_move((info.pt.x, info.pt.y), time.monotonic())
+
+    def on_trigger(self, info):
+        self.buffer.push_click((info.pt.x, info.pt.y), time.monotonic())
+
+    def run_locked(self, timeout=None):
+        """ The body of the stream thread, the stream waits for the grabs which are running. """
+        try:
+            with _wingrab._global_wingrab_process_lock(timeout=timeout, token=self._turn_token):
+                try:
+                    self.run()
+                finally:
+                    if self.index is not None:
+                        self.index.detach()
+        except _wingrab.GrabCancelled as e:
+            # Closed (or cancelled by the token of the stream) while waiting for the turn
+            self.buffer.close(self.error if self.is_finished() else e)
+        except BaseException as e:
+            self.buffer.close(e)
+        else:
+            self.buffer.close()
+        finally:
+            # Unblock `GrabStream.start()` if the session failed before starting.
+            self._started.set()
+
+
+class GrabStream:
+    """ An iterator and an async iterator of `StreamEvent`, see `stream()`. """
+
+    def __init__(self, *, hover=True, clicks=True, patch_cursors=False, hit_test_cache=False, mask=None,
+                 input_backend=None, _debug=False):
+        self._buffer = _StreamBuffer()
+        self._started = threading.Event()
+        self._index = WindowIndex() if hit_test_cache is True else (hit_test_cache or None)
+        self._session = _StreamSession(self._buffer, hover=hover, clicks=clicks, patch_cursors=patch_cursors,
+                                       started=self._started, index=self._index, mask=mask,
+                                       input_backend=input_backend, debug=_debug)
+        self._thread = None
+        self._token = None
+
+    def start(self, timeout=None, token=None):
+        """ Install the hook on a background thread, return once it is installed.
+
+        :param timeout: The longest time (in seconds) to wait for the other grabs to finish, `None` for no limit.
+        :param token: A `CancellationToken` closing the stream, the iteration then raises `GrabCancelled`.
+        :raises TimeoutError: If `timeout` expires before the turn of the stream.
+        :raises GrabCancelled: If `token` is cancelled before the turn of the stream.
+        """
+        if self._thread is not None:
+            return self
+
+        _wingrab.install_exit_handlers()
+
+        if token is not None:
+            self._token = token
+            token._register(self._session.cancel)
+        # The thread must not hold a reference to the stream, so that a dropped stream is closed by `__del__`.
+        self._thread = threading.Thread(target=self._session.run_locked, args=(timeout,),
+                                        name='wingrab-stream', daemon=True)
+        self._thread.start()
+        # Bounded waits, so that the main thread still runs its signal handlers.
+        while not self._started.wait(0.1):
+            pass
+
+        with self._buffer.cond:
+            if self._buffer.is_closed and self._buffer.error is not None:
+                raise self._buffer.error
+        return self
+
+    def close(self):
+        """ Remove the hook and stop the iteration, wait for the background thread to exit. """
+        if self._token is not None:
+            self._token._unregister(self._session.cancel)
+        self._session.stop()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._buffer.close()
+
+    @property
+    def closed(self):
+        return self._buffer.is_closed
+
+    @property
+    def stats(self):
+        """ The counters of the stream: mouse moves seen and coalesced, and the counters of the hit-test cache. """
+        stats = {'moves_seen': self._buffer.moves_seen, 'moves_coalesced': self._buffer.moves_coalesced}
+        if self._index is not None:
+            stats['hit_test'] = self._index.stats
+        return stats
+
+    def _make_event(self, item):
+        point, timestamp, clicked = item
+        started = time.perf_counter()
+        found = None if self._index is None else self._index.lookup(*point)
+        if found is None:
+            found = _wingrab._get_window_from_point(self._session.backend, POINT(*point))
+        hwnd, pid = found
+        metrics = self._session.metrics
+        if metrics is not None:
+            # The lookups made once the session is over are not reported.
+            metrics.lap('resolve', started)
+        return StreamEvent(pid, hwnd, point, timestamp, clicked)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if self._thread is not None:
+            self.close()
+
+    # region Iterator
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        buffer = self._buffer
+        with buffer.cond:
+            while True:
+                item = buffer.pop()
+                if item is not None:
+                    break
+                # Bounded wait, so that the consumer thread still runs its signal handlers.
+                buffer.cond.wait(0.1)
+        return self._make_event(item)
+    # endregion
+
+    # region Async iterator
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        buffer = self._buffer
+        while True:
+            with buffer.cond:
+                try:
+                    item = buffer.pop()
+                except StopIteration:
+                    raise StopAsyncIteration from None
+                if item is None:
+                    future = loop.create_future()
+                    buffer.waiters.append((loop, future))
+            if item is not None:
+                return self._make_event(item)
+            await future
+    # endregion
+
+
+def stream(*, hover=True, clicks=True, patch_cursors=False, hit_test_cache=False, mask=None, input_backend=None,
+           timeout=None, token=None, _debug=False):
+    """ Follow the window under the cursor, see the module documentation.
+
+    :param hover: Yield an event when the mouse moves (consecutive moves are coalesced).
+    :param clicks: Yield an event when the left button is clicked, the click is not passed to the window.
+    :param mask: The button (and the modifier keys) of the clicks, see `wingrab.grab`.
+    :param input_backend: The source of the mouse events, see `wingrab.grab`. The raw input suits a stream of the
+        hovered windows: the mouse of the desktop never waits for the stream.
+    :param patch_cursors: Change the cursors to the grab cursor while streaming.
+    :param hit_test_cache: Look the windows up in a `wingrab.hittest.WindowIndex` (or the given one) instead of asking
+        the system for every event. The `hwnd` of the events found in the index is then the top-level window.
+    :param timeout: The longest time (in seconds) to wait for the other grabs to finish, `None` for no limit.
+    :param token: A `CancellationToken` closing the stream, see `GrabStream.start()`.
+    :return: A started `GrabStream`, to be closed with `close()` or used as a context manager.
+    :raises TimeoutError: If `timeout` expires while waiting for the other grabs to finish.
+    :raises GrabCancelled: If `token` is cancelled while waiting for the other grabs to finish.
+    """
+    return GrabStream(hover=hover, clicks=clicks, patch_cursors=patch_cursors, hit_test_cache=hit_test_cache,
+                      mask=mask, input_backend=input_backend, _debug=_debug).start(timeout, token)
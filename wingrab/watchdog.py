@@ -0,0 +1,156 @@
+# -*- encoding:utf-8 -*-
+
+"""
+The health of the low-level mouse hook.
+
+Windows calls a low-level hook procedure with a timeout, `LowLevelHooksTimeout` in the registry, and since Windows 7 it
+silently removes a hook whose procedure has not returned in time.  Nothing tells the hook thread, which then waits for
+a click which never comes.
+
+While a session uses the `hook` input (see `wingrab.inputs`), its message loop calls `HookWatchdog.check()` at every
+wake-up, at least every `wingrab.msgloop.POLL_INTERVAL` seconds, and every `interval` seconds the watchdog:
+
+- Compares the durations of the recent calls of the hook procedure to the timeout of the hook, and reports the calls
+  slower than `slow_ratio` of the timeout.  The durations are measured by the procedure itself, so they miss the time
+  spent waiting for the GIL before it runs, which is caught by the next check.
+- Checks whether the hook is still called: when the cursor keeps moving over `stall_checks` checks while the hook
+  procedure is not called any more, the hook has been removed, and the watchdog installs it again.
+
+The incidents, the counters and the histogram of the durations of the hook procedure are reported by `stats`::
+
+    import wingrab
+
+    print(wingrab.wingrab.hook_watchdog.stats)
+
+Moving the cursor with `SetCursorPos` does not call the hook, so a grab whose application moves the cursor may have its
+hook reinstalled for nothing, which is harmless.
+"""
+import collections
+import threading
+import time
+
+__all__ = ['HookWatchdog']
+
+
+class HookWatchdog:
+    """ Watch the hook of the running session.
+
+    :param latency: The `wingrab.hookbuffer.LatencyRecorder` of the hook procedure, whose count of calls tells whether
+        the hook is still called.
+    :param interval: The time (in seconds) between two checks.
+    :param stall_checks: The number of checks in a row seeing the cursor move without any call of the hook procedure,
+        after which the hook is considered removed.
+    :param slow_ratio: The part of the timeout of the hook above which a call of the hook procedure is slow.
+    :param max_incidents: The number of recent incidents kept in `stats`.
+    """
+
+    def __init__(self, latency, *, interval=0.25, stall_checks=2, slow_ratio=0.5, max_incidents=100):
+        self.latency = latency
+        self.interval = interval
+        self.stall_checks = stall_checks
+        self.slow_ratio = slow_ratio
+        # Whether the sessions are watched
+        self.enabled = True
+        # The timeout of the hook (in seconds), read from the backend by each session
+        self.timeout = None
+        self.incidents = collections.deque(maxlen=max_incidents)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.sessions = 0
+        self.checks = 0
+        self.reinstalls = 0
+        self.slow_calls = 0
+
+        # The state of the watched session
+        self._session = None
+        self._next_check = 0.0
+        self._calls = 0
+        self._seen_calls = 0
+        self._position = None
+        self._stalls = 0
+
+    def start(self, session):
+        """ Start watching the hook of `session`, on its thread. """
+        backend = session.backend
+        self.timeout = backend.get_hook_timeout()
+        self._session = session
+        self._next_check = time.monotonic() + self.interval
+        self._calls = self._seen_calls = self.latency.count
+        self._position = backend.get_cursor_pos()
+        self._stalls = 0
+        with self._lock:
+            self.sessions += 1
+
+    def stop(self):
+        """ Stop watching the session, once its hook is removed. """
+        if self._session is not None:
+            self._check_latency(self.latency.count)
+            self._session = None
+
+    def _report(self, kind, message, **details):
+        self.incidents.append(dict(time=time.time(), kind=kind, message=message, **details))
+
+    def _check_latency(self, calls):
+        threshold = self.timeout * self.slow_ratio
+        slow = [seconds for seconds in self.latency.since(self._seen_calls) if seconds > threshold]
+        self._seen_calls = calls
+        if slow:
+            with self._lock:
+                self.slow_calls += len(slow)
+                self._report('slow', f'{len(slow)} calls of the hook procedure took more than {threshold:.3f} seconds',
+                             calls=len(slow), max=max(slow))
+
+    def check(self):
+        """ Check the hook of the watched session, and reinstall it if it has been removed. Called by the message loop
+        of the session, on its thread.
+
+        :return: True if the hook has been reinstalled.
+        """
+        now = time.monotonic()
+        if now < self._next_check or self._session is None:
+            return False
+        self._next_check = now + self.interval
+
+        session = self._session
+        calls = self.latency.count
+        position = session.backend.get_cursor_pos()
+        self._check_latency(calls)
+        with self._lock:
+            self.checks += 1
+
+        if calls != self._calls:
+            self._stalls = 0
+        elif position != self._position:
+            self._stalls += 1
+        self._calls = calls
+        self._position = position
+        if self._stalls < self.stall_checks:
+            return False
+
+        self._stalls = 0
+        session.reinstall()
+        self._calls = self._seen_calls = self.latency.count
+        with self._lock:
+            self.reinstalls += 1
+            self._report('removed', f'The cursor has moved during {self.stall_checks} checks without any call of the '
+                                    f'hook procedure, the hook has been reinstalled')
+        return True
+
+    @property
+    def stats(self):
+        """ The timeout of the hook, the counters and the recent incidents of the watchdog, and the percentiles and the
+        histogram of the durations (in seconds) of the hook procedure, see `LatencyRecorder.histogram()`.
+        """
+        with self._lock:
+            stats = {
+                'timeout': self.timeout,
+                'sessions': self.sessions,
+                'checks': self.checks,
+                'reinstalls': self.reinstalls,
+                'slow_calls': self.slow_calls,
+                'incidents': list(self.incidents),
+            }
+        stats['latency'] = self.latency.percentiles()
+        stats['histogram'] = self.latency.histogram()
+        return stats
@@ -6,301 +6,55 @@ WinGrab: A simple tool to get the PID of the window under the cursor.
 Developed by Jianzhang Chen
 LICENSE: MIT
 """
-import sys
-
-if sys.platform != 'win32':
-    raise NotImplementedError('Only support Windows platform')
-
-import msvcrt
 import atexit
+import collections
 import signal
 import os
-import threading
 import contextlib
-
-from ctypes import POINTER, cast, byref, Structure, WinError, get_last_error, c_int, WinDLL, WINFUNCTYPE, c_long
-from ctypes.wintypes import (WPARAM, LPARAM, HANDLE, DWORD, BOOL, HINSTANCE, UINT, LPCWSTR, LPDWORD, MSG, HHOOK, HWND,
-                             POINT)
-
-__all__ = ['grab', 'cleanup']
-
-user32 = WinDLL('user32', use_last_error=True)
-
-HC_ACTION = 0
-WH_MOUSE_LL = 14
-
-WM_NULL = 0x0000
-WM_QUIT = 0x0012
-WM_MOUSEMOVE = 0x0200
-WM_LBUTTONDOWN = 0x0201
-WM_LBUTTONUP = 0x0202
-WM_RBUTTONDOWN = 0x0204
-WM_RBUTTONUP = 0x0205
-WM_MBUTTONDOWN = 0x0207
-WM_MBUTTONUP = 0x0208
-WM_MOUSEWHEEL = 0x020A
-WM_MOUSEHWHEEL = 0x020E
-
-WM_TO_TEXT = {
-    WM_MOUSEMOVE: 'WM_MOUSEMOVE',
-    WM_LBUTTONDOWN: 'WM_LBUTTONDOWN',
-    WM_LBUTTONUP: 'WM_LBUTTONUP',
-    WM_RBUTTONDOWN: 'WM_RBUTTONDOWN',
-    WM_RBUTTONUP: 'WM_RBUTTONUP',
-    WM_MBUTTONDOWN: 'WM_MBUTTONDOWN',
-    WM_MBUTTONUP: 'WM_MBUTTONUP',
-    WM_MOUSEWHEEL: 'WM_MOUSEWHEEL',
-    WM_MOUSEHWHEEL: 'WM_MOUSEHWHEEL'
-}
-
-IMAGE_CURSOR = 2
-LR_SHARED = 0x00008000
-LR_COPYFROMRESOURCE = 0x00004000
-
-SPI_SETCURSORS = 0x0057
-
-ULONG_PTR = WPARAM
-LRESULT = LPARAM
-LPMSG = POINTER(MSG)
-HCURSOR = HANDLE
-
-HOOKPROC = WINFUNCTYPE(LRESULT, c_int, WPARAM, LPARAM)
-LowLevelMouseProc = HOOKPROC
-
-# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-peekmessagew
-PM_NOREMOVE = 0x0000
-PM_REMOVE = 0x0001
-PM_NOYIELD = 0x0002
-
-
-class MSLLHOOKSTRUCT(Structure):
-    _fields_ = (('pt', POINT),
-                ('mouseData', DWORD),
-                ('flags', DWORD),
-                ('time', DWORD),
-                ('dwExtraInfo', ULONG_PTR))
-
-
-class _Point(Structure):
-    _fields_ = [
-        ('x', c_long),
-        ('y', c_long),
-    ]
-
-
-LPMSLLHOOKSTRUCT = POINTER(MSLLHOOKSTRUCT)
-
-
-def errcheck_bool(result, func, args):
-    if not result:
-        raise WinError(get_last_error())
-    return args
-
-
-def MAKEINTRESOURCEW(x):
-    return LPCWSTR(x)
-
-
-# ===================================
-#  SetWindowsHookEx
-#  https://learn.microsoft.com/zh-cn/windows/win32/api/winuser/nf-winuser-setwindowshookexw
-# ===================================
-user32.SetWindowsHookExW.errcheck = errcheck_bool
-user32.SetWindowsHookExW.restype = HHOOK
-user32.SetWindowsHookExW.argtypes = (
-    # _In_ idHook
-    c_int,
-    # _In_ lpfn
-    HOOKPROC,
-    # _In_ hMod
-    HINSTANCE,
-    # _In_ dwThreadId
-    DWORD,
-)
-
-# ===================================
-#  PostThreadMessageW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-postthreadmessagew
-# ===================================
-user32.PostThreadMessageW.restype = BOOL
-user32.PostThreadMessageW.argtypes = (
-    # _In_ idThread
-    DWORD,
-    # _In_ Msg
-    UINT,
-    # _In_ wParam
-    WPARAM,
-    # _In_ lParam
-    LPARAM,
-)
-
-# ===================================
-#  UnhookWindowsHookEx
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-unhookwindowshookex
-# ===================================
-user32.UnhookWindowsHookEx.restype = BOOL
-user32.UnhookWindowsHookEx.argtypes = (
-    # _In_ hhk
-    HHOOK,
-)
-
-# ===================================
-#  CallNextHookEx
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-callnexthookex
-# ===================================
-user32.CallNextHookEx.restype = LRESULT
-user32.CallNextHookEx.argtypes = (
-    # _In_opt_ hhk
-    HHOOK,
-    # _In_     nCode
-    c_int,
-    # _In_     wParam
-    WPARAM,
-    # _In_     lParam
-    LPARAM,
-)
-
-# ===================================
-#  GetMessageW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getmessagew
-# ===================================
-user32.GetMessageW.argtypes = (
-    # _Out_    lpMsg
-    LPMSG,
-    # _In_opt_ hWnd
-    HWND,
-    # _In_     wMsgFilterMin
-    UINT,
-    # _In_     wMsgFilterMax
-    UINT,
-)
-
-# ===================================
-#  PeekMessageW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-peekmessagew
-# ===================================
-user32.PeekMessageW.argtypes = (
-    # _Out_    lpMsg
-    LPMSG,
-    # _In_opt_ hWnd
-    HWND,
-    # _In_     wMsgFilterMin
-    UINT,
-    # _In_     wMsgFilterMax
-    UINT,
-    # _In_     wRemoveMsg
-    UINT,
-)
-
-# ===================================
-#  TranslateMessage
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-translatemessage
-# ===================================
-user32.TranslateMessage.argtypes = (
-    # _In_ lpMsg
-    LPMSG,
-)
-
-# ===================================
-#  DispatchMessageW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-dispatchmessagew
-# ===================================
-user32.DispatchMessageW.argtypes = (
-    # _In_ lpMsg
-    LPMSG,
-)
-
-# ===================================
-#  SetSystemCursor
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-setsystemcursor
-# ===================================
-user32.SetSystemCursor.restype = BOOL
-user32.SetSystemCursor.argtypes = (
-    # _In_ hcur
-    HCURSOR,
-    # _In_ id
-    DWORD,
-)
-
-# ===================================
-#  LoadCursorFromFileW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-loadcursorfromfilew
-# ===================================
-user32.LoadCursorFromFileW.restype = HCURSOR
-user32.LoadCursorFromFileW.argtypes = (
-    # _In_ lpFileName
-    LPCWSTR,
-)
-
-# ===================================
-#  GetCursorPos
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getcursorpos
-# ===================================
-user32.GetCursorPos.restype = BOOL
-user32.GetCursorPos.argtypes = (
-    # _Out_ lpPoint
-    POINTER(POINT),
-)
-
-# ===================================
-#  WindowFromPoint
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-windowfrompoint
-# ===================================
-user32.WindowFromPoint.restype = HWND
-user32.WindowFromPoint.argtype = (
-    # _In_ Point
-    _Point,
-)
-
-# ===================================
-#  GetWindowThreadProcessId
-#  https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowthreadprocessid
-# ===================================
-user32.GetWindowThreadProcessId.restype = DWORD
-user32.GetWindowThreadProcessId.argtype = (
-    # _In_      hWnd
-    HWND,
-    # _Out_opt_ lpdwProcessId
-    LPDWORD,
-)
-
-# ===================================
-#  SystemParametersInfoW
-#  https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-systemparametersinfow
-# ===================================
-user32.SystemParametersInfoW.restype = BOOL
-user32.SystemParametersInfoW.argtypes = (
-    # _In_     uiAction
-    UINT,
-    # _In_     uiParam
-    UINT,
-    # _Inout_  pvParam
-    POINTER(POINT),
-    # _In_     fWinIni
-    UINT,
-)
+import tempfile
+import threading
+import time
+
+from queue import SimpleQueue
+from time import perf_counter
+
+from . import metrics as _metrics
+from .backends import get_backend
+from .cursors import CursorCache, CursorJournal, CursorPatch, recover_cursors
+from .hookbuffer import EventRing, LatencyRecorder
+from .inputs import HookInput, HostedInput, RawInput, get_input, register_input
+from .locks import LockManager
+from .masks import EventMask, as_mask
+from .msgloop import run_message_loop
+from .procinfo import describe_window
+from .recorder import EventRecorder
+from .scheduler import Scheduler, GrabRequest, CancellationToken, GrabCancelled
+from .watchdog import HookWatchdog
+from .winuser import (HC_ACTION, WM_TO_TEXT, WM_MOUSEMOVE, IDC_ARROW, IDC_IBEAM, IDC_WAIT, IDC_CROSS, IDC_UPARROW,
+                      IDC_SIZENWSE, IDC_SIZENESW, IDC_SIZEWE, IDC_SIZENS, IDC_SIZEALL, IDC_NO, IDC_HAND,
+                      IDC_APPSTARTING)
+
+__all__ = ['grab', 'grab_many', 'cleanup', 'install_exit_handlers', 'CancellationToken', 'GrabCancelled', 'GrabBatch',
+           'ClickTiming']
 
 # Standard cursor identifiers
 # https://learn.microsoft.com/en-us/windows/win32/menurc/about-cursors
 _standard_cursor_ids = [
-    32512,  # IDC_ARROW
-    32513,  # IDC_IBEAM
-    32514,  # IDC_WAIT
-    32515,  # IDC_CROSS
-    32516,  # IDC_UPARROW
-    32642,  # IDC_SIZENWSE
-    32643,  # IDC_SIZENESW
-    32644,  # IDC_SIZEWE
-    32645,  # IDC_SIZENS
-    32646,  # IDC_SIZEALL
-    32648,  # IDC_NO
-    32649,  # IDC_HAND
-    32650,  # IDC_APPSTARTING
+    IDC_ARROW,
+    IDC_IBEAM,
+    IDC_WAIT,
+    IDC_CROSS,
+    IDC_UPARROW,
+    IDC_SIZENWSE,
+    IDC_SIZENESW,
+    IDC_SIZEWE,
+    IDC_SIZENS,
+    IDC_SIZEALL,
+    IDC_NO,
+    IDC_HAND,
+    IDC_APPSTARTING,
 ]
 
-# Whether to print debug messages
-_is_debug = False
-
 # The absolute path of the module
 module_path = os.path.dirname(__file__)
 
@@ -308,64 +62,50 @@ module_path = os.path.dirname(__file__)
 cursor_rel_path = 'cursor.cur'
 cursor_absolute_path = os.path.join(module_path, cursor_rel_path)
 
-# The path of the lock file
+# The cursor is loaded once per process, see `CursorCache.stats` for the patch/restore timings
+cursor_cache = CursorCache(cursor_absolute_path)
+
+# The cursors replaced by the running grab, read by `cleanup()` after a crash
+cursor_journal = CursorJournal(os.path.join(tempfile.gettempdir(), 'wingrab-cursors.json'))
+
+# The path of the lock file, only used by the `file` lock
 lock_file_path = os.path.join(module_path, 'WINGRAB.LOCKFILE')
 
-# The result of the grab
-_result = 0
+# The lock held by the running grab, see `wingrab.locks`
+process_lock = LockManager(lock_file_path)
 
-# Whether the cursor has been changed
-# If the cursor has been changed, we need to restore it when the grab is finished or the program exits.
-_is_cursor_changed = False
+# The durations (in seconds) of the recent calls of the hook procedure, see `LatencyRecorder.percentiles()`
+hook_latency = LatencyRecorder()
 
+# Reinstalls the hook when the system removes it, and reports its health, see `HookWatchdog.stats`
+hook_watchdog = HookWatchdog(hook_latency)
 
-def _release_lock(f):
-    """ Close file and remove lock file.
-    """
-    f.close()
-    try:
-        os.remove(lock_file_path)
-    except PermissionError:
-        # Ignore permission error as it does not affect program execution or subsequent lock operation
-        pass
+# The session whose hook is installed, the low-level hook procedure forwards the mouse events to it.
+# The state of a grab (backend, result, debug flag, patched cursors...) is kept by its session.
+_active_session = None
+
+# Whether the exit handlers have been registered by `install_exit_handlers()`
+_is_atexit_registered = False
+_are_signal_handlers_installed = False
 
 
 @contextlib.contextmanager
-def _global_wingrab_process_lock():
+def _global_wingrab_process_lock(*, priority=0, timeout=None, token=None):
     """
-    Context manager for acquiring and releasing a process lock for WinGrab.
+    Context manager for waiting for the turn of a grab and holding it, see `wingrab.scheduler`.
 
-    The process lock ensures that only one instance of WinGrab is running at a time.
-    If another instance is already running, a `RuntimeError` is raised.
+    The turn ensures that only one grab of WinGrab is running at a time, in this process and in the other processes
+    (see `wingrab.locks`). A grab started while another one is running waits for it to finish.
 
     Example:
-        with _global_wingrab_process_lock():
+        with _global_wingrab_process_lock(timeout=10):
             # Code executed while the lock is held
 
-    :return: None
+    :raises TimeoutError: If `timeout` (in seconds) expires before the turn.
+    :raises GrabCancelled: If `token` is cancelled or the program is interrupted before the turn.
     """
-
-    # Create a lock file
-    try:
-        f = open(lock_file_path, 'w+')
-    except PermissionError:
-        raise RuntimeError(
-            'Unable to open lock file. Ensure that the path exists and you have write permission.'
-        ) from None
-
-    # Try to acquire the lock
-    try:
-        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
-    except OSError:
-        _release_lock(f)
-        raise RuntimeError('Another instance of WinGrab is already running.') from None
-
-    # Yield to the context
-    try:
+    with scheduler.turn(priority=priority, timeout=timeout, token=token):
         yield
-    finally:
-        f.close()
-        _cleanup_impl(_from_atexit=True)
 
 
 def _print_mouse_msg(wParam, msg):
@@ -376,90 +116,509 @@ def _print_mouse_msg(wParam, msg):
     print('{:15s}: {}'.format(msg_id, msg_to_print))
 
 
-def _patch_system_cursors():
-    """ Change all standard cursors to our custom cursor. """
-    global _is_cursor_changed
-    _is_cursor_changed = True
+def _prepare_system_cursors(backend):
+    """ Make the cursors replacing all standard cursors, without replacing them yet.
+
+    :return: The `CursorPatch` whose `commit()` replaces the cursors.
+    """
+
+    is_checked = False
+
+    def make_cursor():
+        nonlocal is_checked
+        # The file of the cursor is checked for the first copy only.
+        newCursor = cursor_cache.copy(backend, check=not is_checked)
+        is_checked = True
+        if newCursor is None:
+            newCursor = backend.load_cursor_from_file(cursor_absolute_path)
+        return newCursor
+
+    patch = CursorPatch(backend, _standard_cursor_ids, journal=cursor_journal)
+    patch.prepare(make_cursor)
+    return patch
+
 
-    for cursorId in _standard_cursor_ids:
-        newCursor = user32.LoadCursorFromFileW(cursor_absolute_path)
-        user32.SetSystemCursor(newCursor, cursorId)
+def _patch_system_cursors(backend):
+    """ Change all standard cursors to our custom cursor.
+
+    :return: The `CursorPatch` putting the original cursors back.
+    """
+    started = perf_counter()
+    patch = _prepare_system_cursors(backend)
+    patch.commit()
+    cursor_cache.record('patch', started)
+    return patch
 
 
-def _restore_system_cursors():
+def _restore_system_cursors(patch):
     """ Restore all standard cursors. """
-    global _is_cursor_changed
-    user32.SystemParametersInfoW(SPI_SETCURSORS, 0, None, 0)
-    _is_cursor_changed = False
+    started = perf_counter()
+    if not patch.restore():
+        cursor_cache.stats['scheme_reloads'] += 1
+    cursor_cache.record('restore', started)
+
 
+def _get_window_from_point(backend, point):
+    """ Get the handle and the PID of the window under the cursor. """
+    win = backend.window_from_point(point.x, point.y)
+    _, pid = backend.get_window_thread_process_id(win)
+    return win, pid
 
-def _get_pid_from_point(point):
+
+def _get_pid_from_point(backend, point):
     """ Get the PID of the window under the cursor. """
-    win = user32.WindowFromPoint(point)
-    pid = c_int()
-    user32.GetWindowThreadProcessId(win, byref(pid))
-    return pid.value
+    return _get_window_from_point(backend, point)[1]
 
 
-@LowLevelMouseProc
 def _LLMouseProc(nCode, wParam, lParam):
-    """ Low-level mouse input event hook procedure. """
-    global _result
-
-    if nCode == HC_ACTION:
-        if _is_debug:
-            msg = cast(lParam, LPMSLLHOOKSTRUCT)[0]
-            _print_mouse_msg(wParam, msg)
+    """ Low-level mouse input event hook procedure.
 
-        if wParam == WM_LBUTTONDOWN:
+    The procedure only decides whether the event is swallowed and copies it to the ring buffer of the session, the
+    event is handled on the worker thread of the session. The events the session does not observe (see
+    `wingrab.masks`) are passed to the next hook right away.
+    """
+    started = perf_counter()
+    session = _active_session
+
+    if nCode == HC_ACTION and session is not None:
+        recorder = session.recorder
+        if recorder is not None:
+            recorder.push(wParam, lParam)
+        handler = session.dispatch.get(wParam)
+        if handler is not None and handler(wParam, lParam):
+            hook_latency.record(perf_counter() - started)
             return 1
 
-        elif wParam == WM_LBUTTONUP:
-            point = POINT()
-            user32.GetCursorPos(byref(point))
-            _result = _get_pid_from_point(point)
+    backend = session.backend if session is not None else get_backend()
+    ret = backend.call_next_hook(nCode, wParam, lParam)
+    hook_latency.record(perf_counter() - started)
+    return ret
 
-            # Post a WM_NULL message to the current thread to exit the message loop when the grab is finished.
-            user32.PostThreadMessageW(threading.current_thread().ident, WM_NULL, 0, 0)
-            return 1
-    return user32.CallNextHookEx(None, nCode, wParam, lParam)
 
+def _RawInputProc(wParam, lParam):
+    """ Raw input procedure, called by the message loop of the session with each mouse event read.
+
+    The events go through the dispatch table of the session like those of the hook, but they cannot be swallowed.
+    """
+    session = _active_session
+    if session is not None:
+        recorder = session.recorder
+        if recorder is not None:
+            recorder.push(wParam, lParam)
+        handler = session.dispatch.get(wParam)
+        if handler is not None:
+            handler(wParam, lParam)
+
+
+def _HostedInputProc(wParam, lParam, trigger):
+    """ Hosted hook procedure, called by the reader thread of the hook host with each event observed by the session.
+
+    The hook of the host has already gone through the dispatch table of the session, the event is only copied to its
+    ring buffer.
+    """
+    session = _active_session
+    if session is not None:
+        recorder = session.recorder
+        if recorder is not None:
+            recorder.push(wParam, lParam)
+        session.ring.push(wParam, lParam, trigger)
+
+
+# The sources of the mouse events, see `wingrab.inputs`
+register_input(HookInput(_LLMouseProc))
+register_input(RawInput(_RawInputProc))
+register_input(HostedInput(_HostedInputProc))
+
+
+class _SessionWorker:
+    """ The thread handling the mouse events of the sessions, started on first use and shared by all the sessions. """
+
+    def __init__(self):
+        self._sessions = SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
 
-def _msg_loop():
-    """ Start a message loop to grab the PID of the window under the cursor. """
-    hook = user32.SetWindowsHookExW(WH_MOUSE_LL, _LLMouseProc, None, 0)
-    msg = MSG()
+    def submit(self, session):
+        """ Run the worker loop of `session` once the previous sessions are done. """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='wingrab-worker', daemon=True)
+                self._thread.start()
+        self._sessions.put(session)
 
-    _patch_system_cursors()
+    def _run(self):
+        while True:
+            self._sessions.get()._run_worker()
 
-    while _result == 0:
-        bRet = user32.PeekMessageW(byref(msg), None, 0, 0, PM_REMOVE)
-        if not bRet:
-            continue
 
-        if msg.message == WM_QUIT:
-            break
+_worker = _SessionWorker()
 
-        user32.TranslateMessage(byref(msg))
-        user32.DispatchMessageW(byref(msg))
 
-    user32.UnhookWindowsHookEx(hook)
-    return _result
+class _HookSession:
+    """ A low-level mouse hook installed on the current thread, and the message loop pumping its events.
+
+    The mouse events observed by the `EventMask` of the session are copied by the hook procedure to `ring`, and
+    handled by `on_event()` (or `on_trigger()` for the release of the trigger button) on the worker thread.
+    The session runs until `result` is set to a non-zero value, either by `finish()` or by `stop()`. If `on_event()`
+    raises an error, the session is stopped and `run()` raises it.
+
+    The phases and the events of the session are measured into `metrics` when a sink is registered, see
+    `wingrab.metrics`.
+    """
+
+    # The kind of the session in its metrics
+    kind = 'hook'
+    # The events observed when no mask is given: all of them, nothing is swallowed
+    default_mask = EventMask(None, moves=True, wheel=True, buttons=True)
+
+    def __init__(self, *, patch_cursors=True, timeout=None, token=None, recorder=None, backend=None, mask=None,
+                 input_backend=None, debug=False):
+        # The backend of the session, the current backend by default
+        self.backend = backend if backend is not None else get_backend()
+        # The `wingrab.inputs.InputSource` of the mouse events
+        self.input = get_input(input_backend)
+        # Whether to print the mouse events
+        self.debug = debug
+        self.patch_cursors = patch_cursors
+        # The `CursorPatch` of the patched cursors, they are restored when the hook is removed
+        self.cursor_patch = None
+        self.timeout = timeout
+        self.token = token
+        # The `wingrab.recorder.EventRecorder` of the events seen by the hook, if any
+        self.recorder = recorder
+        self.result = 0
+        self.error = None
+        self.ring = EventRing()
+        self.mask = mask if mask is not None else self.default_mask
+        # The dispatch table of the hook procedure, message -> handler, see `EventMask.compile()`
+        self.dispatch = self.mask.compile(self.ring, self.backend, observe_all=debug)
+        # The `wingrab.metrics.SessionMetrics` of the session, `None` if no sink is registered
+        self.metrics = _metrics.start(self.kind)
+        # The handle returned by the input source, replaced when the hook is reinstalled
+        self._hook = None
+        self._watchdog = None
+        self._queue = None
+        self._is_worker_stopped = False
+        self._worker_done = threading.Event()
+
+    def on_event(self, wParam, info):
+        """ Handle an observed mouse event on the worker thread, `info` being a copy of its `MSLLHOOKSTRUCT`. """
+
+    def on_trigger(self, info):
+        """ Handle the release of the trigger button on the worker thread, see `on_event()`. """
+
+    def _handle_event(self, wParam, info, trigger):
+        if self.debug:
+            _print_mouse_msg(wParam, info)
+        metrics = self.metrics
+        if metrics is not None:
+            counters = metrics.counters
+            counters['events'] += 1
+            if wParam == WM_MOUSEMOVE:
+                counters['moves'] += 1
+            elif trigger:
+                counters['clicks'] += 1
+        if trigger:
+            self.on_trigger(info)
+        else:
+            self.on_event(wParam, info)
+
+    def _run_worker(self):
+        ring = self.ring
+        try:
+            while not self._is_worker_stopped:
+                ring.wait()
+                ring.drain(self._handle_event)
+            # Handle the events received before the hook was removed.
+            ring.drain(self._handle_event)
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self._worker_done.set()
+
+    def is_finished(self):
+        return self.result != 0
+
+    def _is_finished_watched(self):
+        self._watchdog.check()
+        return self.result != 0
+
+    def reinstall(self):
+        """ Remove the hook and install it again, e.g. once the system has removed it. Called on the session thread.
+        """
+        self.input.uninstall(self, self._hook)
+        self._hook = self.input.install(self)
+        if self.metrics is not None:
+            self.metrics.counters['reinstalls'] += 1
+
+    def set_mask(self, mask):
+        """ Change the events observed by the session, e.g. to arm its trigger. Can be called from any thread once the
+        session is started.
+        """
+        self.mask = mask
+        self.dispatch = mask.compile(self.ring, self.backend, observe_all=self.debug)
+        if self._hook is not None:
+            self.input.update(self, self._hook)
+
+    def finish(self, result):
+        """ Set the result of the session, which stops the message loop. Can be called from any thread. """
+        if self.result == 0:
+            self.result = result
+
+        # Wake up the message loop, which may be blocked waiting for messages in another thread.
+        queue = self._queue
+        if queue is not None:
+            queue.wake()
+
+    def stop(self):
+        """ Stop the session, can be called from any thread. """
+        self.finish(-1)
+
+    def fail(self, error):
+        """ Stop the session, `run()` raises `error` once the hook is removed. Can be called from any thread. """
+        if self.result == 0 and self.error is None:
+            self.error = error
+        self.stop()
+
+    def cancel(self):
+        """ Called when the cancellation token of the session is cancelled. """
+        self.fail(GrabCancelled('The grab has been cancelled.'))
+
+    def run(self):
+        """ Install the hook and pump the messages until the session is finished. """
+        global _active_session
+
+        metrics = self.metrics
+        started = stamp = perf_counter() if metrics is not None else 0.0
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        _worker.submit(self)
+
+        backend = self.backend
+        self._queue = queue = backend.create_message_queue()
+        _active_session = self
+        if self.token is not None:
+            self.token._register(self.cancel)
+        try:
+            self._hook = self.input.install(self)
+            if metrics is not None:
+                stamp = metrics.lap('hook_install', stamp)
+            try:
+                if self.patch_cursors:
+                    self.cursor_patch = _patch_system_cursors(backend)
+                    if metrics is not None:
+                        stamp = metrics.lap('cursor_patch', stamp)
+                is_finished = self.is_finished
+                if self.input.may_be_removed and hook_watchdog.enabled:
+                    self._watchdog = hook_watchdog
+                    hook_watchdog.start(self)
+                    is_finished = self._is_finished_watched
+                self.on_started()
+                if not run_message_loop(queue, is_finished, deadline=deadline):
+                    self.stop()  # WM_QUIT
+                elif not self.is_finished():
+                    self.on_timeout()
+            finally:
+                if metrics is not None:
+                    stamp = metrics.lap('wait', stamp)
+                self.input.uninstall(self, self._hook)
+                self._hook = None
+                if self._watchdog is not None:
+                    self._watchdog.stop()
+                    self._watchdog = None
+                if metrics is not None:
+                    stamp = metrics.lap('unhook', stamp)
+                if self.cursor_patch is not None:
+                    _restore_system_cursors(self.cursor_patch)
+                    self.cursor_patch = None
+                    if metrics is not None:
+                        metrics.lap('restore', stamp)
+                if self.debug:
+                    print("cleaning up......")
+        finally:
+            if self.token is not None:
+                self.token._unregister(self.cancel)
+            _active_session = None
+            self._queue = None
+            queue.close()
+
+            self._is_worker_stopped = True
+            self.ring.wake()
+            self._worker_done.wait()
+
+            if metrics is not None:
+                self._emit_metrics(metrics, started)
+
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _emit_metrics(self, metrics, started):
+        metrics.lap('total', started)
+        metrics.counters['dropped'] = self.ring.dropped
+        error = self.error
+        if error is None:
+            # A session ending without result has been interrupted by an error of the backend.
+            metrics.outcome = 'error' if self.result == 0 else 'stopped' if self.result == -1 else 'grabbed'
+        elif isinstance(error, TimeoutError):
+            metrics.outcome = 'timeout'
+        elif isinstance(error, GrabCancelled):
+            metrics.outcome = 'cancelled'
+        else:
+            metrics.outcome = 'error'
+        self.collect_metrics(metrics)
+        _metrics.emit(metrics)
+
+    def collect_metrics(self, metrics):
+        """ Called with the metrics of the session before they are handed to the sinks. """
+
+    def on_started(self):
+        """ Called once the hook is installed and the cursors are patched. """
+
+    def on_timeout(self):
+        """ Called when the timeout of the session expires. """
+        self.fail(TimeoutError(f'No window has been grabbed within {self.timeout} seconds.'))
+
+
+class _GrabSession(_HookSession):
+    """ Grab the PID of the window under the cursor when the trigger button (the left one by default) is released.
+
+    With `detail`, the `WindowInfo` of the window is gathered as well and kept in `info`.
+    """
+
+    kind = 'grab'
+    default_mask = EventMask()
+
+    def __init__(self, *, detail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.detail = detail
+        self.info = None
+
+    def on_trigger(self, info):
+        started = perf_counter()
+        if self.detail:
+            self.info = describe_window(self.backend, (info.pt.x, info.pt.y))
+            pid = self.info.pid
+        else:
+            pid = _get_pid_from_point(self.backend, info.pt)
+        if self.metrics is not None:
+            self.metrics.lap('resolve', started)
+        self.finish(pid)
+
+
+ClickTiming = collections.namedtuple('ClickTiming', ['timestamp', 'elapsed', 'resolve'])
+ClickTiming.__doc__ = """ The timing of a click of `grab_many`, in seconds.
+
+`timestamp` is the `time.monotonic()` of the click, `elapsed` the time since the previous click (or since the hook was
+installed for the first click), and `resolve` the time taken to look up the window.
+"""
+
+
+class GrabBatch(list):
+    """ The results of `grab_many`, with the `ClickTiming` of each result in `timings`. """
+
+    def __init__(self):
+        super().__init__()
+        self.timings = []
+
+
+class _BatchGrabSession(_GrabSession):
+    """ Grab the windows clicked until `count` windows are grabbed or `until(result)` returns True. """
+
+    kind = 'grab_many'
+
+    def __init__(self, *, count=None, until=None, **kwargs):
+        super().__init__(**kwargs)
+        self.count = count
+        self.until = until
+        self.results = GrabBatch()
+        self._last_click = time.monotonic()
+
+    def on_started(self):
+        self._last_click = time.monotonic()
+
+    def on_trigger(self, info):
+        if self.is_finished():
+            # The clicks handled after the end of the batch (e.g. drained once the hook is removed) are dropped.
+            return
+
+        clicked = time.monotonic()
+        if self.detail:
+            result = describe_window(self.backend, (info.pt.x, info.pt.y))
+            pid = result.pid
+        else:
+            result = pid = _get_pid_from_point(self.backend, info.pt)
+        if not pid:
+            # No window under the cursor, just like `grab` ignore the click.
+            return
+
+        resolve = time.monotonic() - clicked
+        if self.metrics is not None:
+            self.metrics.add_time('resolve', resolve)
+        self.results.append(result)
+        self.results.timings.append(ClickTiming(clicked, clicked - self._last_click, resolve))
+        self._last_click = clicked
+
+        if self.count is not None and len(self.results) >= self.count:
+            self.finish(len(self.results))
+        elif self.until is not None and self.until(result):
+            self.finish(len(self.results))
+
+    def on_timeout(self):
+        # The timeout ends the batch, the windows grabbed so far are returned.
+        self.stop()
+
+
+class _SharedGrabSession(_GrabSession):
+    """ The grab session serving a `RequestBatch` of the scheduler, on the dispatcher thread.
+
+    The requests may join the batch until the click, so whether the detail of the window is gathered is decided then.
+    """
+
+    def __init__(self, batch, **kwargs):
+        super().__init__(**kwargs)
+        self.batch = batch
+
+    def on_trigger(self, info):
+        if not self.is_finished():
+            self.detail = scheduler.close_batch(self.batch)
+        super().on_trigger(info)
+
+    def collect_metrics(self, metrics):
+        if self.batch.is_abandoned:
+            metrics.outcome = 'abandoned'
+
+
+def _run_batch(batch):
+    """ Serve the requests of `batch` with one click, see `Scheduler`. """
+    session = _SharedGrabSession(batch, mask=batch.mask, input_backend=batch.input_backend, debug=batch.debug)
+    if not scheduler.start_batch(batch, session):
+        return -1, None
+    if session.metrics is not None:
+        session.metrics.add_time('queue', perf_counter() - min(request.created for request in batch.requests))
+    session.run()
+    return session.result, session.info
+
+
+# The queue of the grabs, see `wingrab.scheduler`
+scheduler = Scheduler(_run_batch, acquire=lambda: process_lock.acquire(get_backend()), release=process_lock.release)
 
 
 # region The cleanup function
-def _cleanup_impl(*, _from_atexit=False):
-    """ Clean up any resources used by the program or manually clean up any leftover state from the 'wingrab' module.
+def _cleanup_impl(*, debug=False):
+    """ Manually clean up any leftover state from the 'wingrab' module.
+
+    The cursors are restored by the grab sessions themselves when they remove their hook, those left behind by a
+    crashed process are restored from the cursor journal.
     """
-    if _is_debug:
+    if debug:
         print("cleaning up......")
 
-    if _from_atexit and _is_cursor_changed:
-        # We only need to restore the cursor when **the cursor is changed in this process**.
-        # If the cursor is changed in another process (This process will raise an error), we do not need to restore it.
-        _restore_system_cursors()
+    if recover_cursors(get_backend(), cursor_journal) and debug:
+        print("restored the cursors of a crashed grab")
 
     if os.path.exists(lock_file_path):
+        # A lock file left behind by a crashed process using the `file` lock
         try:
             os.remove(lock_file_path)
         except PermissionError:
@@ -467,46 +626,153 @@ def _cleanup_impl(*, _from_atexit=False):
 
 
 def _quit():
-    # We just mark the result as -1 to jump out of the message loop.
-    # And the cleanup function will be called automatically.
-    global _result
-    _result = -1
+    # We just mark the result of the running session as -1 to jump out of the message loop,
+    # the session restores the cursors once its hook is removed.
+    # The grabs waiting for their turn are interrupted as well.
+    scheduler.interrupt()
+    session = _active_session
+    if session is not None:
+        session.stop()
 
 
-# Register cleanup function
-atexit.register(_quit)
-try:
-    def signal_handler(sig, frame):
-        _quit()
+def _signal_handler(sig, frame):
+    _quit()
 
 
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
-except ValueError:  # `signal` only works in the main thread.
-    raise ImportError(
-        'Please import wingrab in the main thread, even if you want to use it in another thread.'
-    ) from None
-# endregion
+def install_exit_handlers():
+    """ Register the handlers restoring the cursor when the program exits or is interrupted (SIGINT/SIGTERM).
 
+    `grab` calls this function itself, so calling it is only needed when all the grabs are made in sub threads:
+    signal handlers can only be installed from the main thread.
 
-# region The public API
-def grab(*, _debug=False):
-    with _global_wingrab_process_lock():
-        global _is_debug, _result
-        _is_debug = _debug
+    :return: True if the signal handlers are installed.
+    """
+    global _is_atexit_registered, _are_signal_handlers_installed
 
-        _result = 0
-        _msg_loop()
+    if not _is_atexit_registered:
+        atexit.register(_quit)
+        _is_atexit_registered = True
 
-        r = _result
-        return r
+    if not _are_signal_handlers_installed:
+        try:
+            signal.signal(signal.SIGTERM, _signal_handler)
+            signal.signal(signal.SIGINT, _signal_handler)
+        except ValueError:  # `signal` only works in the main thread, try again in the next call.
+            return False
+        _are_signal_handlers_installed = True
+    return True
+# endregion
 
 
-def cleanup(*, _debug=False):
-    global _is_debug
-    _is_debug = _debug
+# region The public API
+def grab(*, detail=False, timeout=None, token=None, record=None, priority=0, mask=None, input_backend=None,
+         _debug=False):
+    """ Wait for the user to click a window and return its PID.
+
+    Concurrent grabs do not fail: the grabs of the process waiting for the next click (with the same `mask`) share it,
+    see `wingrab.scheduler`, and the grabs of other processes are waited for.
+
+    :param detail: Return a `wingrab.procinfo.WindowInfo` (handles, class name, title, rectangle, executable of the
+        process...) instead of the PID.
+    :param timeout: The longest time (in seconds) to wait for the click, `None` for no limit. The time spent waiting
+        for the other grabs counts.
+    :param token: A `CancellationToken` which can be used to cancel the grab from another thread.
+    :param record: The path of a file to record the mouse events seen by the hook into, or an open
+        `wingrab.recorder.EventRecorder`, see `wingrab.recorder`. A recording grab does not share its click.
+    :param priority: The grabs with a higher priority are served first when several grabs are waiting.
+    :param mask: The button (and the modifier keys) of the click, a `wingrab.masks.EventMask` or a string such as
+        `'ctrl+right'`, the left button by default.
+    :param input_backend: The source of the mouse events, `'hook'` (the default), `'raw'` or `'host'`, see
+        `wingrab.inputs`. With `'raw'`, the clicked window receives the click as well. With `'host'`, the hook runs in
+        a child process, so a busy interpreter does not make the mouse lag.
+    :raises TimeoutError: If `timeout` expires before the click.
+    :raises GrabCancelled: If `token` is cancelled before the click.
+    """
+    mask = as_mask(mask)
+    input_backend = get_input(input_backend)
+    if record is not None:
+        session = _run_grab_session(_GrabSession, token=token, record=record, priority=priority, _debug=_debug,
+                                    detail=detail, timeout=timeout, mask=mask, input_backend=input_backend)
+        return session.info if detail else session.result
+
+    if token is not None and token.cancelled:
+        raise GrabCancelled('The grab has been cancelled.')
+    install_exit_handlers()
+
+    request = scheduler.submit(GrabRequest(detail=detail, priority=priority, mask=mask, input_backend=input_backend,
+                                           debug=_debug))
+    if token is not None:
+        token._register(request.cancel)
+    try:
+        if not request.wait(timeout):
+            request.cancel(TimeoutError(f'No window has been grabbed within {timeout} seconds.'))
+    finally:
+        if token is not None:
+            token._unregister(request.cancel)
+
+    if request.error is not None:
+        raise request.error
+    return request.result
+
+
+def grab_many(n=None, *, until=None, detail=False, timeout=None, token=None, record=None, priority=0, mask=None,
+              input_backend=None, _debug=False):
+    """ Wait for the user to click several windows in a row, keeping the hook and the grab cursor in place.
+
+    The grab ends when `n` windows are grabbed, when `until` returns True, when `timeout` expires or when the program
+    is interrupted, and returns the windows grabbed so far.
+
+    :param n: The number of windows to grab, `None` for no limit.
+    :param until: A callable receiving each result, which ends the grab (that result included) by returning True.
+    :param detail: Grab `wingrab.procinfo.WindowInfo` instead of PIDs, see `grab`.
+    :param timeout: The longest time (in seconds) to wait for all the clicks, `None` for no limit.
+    :param token: A `CancellationToken` which can be used to cancel the grab from another thread.
+    :param record: See `grab`.
+    :param priority: See `grab`.
+    :param mask: See `grab`.
+    :param input_backend: See `grab`.
+    :return: A `GrabBatch`: the list of the PIDs (or `WindowInfo`) in the order of the clicks, whose `timings` attribute
+        holds the `ClickTiming` of each click.
+    :raises TimeoutError: If `timeout` expires while waiting for the other grabs to finish.
+    :raises GrabCancelled: If `token` is cancelled, the windows grabbed so far are lost.
+    """
+    if n is not None and n <= 0:
+        raise ValueError('n must be a positive number')
+
+    session = _run_grab_session(_BatchGrabSession, token=token, record=record, priority=priority, _debug=_debug,
+                                count=n, until=until, detail=detail, timeout=timeout, mask=as_mask(mask),
+                                input_backend=input_backend)
+    return session.results
+
+
+def _run_grab_session(session_class, *, token, record, priority, _debug, timeout, **kwargs):
+    """ Wait for an exclusive turn and run a grab session, return it once it is finished. """
+    if token is not None and token.cancelled:
+        raise GrabCancelled('The grab has been cancelled.')
+    install_exit_handlers()
+
+    queued = perf_counter()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _global_wingrab_process_lock(priority=priority, timeout=timeout, token=token):
+        queued = perf_counter() - queued
+        recorder = record
+        if isinstance(record, (str, bytes, os.PathLike)):
+            recorder = EventRecorder(record)
+        try:
+            session = session_class(token=token, recorder=recorder, debug=_debug, **kwargs)
+            if session.metrics is not None:
+                session.metrics.add_time('queue', queued)
+            # The time spent waiting for the turn counts in the timeout.
+            session.timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            session.run()
+        finally:
+            if recorder is not None and recorder is not record:
+                recorder.close()
+        return session
 
-    _cleanup_impl()
+
+def cleanup(*, _debug=False):
+    _cleanup_impl(debug=_debug)
 # endregion
 
 
@@ -0,0 +1,216 @@
+# -*- encoding:utf-8 -*-
+
+"""
+Constants and structures of the Windows user interface API used by WinGrab.
+
+This module only depends on `ctypes.wintypes`, so it can be imported on any platform.
+"""
+from ctypes import POINTER, Structure, Union
+from ctypes.wintypes import WPARAM, LPARAM, HANDLE, DWORD, POINT, USHORT, ULONG, LONG, HWND
+
+HC_ACTION = 0
+WH_MOUSE_LL = 14
+
+WM_NULL = 0x0000
+WM_QUIT = 0x0012
+WM_INPUT = 0x00FF
+WM_MOUSEMOVE = 0x0200
+WM_LBUTTONDOWN = 0x0201
+WM_LBUTTONUP = 0x0202
+WM_RBUTTONDOWN = 0x0204
+WM_RBUTTONUP = 0x0205
+WM_MBUTTONDOWN = 0x0207
+WM_MBUTTONUP = 0x0208
+WM_MOUSEWHEEL = 0x020A
+WM_XBUTTONDOWN = 0x020B
+WM_XBUTTONUP = 0x020C
+WM_MOUSEHWHEEL = 0x020E
+
+# The high-order word of the `mouseData` of the WM_XBUTTON* messages
+XBUTTON1 = 0x0001
+XBUTTON2 = 0x0002
+
+WM_TO_TEXT = {
+    WM_MOUSEMOVE: 'WM_MOUSEMOVE',
+    WM_LBUTTONDOWN: 'WM_LBUTTONDOWN',
+    WM_LBUTTONUP: 'WM_LBUTTONUP',
+    WM_RBUTTONDOWN: 'WM_RBUTTONDOWN',
+    WM_RBUTTONUP: 'WM_RBUTTONUP',
+    WM_MBUTTONDOWN: 'WM_MBUTTONDOWN',
+    WM_MBUTTONUP: 'WM_MBUTTONUP',
+    WM_MOUSEWHEEL: 'WM_MOUSEWHEEL',
+    WM_XBUTTONDOWN: 'WM_XBUTTONDOWN',
+    WM_XBUTTONUP: 'WM_XBUTTONUP',
+    WM_MOUSEHWHEEL: 'WM_MOUSEHWHEEL'
+}
+
+# Virtual-key codes of the modifier keys
+# https://learn.microsoft.com/en-us/windows/win32/inputdev/virtual-key-codes
+VK_SHIFT = 0x10
+VK_CONTROL = 0x11
+VK_MENU = 0x12
+VK_LWIN = 0x5B
+VK_RWIN = 0x5C
+
+IMAGE_CURSOR = 2
+LR_SHARED = 0x00008000
+LR_COPYFROMRESOURCE = 0x00004000
+
+SPI_SETCURSORS = 0x0057
+
+ULONG_PTR = WPARAM
+LRESULT = LPARAM
+HCURSOR = HANDLE
+
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-peekmessagew
+PM_NOREMOVE = 0x0000
+PM_REMOVE = 0x0001
+PM_NOYIELD = 0x0002
+
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-msgwaitformultipleobjectsex
+QS_ALLINPUT = 0x04FF
+MWMO_INPUTAVAILABLE = 0x0004
+INFINITE = 0xFFFFFFFF
+WAIT_OBJECT_0 = 0x00000000
+WAIT_ABANDONED = 0x00000080
+WAIT_TIMEOUT = 0x00000102
+WAIT_FAILED = 0xFFFFFFFF
+
+# Raw input
+# https://learn.microsoft.com/en-us/windows/win32/inputdev/raw-input
+HID_USAGE_PAGE_GENERIC = 0x01
+HID_USAGE_GENERIC_MOUSE = 0x02
+RIDEV_REMOVE = 0x00000001
+RIDEV_INPUTSINK = 0x00000100
+RID_INPUT = 0x10000003
+RIM_TYPEMOUSE = 0
+MOUSE_MOVE_ABSOLUTE = 0x01
+RI_MOUSE_LEFT_BUTTON_DOWN = 0x0001
+RI_MOUSE_LEFT_BUTTON_UP = 0x0002
+RI_MOUSE_RIGHT_BUTTON_DOWN = 0x0004
+RI_MOUSE_RIGHT_BUTTON_UP = 0x0008
+RI_MOUSE_MIDDLE_BUTTON_DOWN = 0x0010
+RI_MOUSE_MIDDLE_BUTTON_UP = 0x0020
+RI_MOUSE_BUTTON_4_DOWN = 0x0040
+RI_MOUSE_BUTTON_4_UP = 0x0080
+RI_MOUSE_BUTTON_5_DOWN = 0x0100
+RI_MOUSE_BUTTON_5_UP = 0x0200
+RI_MOUSE_WHEEL = 0x0400
+RI_MOUSE_HWHEEL = 0x0800
+# The parent of the message-only windows
+HWND_MESSAGE = -3
+
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getancestor
+GA_ROOT = 2
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindow
+GW_OWNER = 4
+
+# https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowlongw
+GWL_EXSTYLE = -20
+WS_EX_TRANSPARENT = 0x00000020
+
+# https://learn.microsoft.com/en-us/windows/win32/winauto/event-constants
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_SYSTEM_MINIMIZESTART = 0x0016
+EVENT_SYSTEM_MINIMIZEEND = 0x0017
+EVENT_OBJECT_CREATE = 0x8000
+EVENT_OBJECT_DESTROY = 0x8001
+EVENT_OBJECT_SHOW = 0x8002
+EVENT_OBJECT_HIDE = 0x8003
+EVENT_OBJECT_LOCATIONCHANGE = 0x800B
+WINEVENT_OUTOFCONTEXT = 0x0000
+OBJID_WINDOW = 0
+CHILDID_SELF = 0
+
+# https://learn.microsoft.com/en-us/windows/win32/api/dwmapi/ne-dwmapi-dwmwindowattribute
+DWMWA_CLOAKED = 14
+
+# https://learn.microsoft.com/en-us/windows/win32/procthread/process-security-and-access-rights
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+MAX_PATH = 260
+
+# Standard cursor identifiers
+# https://learn.microsoft.com/en-us/windows/win32/menurc/about-cursors
+IDC_ARROW = 32512
+IDC_IBEAM = 32513
+IDC_WAIT = 32514
+IDC_CROSS = 32515
+IDC_UPARROW = 32516
+IDC_SIZENWSE = 32642
+IDC_SIZENESW = 32643
+IDC_SIZEWE = 32644
+IDC_SIZENS = 32645
+IDC_SIZEALL = 32646
+IDC_NO = 32648
+IDC_HAND = 32649
+IDC_APPSTARTING = 32650
+
+# The names of the standard cursors in the cursor scheme of the user, under HKEY_CURRENT_USER\Control Panel\Cursors
+# https://learn.microsoft.com/en-us/windows/win32/menurc/about-cursors
+CURSOR_SCHEME_NAMES = {
+    IDC_ARROW: 'Arrow',
+    IDC_IBEAM: 'IBeam',
+    IDC_WAIT: 'Wait',
+    IDC_CROSS: 'Crosshair',
+    IDC_UPARROW: 'UpArrow',
+    IDC_SIZENWSE: 'SizeNWSE',
+    IDC_SIZENESW: 'SizeNESW',
+    IDC_SIZEWE: 'SizeWE',
+    IDC_SIZENS: 'SizeNS',
+    IDC_SIZEALL: 'SizeAll',
+    IDC_NO: 'No',
+    IDC_HAND: 'Hand',
+    IDC_APPSTARTING: 'AppStarting',
+}
+
+
+class MSLLHOOKSTRUCT(Structure):
+    _fields_ = (('pt', POINT),
+                ('mouseData', DWORD),
+                ('flags', DWORD),
+                ('time', DWORD),
+                ('dwExtraInfo', ULONG_PTR))
+
+
+LPMSLLHOOKSTRUCT = POINTER(MSLLHOOKSTRUCT)
+
+
+class RAWINPUTDEVICE(Structure):
+    _fields_ = (('usUsagePage', USHORT),
+                ('usUsage', USHORT),
+                ('dwFlags', DWORD),
+                ('hwndTarget', HWND))
+
+
+class RAWINPUTHEADER(Structure):
+    _fields_ = (('dwType', DWORD),
+                ('dwSize', DWORD),
+                ('hDevice', HANDLE),
+                ('wParam', WPARAM))
+
+
+class _RAWMOUSEBUTTONS(Structure):
+    _fields_ = (('usButtonFlags', USHORT),
+                ('usButtonData', USHORT))
+
+
+class _RAWMOUSEUNION(Union):
+    _anonymous_ = ('buttons',)
+    _fields_ = (('ulButtons', ULONG),
+                ('buttons', _RAWMOUSEBUTTONS))
+
+
+class RAWMOUSE(Structure):
+    _anonymous_ = ('u',)
+    _fields_ = (('usFlags', USHORT),
+                ('u', _RAWMOUSEUNION),
+                ('ulRawButtons', ULONG),
+                ('lLastX', LONG),
+                ('lLastY', LONG),
+                ('ulExtraInformation', ULONG))
+
+
+class RAWINPUT(Structure):
+    # Only the mouse is registered, the keyboard and HID variants of the data are left out.
+    _fields_ = (('header', RAWINPUTHEADER),
+                ('mouse', RAWMOUSE))